@@ -4,6 +4,8 @@ import sqlite3 from 'sqlite3';
 import {promisify} from 'util';
 
 const db = new sqlite3.Database("cache.db");
+// Wait out the indexer's commits instead of failing with SQLITE_BUSY.
+db.configure("busyTimeout", 5000);
 
 const aDbAll = promisify(db.all).bind(db);
 const asAnyArr = (x: any) => (x as any[]);
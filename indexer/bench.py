@@ -0,0 +1,255 @@
+"""
+Indexing throughput benchmark.
+
+Generates a synthetic media library, indexes it with `Indexerdem.readdir` in a
+fresh process and reports files/sec, name matches/sec, the size of the
+resulting index and peak RSS. Libraries are generated from a fixed seed so
+runs at the same scale are comparable across commits:
+
+    python -m indexer.bench --scales 10000,100000 --json results.json
+    python -m indexer.bench --scales 10000,100000 --compare results.json
+"""
+from .indexerdem import Indexerdem
+from .lexicon import load_lexicon
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from multiprocessing import get_context
+from typing import Any, Dict, List, Optional, Sequence
+
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+
+# Directories in the generated library hold at most this many files.
+FILES_PER_DIRECTORY = 250
+
+TITLE_WORDS = (
+    "the", "a", "of", "night", "day", "return", "city", "blue", "red", "last",
+    "summer", "winter", "story", "love", "dark", "house", "road", "island",
+    "interview", "behind", "scenes", "live", "concert", "episode", "special",
+)
+TAGS = ("1080p", "720p", "2160p", "x264", "x265", "HDTV", "WEB-DL", "BluRay", "REPACK", "AAC")
+SEPARATORS = (" ", ".", "_", " - ")
+NAME_LIST_SEPARATORS = (", ", " and ", " & ", " ft. ")
+# Files that `readdir` is expected to skip.
+OTHER_EXTENSIONS = ("nfo", "txt", "jpg", "srt")
+
+@dataclass
+class BenchmarkResult:
+    files: int
+    seconds: float
+    files_per_second: float
+    name_matches: int
+    name_matches_per_second: float
+    persons: int
+    db_bytes: int
+    peak_rss_kb: int
+    peak_worker_rss_kb: int
+
+class LibraryGenerator(object):
+    """
+    Deterministic generator of media filenames built from the name lexicon
+    the indexer itself uses.
+    """
+
+    def __init__(self, seed: int = 0, locales: Sequence[str] = Indexerdem.DEFAULT_LOCALES):
+        self.random = random.Random(seed)
+        lexicon = load_lexicon(locales)
+        self.first_names = sorted(lexicon.first_names)
+        self.last_names = sorted(lexicon.last_names)
+
+    def __name(self) -> str:
+        parts = [self.random.choice(self.first_names)]
+        roll = self.random.random()
+        if roll < 0.1:
+            parts.append(self.random.choice(self.first_names))
+        if roll < 0.85:
+            parts.append(self.random.choice(self.last_names))
+        return " ".join(parts)
+
+    def filename(self) -> str:
+        words = self.random.sample(TITLE_WORDS, self.random.randint(1, 4))
+        names = [self.__name() for _ in range(self.random.choice((0, 1, 1, 1, 2, 2, 3)))]
+        if names:
+            cast = self.random.choice(NAME_LIST_SEPARATORS).join(names)
+            words.insert(self.random.randint(0, len(words)), cast)
+        if self.random.random() < 0.6:
+            words.append(str(self.random.randint(1970, 2025)))
+        if self.random.random() < 0.5:
+            words.append(self.random.choice(TAGS))
+        separator = self.random.choice(SEPARATORS)
+        stem = separator.join(words)
+        if self.random.random() < 0.05:
+            extension = self.random.choice(OTHER_EXTENSIONS)
+        else:
+            extension = self.random.choice(Indexerdem.DEFAULT_EXTENSIONS)
+        return f"{stem}.{extension}"
+
+    def generate(self, root: str, count: int) -> int:
+        """
+        Create `count` empty files under `root`, spread over nested
+        directories. Returns how many of them have a media extension.
+
+        Filenames are unique across the whole library since the index treats
+        a filename seen in two places as the same file.
+        """
+        media = 0
+        directory = root
+        taken: set = set()
+        for i in range(count):
+            if i % FILES_PER_DIRECTORY == 0:
+                group = i // FILES_PER_DIRECTORY
+                directory = os.path.join(root, f"shelf-{group // 100:03d}", f"box-{group % 100:02d}")
+                os.makedirs(directory, exist_ok=True)
+            filename = self.filename()
+            while filename in taken:
+                filename = f"{i} {filename}"
+            taken.add(filename)
+            with open(os.path.join(directory, filename), "wb"):
+                pass
+            if filename.rsplit(".", 1)[-1] in Indexerdem.DEFAULT_EXTENSIONS:
+                media += 1
+        return media
+
+def default_scratch_dir() -> str:
+    # Keep the filesystem out of the measurement where possible.
+    return "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+def _run_readdir(library: str, db_path: str, options: Dict[str, Any]) -> BenchmarkResult:
+    """
+    Runs in a process of its own so that peak RSS is that of the run alone.
+    """
+    from . import indexerdem
+    indexerdem.logger.setLevel(logging.WARNING)
+
+    indexer = Indexerdem(db_path)
+    indexer.init()
+    start = time.perf_counter()
+    indexer.readdir(library, **options)
+    seconds = time.perf_counter() - start
+
+    conn = sqlite3.connect(db_path)
+    files = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+    name_matches = conn.execute("SELECT COUNT(*) FROM participation").fetchone()[0]
+    persons = conn.execute("SELECT COUNT(*) FROM persons").fetchone()[0]
+    conn.close()
+    db_bytes = sum(
+        os.path.getsize(path)
+        for path in (db_path, f"{db_path}-wal", f"{db_path}-journal")
+        if os.path.exists(path)
+    )
+    return BenchmarkResult(
+        files=files,
+        seconds=seconds,
+        files_per_second=files / seconds if seconds else 0.0,
+        name_matches=name_matches,
+        name_matches_per_second=name_matches / seconds if seconds else 0.0,
+        persons=persons,
+        db_bytes=db_bytes,
+        peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        peak_worker_rss_kb=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+def run_benchmark(library: str, db_path: str, **options: Any) -> BenchmarkResult:
+    """
+    Index `library` into a new index at `db_path` in a fresh process. Any
+    keyword arguments are passed on to `readdir`.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(_run_readdir, library, db_path, options).result()
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_table(rows: List[Dict[str, Any]], baseline: Optional[Dict[int, Dict[str, Any]]] = None) -> str:
+    header = f"{'scale':>9} {'files/s':>10} {'matches/s':>10} {'seconds':>9} {'db MiB':>8} {'rss MiB':>8}"
+    if baseline:
+        header += f" {'vs base':>8}"
+    lines = [header]
+    for row in rows:
+        line = (
+            f"{row['scale']:>9} {row['files_per_second']:>10.0f} {row['name_matches_per_second']:>10.0f} "
+            f"{row['seconds']:>9.2f} {row['db_bytes'] / 2**20:>8.1f} {row['peak_rss_kb'] / 1024:>8.1f}"
+        )
+        if baseline:
+            base = baseline.get(row["scale"])
+            if base is not None and base["files_per_second"]:
+                change = row["files_per_second"] / base["files_per_second"] - 1
+                line += f" {change:>+8.1%}"
+            else:
+                line += f" {'-':>8}"
+        lines.append(line)
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="indexing throughput benchmark for erdem.")
+    parser.add_argument(
+        "--scales", "-s", type=str, default="10000",
+        help="Comma-separated library sizes to benchmark, e.g. 10000,100000,1000000."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated libraries.")
+    parser.add_argument(
+        "--scratch-dir", type=str, default=None,
+        help="Where to generate libraries and indices. Defaults to /dev/shm when available."
+    )
+    parser.add_argument("--keep", action="store_true", help="Keep generated libraries around for later runs.")
+    parser.add_argument("--batch-size", "-b", type=int, default=500, help="Passed on to readdir.")
+    parser.add_argument("--workers", "-w", type=int, default=0, help="Passed on to readdir.")
+    parser.add_argument("--json", type=str, default=None, help="Also write the results to this file.")
+    parser.add_argument("--compare", type=str, default=None, help="Results file from an earlier run to compare against.")
+    args = parser.parse_args()
+
+    scratch = args.scratch_dir or default_scratch_dir()
+    rows: List[Dict[str, Any]] = []
+    for scale in (int(s) for s in args.scales.split(",")):
+        library = os.path.join(scratch, f"erdem-bench-{scale}-{args.seed}")
+        if not os.path.isdir(library):
+            print(f"Generating {scale} files under {library}...")
+            LibraryGenerator(args.seed).generate(library, scale)
+        db_path = os.path.join(scratch, f"erdem-bench-{scale}-{args.seed}.db")
+        if os.path.exists(db_path):
+            os.unlink(db_path)
+
+        result = run_benchmark(library, db_path, batch_size=args.batch_size, workers=args.workers)
+        rows.append({"scale": scale, **asdict(result)})
+        os.unlink(db_path)
+        if not args.keep:
+            shutil.rmtree(library)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as compare_file:
+            baseline = {row["scale"]: row for row in json.load(compare_file)["results"]}
+    print(format_table(rows, baseline))
+
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(
+                {
+                    "revision": git_revision(),
+                    "python": platform.python_version(),
+                    "seed": args.seed,
+                    "batch_size": args.batch_size,
+                    "workers": args.workers,
+                    "results": rows,
+                },
+                json_file,
+                indent=2
+            )
@@ -0,0 +1,99 @@
+"""
+An identity map of records, per connection.
+
+With a `RecordCache` attached to its connection (see `IndexReader`'s
+`cache_size`), fetching a record by id returns the very same instance as the
+last fetch did, without a query, for as long as the record stays among the
+`capacity` most recently used. Saving, deleting or inserting a record through
+the connection drops it from the cache, and a commit by any other connection
+or process to the index empties the cache on the next lookup.
+
+Writes through the same connection that bypass the records, such as a plain
+`UPDATE`, aren't noticed; `clear` the cache after those.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Optional, Tuple
+
+import threading
+
+DEFAULT_CAPACITY = 1024
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __add__(self, other: "CacheStats") -> "CacheStats":
+        return CacheStats(
+            self.hits + other.hits,
+            self.misses + other.misses,
+            self.evictions + other.evictions,
+            self.invalidations + other.invalidations,
+        )
+
+class RecordCache(object):
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        if capacity <= 0:
+            raise ValueError(f"capacity should be positive. Given: {capacity}")
+        self.capacity = capacity
+        self.stats = CacheStats()
+        self.__records: OrderedDict[Tuple[type, Hashable], Any] = OrderedDict()
+        self.__data_version: Optional[int] = None
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__records)
+
+    def __check_data_version(self, cursor) -> None:
+        # Changes whenever another connection commits to the index.
+        data_version = cursor.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.__data_version:
+            self.__records.clear()
+            self.__data_version = data_version
+
+    def get(self, cursor, kind: type, id: Hashable) -> Optional[Any]:
+        """
+        The cached record of type `kind` with `id`, if any. `cursor` should be
+        on the connection this cache belongs to.
+        """
+        with self.__lock:
+            self.__check_data_version(cursor)
+            record = self.__records.get((kind, id))
+            if record is None:
+                self.stats.misses += 1
+                return None
+            self.__records.move_to_end((kind, id))
+            self.stats.hits += 1
+            return record
+
+    def put(self, kind: type, id: Hashable, record: Any) -> None:
+        with self.__lock:
+            self.__records[(kind, id)] = record
+            self.__records.move_to_end((kind, id))
+            while len(self.__records) > self.capacity:
+                self.__records.popitem(last=False)
+                self.stats.evictions += 1
+
+    def invalidate(self, kind: type, id: Hashable) -> None:
+        with self.__lock:
+            if self.__records.pop((kind, id), None) is not None:
+                self.stats.invalidations += 1
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__records.clear()
+
+def record_cache(cursor) -> Optional[RecordCache]:
+    """
+    The cache attached to the connection of `cursor`, if any.
+    """
+    return getattr(cursor.connection, "record_cache", None)
@@ -1,9 +1,14 @@
+from .cache import record_cache
 from .errors import ConstructorPreferred, InvalidDataClassState
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, fields
+from dataclasses import dataclass, field, fields
 from enum import StrEnum
-from typing import Any, cast, Iterable, Optional, List, Set, Tuple, Union
+from functools import cache
+from typing import Any, Callable, cast, Dict, Iterable, Iterator, Optional, List, Sequence, Set, Tuple, Union
+
+# Stay well under SQLITE_MAX_VARIABLE_NUMBER for `IN (...)` queries.
+SQLITE_MAX_PARAMS = 500
 
 class NameDecisionRule(StrEnum):
     ALMOST_CERTAIN = "almost-certain"
@@ -11,11 +16,53 @@ class NameDecisionRule(StrEnum):
     LASTNAME_BACKWARD = "lastname-backward"
     MANUAL_INPUT = "manual-input"
 
+# Looking a member up by value through the enum is slow enough to show when
+# loading a whole library.
+_NAME_DECISION_RULES = {str(rule): rule for rule in NameDecisionRule}
+
 NameTuple = Tuple[str, Optional[str], NameDecisionRule]
 
-@dataclass
-class SQLiteDataClass(ABC):
+RowFactory = Callable[[Any, tuple[Any, ...]], Any]
+
+class Hydratable(object):
+    """
+    Anything built straight from query results, in bulk.
+    """
+    __slots__ = ()
+
+    # The columns selected for an instance, in the order `row_factory` expects.
+    COLUMNS = ""
+
+    @classmethod
+    def row_factory(cls, cursor, row: tuple[Any, ...]) -> Any:
+        """
+        Build an instance from a row of `COLUMNS`. Usable as the `row_factory`
+        of a cursor.
+        """
+        return cls(*row)
+
+    @classmethod
+    def hydrate(
+        cls, cursor, query: str, params: Iterable[Any] = (), row_factory: Optional[RowFactory] = None
+    ) -> Iterator[Any]:
+        """
+        Run `query`, which should select `COLUMNS`, and iterate over what it
+        finds. Instances are built as SQLite steps through the rows, on a
+        cursor of their own, instead of fetching every row first. Rows go
+        through `row_factory` instead of the class's own if given.
+        """
+        records = cursor.connection.cursor()
+        records.row_factory = row_factory if row_factory is not None else cls.row_factory
+        return records.execute(query, tuple(params))
+
+@dataclass(slots=True)
+class SQLiteDataClass(Hydratable, ABC):
+    """
+    Records are slotted: a library's worth of them is held in memory at once.
+    Their statements are built once per class, right after it is defined.
+    """
 
+    FETCH_QUERY = ""
     UPDATE_QUERY = ""
     DELETE_QUERY = ""
 
@@ -30,6 +77,18 @@ class SQLiteDataClass(ABC):
         """
         pass
 
+    @classmethod
+    def fetch_many(cls, cursor, ids: Iterable[Any]) -> tuple["SQLiteDataClass", ...]:
+        """
+        Fetch the records for all of `ids`, in the order given. Ids with no
+        record are skipped.
+
+        This falls back to a `fetch` per id; subclasses backed by a table
+        should fetch in bulk instead.
+        """
+        records = (cls.fetch(cursor, id) for id in ids)
+        return tuple(record for record in records if record is not None)
+
     @staticmethod
     @abstractmethod
     def from_sqlite_record(record: tuple[Any, ...]) -> "SQLiteDataClass":
@@ -42,7 +101,7 @@ class SQLiteDataClass(ABC):
         constructor, throw a `ConstructorPreferred` error.
         """
         pass
-    
+
     @abstractmethod
     def insert(self, cursor, extra_args: Optional[Any] = None) -> Optional[int]:
         """
@@ -67,6 +126,7 @@ class SQLiteDataClass(ABC):
     def save(self, cursor) -> bool:
         try:
             cursor.execute(type(self).UPDATE_QUERY, self.create_update_tuple())
+            self._uncache(cursor)
             return True
         except:
             return False
@@ -74,15 +134,27 @@ class SQLiteDataClass(ABC):
     def delete(self, cursor) -> bool:
         try:
             cursor.execute(type(self).DELETE_QUERY, self.create_delete_tuple())
+            self._uncache(cursor)
             return True
         except:
             return False
 
+    def _uncache(self, cursor) -> None:
+        """
+        Drop this record from the record cache of the connection, if any.
+        """
+        cache = record_cache(cursor)
+        if cache is not None and (id := getattr(self, "id", None)) is not None:
+            cache.invalidate(type(self), id)
+
 
-def starfields(cls) -> str:
+@cache
+def starfields(cls, table: Optional[str] = None) -> str:
     """
-    Return a comma-separated string listing all the fields of this class.
-    The order output is consistent with, for example, `from_sqlite_record`.
+    Return a comma-separated string listing all the fields of this class,
+    qualified with `table` if given. Fields left out of the constructor are
+    not columns and are skipped. The order output is consistent with, for
+    example, `from_sqlite_record`.
 
     NOTE: This assumes that the `dataclasses.fields` function returns the
     declaration order of the fields. The closest guarantee we have is the
@@ -92,11 +164,32 @@ def starfields(cls) -> str:
     > in which they appear in the class definition.
 
     But the thing is, `fields` is not a generated method!
+
+    The result is cached per class and table.
     """
-    return ",".join([f.name for f in fields(cls)])
+    if table is not None:
+        return ",".join([f"{table}.{f.name}" for f in fields(cls) if f.init])
+    return ",".join([f.name for f in fields(cls) if f.init])
 
+def chunked(items: Sequence[Any], size: int = SQLITE_MAX_PARAMS) -> Iterator[Sequence[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def rows_by_key(cursor, query: str, keys: Iterable[Any]) -> Dict[Any, List[tuple[Any, ...]]]:
+    """
+    Run `query` for all of `keys` and group the resulting rows by their first
+    column. `query` should select that key first and leave a `{}` where the
+    parameter list of an `IN` goes; it is run once per `SQLITE_MAX_PARAMS`
+    keys.
+    """
+    grouped: Dict[Any, List[tuple[Any, ...]]] = {}
+    for chunk in chunked(list(dict.fromkeys(keys))):
+        for row in cursor.execute(query.format(",".join("?" * len(chunk))), chunk):
+            grouped.setdefault(row[0], []).append(row)
+    return grouped
 
-@dataclass
+
+@dataclass(slots=True)
 class MetadataRecord(SQLiteDataClass):
     key: str
     val: str
@@ -115,10 +208,15 @@ class MetadataRecord(SQLiteDataClass):
 
     @staticmethod
     def fetch(cursor, id: str) -> Optional["MetadataRecord"]:
-        query = "SELECT key, val FROM __metadata WHERE key=? LIMIT 1"
-        result = cursor.execute(query, (id,)).fetchone()
+        result = cursor.execute(MetadataRecord.FETCH_QUERY, (id,)).fetchone()
         return MetadataRecord(*result) if result is not None else None
 
+    @classmethod
+    def fetch_many(cls, cursor, ids: Iterable[str]) -> tuple["MetadataRecord", ...]:
+        ids = tuple(ids)
+        rows = rows_by_key(cursor, f"SELECT {MetadataRecord.COLUMNS} FROM __metadata WHERE key IN ({{}})", ids)
+        return tuple(MetadataRecord(*rows[id][0]) for id in ids if id in rows)
+
     @staticmethod
     def from_sqlite_record(record: tuple[Any, ...]) -> "MetadataRecord":
         raise ConstructorPreferred()
@@ -143,13 +241,23 @@ class MetadataRecord(SQLiteDataClass):
     def create_delete_tuple(self) -> tuple[Any, ...]:
         return (self.key,)
 
-@dataclass
+MetadataRecord.COLUMNS = starfields(MetadataRecord)
+MetadataRecord.FETCH_QUERY = f"SELECT {MetadataRecord.COLUMNS} FROM __metadata WHERE key=? LIMIT 1"
+
+@dataclass(slots=True)
 class FileIndexRecord(SQLiteDataClass):
     id: Optional[int]
     filename: str
     fullpath: str
     review: Optional[str]
     rating: int = 0
+    # Set on records fetched without their review; see `without_review`.
+    _review_loader: Optional[Callable[[int], Optional[str]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    # Everything but the review, in the order `without_review` expects.
+    LISTING_COLUMNS = ""
 
     def __post_init__(self):
         if self.rating is None:
@@ -160,20 +268,71 @@ class FileIndexRecord(SQLiteDataClass):
 
     @staticmethod
     def fetch(cursor, id) -> Optional["FileIndexRecord"]:
-        query = f"SELECT {starfields(FileIndexRecord)} FROM files WHERE id=? LIMIT 1"
-        result = cursor.execute(query, (id,)).fetchone()
-        return FileIndexRecord(*result) if result is not None else None
+        cache = record_cache(cursor)
+        if cache is not None and (cached := cache.get(cursor, FileIndexRecord, id)) is not None:
+            return cached
+        result = cursor.execute(FileIndexRecord.FETCH_QUERY, (id,)).fetchone()
+        if result is None:
+            return None
+        record = FileIndexRecord(*result)
+        if cache is not None:
+            cache.put(FileIndexRecord, id, record)
+        return record
+
+    @classmethod
+    def fetch_many(cls, cursor, ids: Iterable[int]) -> tuple["FileIndexRecord", ...]:
+        ids = tuple(ids)
+        rows = rows_by_key(cursor, f"SELECT {FileIndexRecord.COLUMNS} FROM files WHERE id IN ({{}})", ids)
+        return tuple(FileIndexRecord(*rows[id][0]) for id in ids if id in rows)
 
     @staticmethod
     def from_sqlite_record(record: tuple[Any, ...]) -> "FileIndexRecord":
         raise ConstructorPreferred()
 
+    @staticmethod
+    def without_review(
+        record: tuple[int, str, str, int], review_loader: Callable[[int], Optional[str]]
+    ) -> "FileIndexRecord":
+        """
+        Build a record from a row of `LISTING_COLUMNS`. Reviews can run to
+        several KB each, so the review is only loaded, with
+        `review_loader(id)`, once it is first read.
+        """
+        self = object.__new__(FileIndexRecord)
+        self.id, self.filename, self.fullpath, rating = record
+        self.rating = rating if rating is not None else 0
+        self._review_loader = review_loader
+        return self
+
+    @staticmethod
+    def review_loader(cursor) -> Callable[[int], Optional[str]]:
+        """
+        A `review_loader` for `without_review` that reads through the
+        connection of `cursor`, with a cursor of its own.
+        """
+        connection = cursor.connection
+
+        def load(id: int) -> Optional[str]:
+            row = connection.execute("SELECT review FROM files WHERE id=? LIMIT 1", (id,)).fetchone()
+            return row[0] if row is not None else None
+
+        return load
+
+    def __getattr__(self, name: str) -> Any:
+        # Only ever called for slots that were never set.
+        if name == "review" and self._review_loader is not None:
+            self.review = self._review_loader(cast(int, self.id))
+            return self.review
+        raise AttributeError(name)
+
     def insert(self, cursor, extra_args: Optional[Any] = None) -> Optional[int]:
         cursor.execute(
             "INSERT INTO files (filename, fullpath, review, rating) VALUES (?, ?, ?, ?)",
             (self.filename, self.fullpath, self.review, self.rating)
         )
         self.id = cursor.lastrowid
+        # Ids of deleted files may be handed out again.
+        self._uncache(cursor)
         return self.id
 
     def __str__(self):
@@ -185,7 +344,24 @@ class FileIndexRecord(SQLiteDataClass):
     def create_delete_tuple(self) -> tuple[Any, ...]:
         return tuple()
 
-@dataclass
+FileIndexRecord.COLUMNS = starfields(FileIndexRecord)
+FileIndexRecord.FETCH_QUERY = f"SELECT {FileIndexRecord.COLUMNS} FROM files WHERE id=? LIMIT 1"
+FileIndexRecord.LISTING_COLUMNS = "id,filename,fullpath,rating"
+
+@dataclass(slots=True)
+class FileListing(Hydratable):
+    """
+    Just enough of a file to list it.
+    """
+    id: int
+    filename: str
+
+    def __str__(self):
+        return self.filename
+
+FileListing.COLUMNS = starfields(FileListing)
+
+@dataclass(slots=True)
 class PersonIndexRecord(SQLiteDataClass):
     id: Optional[int]
     firstname: str
@@ -193,23 +369,66 @@ class PersonIndexRecord(SQLiteDataClass):
     extraction_rule: NameDecisionRule
     is_deactivated: int = 0
 
+    FIND_BY_NAME_QUERY = ""
+    FIND_BY_FIRSTNAME_QUERY = ""
+
     @staticmethod
     def fetch(cursor, id) -> Optional["PersonIndexRecord"]:
-        query = f"SELECT {starfields(PersonIndexRecord)} FROM persons WHERE id=? LIMIT 1"
-        result = cursor.execute(query, (id,)).fetchone()
-        return PersonIndexRecord.from_sqlite_record(result) if result is not None else None
+        cache = record_cache(cursor)
+        if cache is not None and (cached := cache.get(cursor, PersonIndexRecord, id)) is not None:
+            return cached
+        result = cursor.execute(PersonIndexRecord.FETCH_QUERY, (id,)).fetchone()
+        if result is None:
+            return None
+        record = PersonIndexRecord.from_sqlite_record(result)
+        if cache is not None:
+            cache.put(PersonIndexRecord, id, record)
+        return record
+
+    @classmethod
+    def fetch_many(cls, cursor, ids: Iterable[int]) -> tuple["PersonIndexRecord", ...]:
+        ids = tuple(ids)
+        rows = rows_by_key(cursor, f"SELECT {PersonIndexRecord.COLUMNS} FROM persons WHERE id IN ({{}})", ids)
+        return tuple(PersonIndexRecord.from_sqlite_record(rows[id][0]) for id in ids if id in rows) # type: ignore
 
     @staticmethod
     def from_sqlite_record(record: tuple[int, str, str, str, int]) -> "PersonIndexRecord":
-        return PersonIndexRecord(record[0], record[1], record[2], NameDecisionRule(record[3]), record[4])
+        rule = _NAME_DECISION_RULES.get(record[3]) or NameDecisionRule(record[3])
+        return PersonIndexRecord(record[0], record[1], record[2], rule, record[4])
+
+    @classmethod
+    def row_factory(cls, cursor, row: tuple[Any, ...]) -> "PersonIndexRecord":
+        return PersonIndexRecord.from_sqlite_record(row) # type: ignore
 
     def insert(self, cursor, extra_args: Optional[Any] = None) -> Optional[int]:
-        cursor.execute(
+        """
+        Upsert. Should a person with the same name already exist, this record
+        takes their id and the stored record is left as is.
+        """
+        if self.lastname is None:
+            # NULLs never collide in a UNIQUE constraint so the upsert below
+            # can't catch these.
+            existing = cursor.execute(
+                "SELECT id FROM persons WHERE firstname=? AND lastname IS NULL LIMIT 1;", (self.firstname,)
+            ).fetchone()
+            if existing is not None:
+                self.id = existing[0]
+                return self.id
+        # DO NOTHING returns no row for a person already on record, but unlike
+        # a no-op DO UPDATE it doesn't set off the search triggers.
+        inserted = cursor.execute(
             """INSERT INTO persons (firstname, lastname, extraction_rule, is_deactivated)
-            VALUES(?, ?, ?, ?)""",
+            VALUES(?, ?, ?, ?)
+            ON CONFLICT(firstname, lastname) DO NOTHING
+            RETURNING id""",
             (self.firstname, self.lastname, str(self.extraction_rule), self.is_deactivated)
-        )
-        self.id = cursor.lastrowid
+        ).fetchone()
+        if inserted is None:
+            inserted = cursor.execute(
+                "SELECT id FROM persons WHERE firstname=? AND lastname=? LIMIT 1;", (self.firstname, self.lastname)
+            ).fetchone()
+        self.id = inserted[0]
+        self._uncache(cursor)
         return self.id
 
     def load_performances(self, cursor) -> Optional[tuple[FileIndexRecord, ...]]:
@@ -220,13 +439,9 @@ class PersonIndexRecord(SQLiteDataClass):
     def find_by_name(cursor, firstname: str, lastname: Optional[str]) -> Optional["PersonIndexRecord"]:
         test = None
         if lastname is not None:
-            test = cursor.execute(
-                f"SELECT {starfields(PersonIndexRecord)} FROM persons WHERE firstname=? AND lastname=? LIMIT 1;",
-                (firstname, lastname)
-            ).fetchone()
+            test = cursor.execute(PersonIndexRecord.FIND_BY_NAME_QUERY, (firstname, lastname)).fetchone()
         else:
-            test = cursor.execute(
-                f"SELECT {starfields(PersonIndexRecord)} FROM persons WHERE firstname=? AND lastname IS NULL LIMIT 1;", (firstname,)).fetchone()
+            test = cursor.execute(PersonIndexRecord.FIND_BY_FIRSTNAME_QUERY, (firstname,)).fetchone()
 
         if test:
             return PersonIndexRecord.from_sqlite_record(test)
@@ -250,7 +465,34 @@ class PersonIndexRecord(SQLiteDataClass):
     def create_delete_tuple(self) -> tuple[Any, ...]:
         return tuple()
 
-@dataclass
+PersonIndexRecord.COLUMNS = starfields(PersonIndexRecord)
+PersonIndexRecord.FETCH_QUERY = f"SELECT {PersonIndexRecord.COLUMNS} FROM persons WHERE id=? LIMIT 1"
+PersonIndexRecord.FIND_BY_NAME_QUERY = (
+    f"SELECT {PersonIndexRecord.COLUMNS} FROM persons WHERE firstname=? AND lastname=? LIMIT 1;"
+)
+PersonIndexRecord.FIND_BY_FIRSTNAME_QUERY = (
+    f"SELECT {PersonIndexRecord.COLUMNS} FROM persons WHERE firstname=? AND lastname IS NULL LIMIT 1;"
+)
+
+@dataclass(slots=True)
+class PersonListing(Hydratable):
+    """
+    Just enough of a person to list them.
+    """
+    id: int
+    firstname: str
+    lastname: Optional[str]
+
+    def __str__(self):
+        return (
+            f"{self.lastname}, {self.firstname}"
+            if self.lastname is not None else
+            self.firstname
+        )
+
+PersonListing.COLUMNS = starfields(PersonListing)
+
+@dataclass(slots=True)
 class PerformanceIndexRecord(SQLiteDataClass):
     """
     This relation has two fields: files and performers. Each field can either be
@@ -286,21 +528,66 @@ class PerformanceIndexRecord(SQLiteDataClass):
         )
 
     @staticmethod
-    def fetch(cursor, root_record: Union[PersonIndexRecord, FileIndexRecord]) -> Optional["PerformanceIndexRecord"]:
-        is_person_rooted = isinstance(root_record, PersonIndexRecord)
-        query = (
-            f"SELECT file_id FROM participation WHERE person_id={root_record.id}"
-            if is_person_rooted else
-            f"SELECT person_id FROM participation WHERE file_id={root_record.id}"
-        )
-        result = cursor.execute(query).fetchall()
-        non_root_type = FileIndexRecord if is_person_rooted else PersonIndexRecord
-        non_root_attr = tuple() if result is None else tuple([non_root_type.fetch(cursor, _id[0]) for _id in result if _id is not None])
-        
-        if is_person_rooted:
-            return PerformanceIndexRecord(files=non_root_attr, performers=cast(PersonIndexRecord, root_record)) # type: ignore
-        else:
-            return PerformanceIndexRecord(files=cast(FileIndexRecord, root_record), performers=non_root_attr) # type: ignore
+    def fetch(
+        cursor,
+        root_record: Union[PersonIndexRecord, FileIndexRecord],
+        review_loader: Optional[Callable[[int], Optional[str]]] = None
+    ) -> Optional["PerformanceIndexRecord"]:
+        return PerformanceIndexRecord.fetch_many(cursor, (root_record,), review_loader)[0]
+
+    @classmethod
+    def fetch_many(
+        cls,
+        cursor,
+        ids: Iterable[Union[PersonIndexRecord, FileIndexRecord]],
+        review_loader: Optional[Callable[[int], Optional[str]]] = None
+    ) -> tuple["PerformanceIndexRecord", ...]:
+        """
+        Fetch the record rooted at each of the given persons and files, in the
+        order given. The other side of every relation is hydrated by joining
+        participation with its table, so this takes a query per
+        `SQLITE_MAX_PARAMS` roots rather than one per related record.
+
+        The files of a person come without their reviews, which are loaded with
+        `review_loader` once read. It defaults to
+        `FileIndexRecord.review_loader(cursor)`.
+        """
+        roots = tuple(ids)
+        person_ids = [root.id for root in roots if isinstance(root, PersonIndexRecord)]
+        file_ids = [root.id for root in roots if not isinstance(root, PersonIndexRecord)]
+        listing_columns = ",".join(f"files.{column}" for column in FileIndexRecord.LISTING_COLUMNS.split(","))
+        files_of = rows_by_key(
+            cursor,
+            f"""SELECT participation.person_id, {listing_columns} FROM participation
+            JOIN files ON files.id=participation.file_id
+            WHERE participation.person_id IN ({{}})""",
+            person_ids
+        ) if person_ids else {}
+        performers_of = rows_by_key(
+            cursor,
+            f"""SELECT participation.file_id, {starfields(PersonIndexRecord, "persons")} FROM participation
+            JOIN persons ON persons.id=participation.person_id
+            WHERE participation.file_id IN ({{}})""",
+            file_ids
+        ) if file_ids else {}
+
+        if files_of and review_loader is None:
+            review_loader = FileIndexRecord.review_loader(cursor)
+
+        records = []
+        for root in roots:
+            if isinstance(root, PersonIndexRecord):
+                files = tuple(
+                    FileIndexRecord.without_review(row[1:], review_loader) # type: ignore
+                    for row in files_of.get(root.id, ())
+                )
+                records.append(PerformanceIndexRecord(files=files, performers=root))
+            else:
+                performers = tuple(
+                    PersonIndexRecord.from_sqlite_record(row[1:]) for row in performers_of.get(root.id, ()) # type: ignore
+                )
+                records.append(PerformanceIndexRecord(files=root, performers=performers))
+        return tuple(records)
 
     def add_performers(self, performers: Iterable[PersonIndexRecord]): 
         if self.__is_performance_rooted():
@@ -322,20 +609,28 @@ class PerformanceIndexRecord(SQLiteDataClass):
     def from_sqlite_record(record: tuple[Any, ...]) -> "PerformanceIndexRecord":
         raise ConstructorPreferred()
 
+    # Participation already on record is merged rather than rejected; a pair
+    # stays certain once it has been certain.
+    UPSERT_QUERY = """
+        INSERT INTO participation (person_id, file_id, is_certain) VALUES (?, ?, ?)
+        ON CONFLICT(person_id, file_id) DO UPDATE SET is_certain=MAX(is_certain, excluded.is_certain);
+    """
+
     def insert(self, cursor, extra_args: Optional["PerformanceIndexRecord.ExtraArgs"] = None) -> Optional[int]:
         """
         To insert a plain one-to-one relationship between performance and
         performer, just root the record in either field and then make a
         singleton tuple for the other field.
+
+        Pairs already in the index are merged, so a record holding only some
+        new performers (or files) adds those without failing on the rest.
+        Returns the number of pairs written.
         """
         if extra_args is None:
             raise ValueError("extra_args can't be None")
 
         if isinstance(self.files, tuple) and isinstance(self.performers, tuple):
             raise InvalidDataClassState("record is not rooted, both files and performers are collections")
-        query = """
-            INSERT INTO participation (person_id, file_id, is_certain) VALUES (?, ?, ?);
-        """
         val_tuples: tuple[tuple[int, int, int], ...]
         if self.__is_performance_rooted():
             # self.files is root
@@ -382,9 +677,9 @@ class PerformanceIndexRecord(SQLiteDataClass):
         else:
             raise InvalidDataClassState("Object is not rooted.")
         
-        cursor.executemany(query, val_tuples)
+        cursor.executemany(PerformanceIndexRecord.UPSERT_QUERY, val_tuples)
 
-        return cursor.lastrowid
+        return cursor.rowcount
 
     def create_update_tuple(self) -> tuple[Any, ...]:
         return tuple()
@@ -18,3 +18,28 @@ class InvalidDataClassState(Exception):
 
     def __str__(self):
         return
+
+class MigrationError(Exception):
+    """
+    Throw this if an index could not be upgraded to the current index version.
+    The index is left at the last version that migrated cleanly.
+    """
+
+    def __init__(self, version: str, cause: Exception):
+        self.version = version
+        self.cause = cause
+
+    def __str__(self):
+        return f"Migrating the index to {self.version} failed: {self.cause}"
+
+class SnapshotError(Exception):
+    """
+    Throw this if a snapshot can't be read, be it malformed or of a format
+    version this indexer doesn't know.
+    """
+
+    def __init__(self, reason: str):
+        self.reason = reason
+
+    def __str__(self):
+        return f"Unreadable snapshot: {self.reason}"
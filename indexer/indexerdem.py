@@ -8,22 +8,38 @@ Assumptions:
   in there.
 - Names are weird, the filenames even weirder/less standard.
 """
-from .data import FileIndexRecord, MetadataRecord, NameDecisionRule, NameTuple, PerformanceIndexRecord, PersonIndexRecord
+from .data import (
+    FileIndexRecord, MetadataRecord, NameDecisionRule, NameTuple, PerformanceIndexRecord, PersonIndexRecord, chunked
+)
+from .lexicon import load_lexicon
+from .migrations import Migration, migrate
+from .names import NameMatcher
+from .profiling import ProfilingHook, Stage, StageTimer
+from .reader import IndexReader, MetadataCheckResult
+from .shards import Shard, ShardSet
+from .storage import DEFAULT_PROFILE, STORAGE_PROFILES, StorageProfile, checkpoint
+from .walker import PruneRules, get_ext, walk
+from .watch import Change, ChangeKind, make_watcher
 
 from argparse import ArgumentParser
-from collections import OrderedDict
-from enum import Enum
-from importlib import import_module
-from typing import Any, cast, Iterable, Optional, List, Set, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from multiprocessing import get_context
+from typing import Any, Callable, cast, Dict, Generator, Iterable, Iterator, Optional, List, Set, Tuple, Union
 
 import locale as pylocale
 import logging
 import os
-import re
+import queue
 import sqlite3
+import sys
+import threading
+import time
 import traceback
 
-NONWORD: re.Pattern = re.compile(r"[\W\_]+")
+# (size, mtime in nanoseconds, inode) as recorded in the files table.
+FileStat = Tuple[int, int, int]
 
 def error_string(ex: Exception) -> str:
     return '\n'.join([
@@ -60,56 +76,66 @@ _loghandler = logging.StreamHandler()
 _loghandler.setFormatter(ColoredLogFormatter())
 logger.addHandler(_loghandler)
 
-class MetadataCheckResult(Enum):
-    COMPLETELY_COMPATIBLE = 1
-    LIKELY_COMPATIBLE = 2
-    INCOMPATIBLE = 3
-    INDETERMINATE = 4
-
-class Indexerdem(object):
-
-    SQLITE_TRUE = 1
-    SQLITE_FALSE = 0
+class Indexerdem(IndexReader):
 
     DEFAULT_EXTENSIONS = ("mp4", "avi", "flv", "mkv")
     DEFAULT_LOCALES = ("en", "en_GB", "en_US", "en_NZ")
 
-    # The version of the index produced. This will be saved in the DB as
-    # metadata. The major version should guarantee compatibility with similar
-    # major versions of the indexer. The minor version represents changes that
-    # might produce inconsistencies when presenting the data; this usually means
-    # the code handling the data has changed assumptions somewhat. Schema
-    # changes are _always_ major version bumps.
-    INDEX_VERSION = "1.0"
     # The current version of this indexer. Follows semver. Major versions of
     # indexer should be able to continously work with similar major versions of
     # the index.
-    INDEXER_VERSION = "1.0.0"
+    INDEXER_VERSION = "2.0.0"
+
+    # How often `readdir` logs its progress.
+    PROGRESS_LOG_SECONDS = 10.0
+
+    # Adds a file or, should it already be indexed at the same path, refreshes
+    # its stats (keeping the old ones when none are given). Returns no row at
+    # all for a file indexed under a different path; see `__take_over`.
+    FILE_UPSERT_QUERY = """
+        INSERT INTO files (filename, fullpath, size, mtime, inode) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(filename) DO UPDATE SET
+            size=COALESCE(excluded.size, size),
+            mtime=COALESCE(excluded.mtime, mtime),
+            inode=COALESCE(excluded.inode, inode),
+            is_missing=0
+        WHERE fullpath=excluded.fullpath
+        RETURNING id
+    """
+    # Drops the performers a file got from its name, as when it is renamed.
+    # Those added by hand stay.
+    PARSED_PARTICIPATION_DELETE_QUERY = f"""
+        DELETE FROM participation WHERE file_id=? AND person_id IN (
+            SELECT id FROM persons WHERE extraction_rule!='{NameDecisionRule.MANUAL_INPUT}'
+        )
+    """
 
-    def __init__(self, index_filename: str, locales: Optional[Iterable[str]] = None, extensions: Optional[Iterable[str]] = None):
-        self.conn = sqlite3.connect(index_filename)
-        self.first_names_female: Set[str] = set()
-        self.last_names: Set[str] = set()
+    def __init__(
+        self,
+        index_filename: str,
+        locales: Optional[Iterable[str]] = None,
+        extensions: Optional[Iterable[str]] = None,
+        lexicon_dir: Optional[str] = None,
+        prune_rules: Optional[PruneRules] = None,
+        storage: StorageProfile = DEFAULT_PROFILE
+    ):
+        super().__init__(index_filename, storage=storage)
         self.extensions: Set[str] = set(extensions) if extensions is not None else set(Indexerdem.DEFAULT_EXTENSIONS)
+        self.prune_rules: PruneRules = prune_rules if prune_rules is not None else PruneRules()
         if locales is None:
             runtime_locale = pylocale.getlocale()
             if len(runtime_locale) >= 1 and runtime_locale[0] is not None:
                 locales = (runtime_locale[0],)
             else:
                 locales = Indexerdem.DEFAULT_LOCALES
-        for loc in locales:
-            person_providers_module = import_module("faker.providers.person.%s" % loc)
-            self.first_names_female |= self.__extract_names(person_providers_module.Provider.first_names_female) # type: ignore
-            self.last_names |= self.__extract_names(person_providers_module.Provider.last_names) # type: ignore
-            self.last_names |= self.__extract_names(person_providers_module.Provider.first_names_male) # type: ignore
-
-    def __extract_names(self, faker_listings: Union[OrderedDict, Tuple]) -> Set[str]:
-        if isinstance(faker_listings, tuple):
-            return set(faker_listings)
-        elif isinstance(faker_listings, OrderedDict):
-            return set(faker_listings.keys())
-        else:
-            raise TypeError("We can only operate with OrderedDicts or tuples. Given: %s" % type(faker_listings))
+        self.locales: Tuple[str, ...] = tuple(locales)
+        self.lexicon_dir = lexicon_dir
+        self.__person_cache: Optional[PersonCache] = None
+        lexicon = load_lexicon(self.locales, lexicon_dir)
+        self.first_names_female: Set[str] = lexicon.first_names
+        self.last_names: Set[str] = lexicon.last_names
+        self.matcher = NameMatcher(self.first_names_female, self.last_names)
+        self.hooks: List[ProfilingHook] = []
 
     def init(self):
         cursor = self.conn.cursor()
@@ -123,7 +149,11 @@ class Indexerdem(object):
                            filename TEXT UNIQUE NOT NULL,
                            fullpath TEXT NOT NULL,
                            rating TINYINT DEFAULT 0 CHECK (0 <= rating AND rating <= 10),
-                           review TEXT);""")
+                           review TEXT,
+                           size INTEGER,
+                           mtime INTEGER,
+                           inode INTEGER,
+                           is_missing TINYINT DEFAULT 0 NOT NULL);""")
         cursor.execute("""CREATE TABLE IF NOT EXISTS persons
                           (id INTEGER PRIMARY KEY ASC,
                            firstname TEXT NOT NULL,
@@ -142,92 +172,107 @@ class Indexerdem(object):
         # The idea here is that this should only ever succeed when the index was
         # first created.
         MetadataRecord("indexer_version", Indexerdem.INDEXER_VERSION).insert(cursor)
-        MetadataRecord("index_version", Indexerdem.INDEX_VERSION).insert(cursor)
         self.conn.commit()
-
-    def check_compatibility(self) -> MetadataCheckResult:
+        # New indices get every migration, existing ones whatever they lack.
         try:
-            index_version = self.fetch_index_version()
-            if index_version is not None:
-                index_version_parse = index_version.val.split(".")
-                indexer_version_parse = Indexerdem.INDEX_VERSION.split(".")
-
-                if index_version.val == Indexerdem.INDEX_VERSION:
-                    return MetadataCheckResult.COMPLETELY_COMPATIBLE
-                elif index_version_parse[0] == indexer_version_parse[0]:
-                    return MetadataCheckResult.LIKELY_COMPATIBLE
-                else:
-                    return MetadataCheckResult.INCOMPATIBLE
+            self.migrate()
+        except ValueError as e:
+            logger.warning("Not migrating an index of unknown version: %s" % e)
+
+    def migrate(self) -> List[Migration]:
+        """
+        Upgrade the index in place to `INDEX_VERSION`. Returns the migrations
+        applied.
+        """
+        with self.connections.write_lock:
+            return migrate(self.conn)
+
+    def checkpoint(self) -> None:
+        """
+        Fold the WAL back into the index and truncate it, if the index is in
+        WAL mode. Done at the end of every ingest so the WAL doesn't keep
+        growing while readers hold on to old snapshots.
+        """
+        with self.connections.write_lock:
+            result = checkpoint(self.conn)
+        if result is not None:
+            busy, log_pages, checkpointed = result
+            if busy:
+                logger.info("Checkpointed %d of %d WAL pages; readers are holding on to the rest." % (checkpointed, log_pages))
             else:
-                return MetadataCheckResult.INDETERMINATE
-        except Exception as e:
-            return MetadataCheckResult.INDETERMINATE
+                logger.debug("Checkpointed %d WAL pages." % checkpointed)
 
-    def fetch_index_version(self) -> Optional[MetadataRecord]:
+    def add_hook(self, hook: ProfilingHook) -> None:
         """
-        Fetch the index version of the loaded index.
+        Report the time spent in every stage of indexing to `hook`. With parse
+        workers, names are extracted in other processes and so only the
+        stages of the walker and the writer are reported.
         """
-        return MetadataRecord.fetch(self.conn.cursor(), "index_version")
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook: ProfilingHook) -> None:
+        self.hooks.remove(hook)
+
+    def __record(self, stage: Stage, start: float, items: int = 1) -> None:
+        """
+        Report the time since `start`, a `time.perf_counter` reading, as spent
+        in `stage` on `items` files.
+        """
+        if self.hooks:
+            elapsed = time.perf_counter() - start
+            for hook in self.hooks:
+                hook.record(stage, elapsed, items)
+
+    def __timed(self, iterator: Iterator[Any], stage: Stage) -> Iterator[Any]:
+        """
+        Pass `iterator` through, reporting the time spent producing every item
+        as spent in `stage`.
+        """
+        if not self.hooks:
+            yield from iterator
+            return
+
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.__record(stage, start, 0)
+                return
+            self.__record(stage, start)
+            yield item
 
     def __normalize_filename(self, filename: str) -> str:
         spam = filename.rsplit(".", 1)
         return spam[0].replace("&", "and")
 
     def __find_names(self, haystack: str) -> Iterable[NameTuple]:
-        hayparse: List[str] = NONWORD.split(haystack)
-        names: List[NameTuple] = []
-        i = 0
-        limit = len(hayparse)
-
-        while i < limit:
-            word = hayparse[i].title()
-
-            # FIXME This assumes names are only two-part. The "reasonable" thing
-            # to do would be to consume until we encounter something that isn't
-            # a name. However, watch out that sanitation means we lose boundary
-            # cues in comma-listed names.
-            if word in self.first_names_female:
-                forward = i + 1
-                if forward < limit:
-                    if hayparse[forward] in self.last_names:
-                        names.append(
-                            (
-                                word.capitalize(),
-                                hayparse[forward].capitalize(),
-                                NameDecisionRule.ALMOST_CERTAIN
-                            )
-                        )
-                        i = forward + 1
-                        continue
-                    else:
-                        names.append(
-                            (
-                                word.capitalize(),
-                                None,
-                                NameDecisionRule.TRUNCATED_FIRSTNAME
-                            )
-                        )
-                else:
-                    names.append(
-                        (
-                            word.capitalize(),
-                            None,
-                            NameDecisionRule.TRUNCATED_FIRSTNAME
-                        )
-                    )
-            elif word in self.last_names:
-                backward = i - 1
-                if backward >= 0:
-                   names.append(
-                        (
-                            hayparse[backward].capitalize(),
-                            word.capitalize(),
-                            NameDecisionRule.LASTNAME_BACKWARD
-                        )
-                    )
+        return self.matcher.find(haystack)
 
-            i += 1
-        
+    def parse(self, filename: str) -> List[NameTuple]:
+        """
+        Extract the names found in `filename`. This touches neither the index
+        nor the filesystem so it is safe to run off the writer thread.
+        """
+        start = time.perf_counter()
+        haystack = self.__normalize_filename(filename)
+        self.__record(Stage.NORMALIZE, start)
+        start = time.perf_counter()
+        names = list(self.__find_names(haystack))
+        self.__record(Stage.FIND_NAMES, start)
+        return names
+
+    def parse_many(self, filenames: Iterable[str]) -> List[List[NameTuple]]:
+        """
+        `parse` for a whole batch of filenames at once. Each of the stages is
+        timed once for the whole batch.
+        """
+        start = time.perf_counter()
+        haystacks = [self.__normalize_filename(filename) for filename in filenames]
+        self.__record(Stage.NORMALIZE, start, len(haystacks))
+        start = time.perf_counter()
+        names = self.matcher.find_many(haystacks)
+        self.__record(Stage.FIND_NAMES, start, len(haystacks))
         return names
 
     def __get_person_id(self, cursor, firstname: str, lastname: Optional[str]) -> Optional[int]:
@@ -241,129 +286,1025 @@ class Indexerdem(object):
         else:
             return None
 
-    def index(self, filename: str, fullpath: str) -> None:
+    def __make_canonical(self, absolute_path: str) -> str:
+        if absolute_path[-1] != os.path.sep:
+            return f"{absolute_path}{os.path.sep}"
+
+        return absolute_path
+
+    @contextmanager
+    def __savepoint(self, cursor, name: str):
+        """
+        Run the enclosed statements inside a savepoint. An exception rolls back
+        only the statements issued within the block and is then re-raised.
+        """
+        cursor.execute(f"SAVEPOINT {name}")
+        try:
+            yield
+        except:
+            cursor.execute(f"ROLLBACK TO {name}")
+            cursor.execute(f"RELEASE {name}")
+            raise
+        else:
+            cursor.execute(f"RELEASE {name}")
+
+    def __index_file(self, cursor, entry: "IndexEntry", person_cache: "PersonCache") -> "IndexResult":
         def decide_certainty(nametpl: NameTuple) -> bool:
             return nametpl[2] == NameDecisionRule.ALMOST_CERTAIN
 
-        def make_canonical(absolute_path: str) -> str:
-            if absolute_path[-1] != os.path.sep:
-                return f"{absolute_path}{os.path.sep}"
+        start = time.perf_counter()
+        filename, fullpath = entry.filename, entry.fullpath
+        canon_fullpath = self.__make_canonical(fullpath)
+        if entry.moved_from is not None:
+            cursor.execute("UPDATE files SET filename=?, fullpath=? WHERE id=?", (filename, canon_fullpath, entry.moved_from))
+            cursor.execute(Indexerdem.PARSED_PARTICIPATION_DELETE_QUERY, (entry.moved_from,))
+            logger.debug("File %s moved to %s%s." % (entry.moved_from, fullpath, filename))
+        size, mtime, inode = entry.stat if entry.stat is not None else (None, None, None)
+        row = cursor.execute(Indexerdem.FILE_UPSERT_QUERY, (filename, canon_fullpath, size, mtime, inode)).fetchone()
+        if row is None and self.__take_over(cursor, [(filename, canon_fullpath)]):
+            row = cursor.execute(Indexerdem.FILE_UPSERT_QUERY, (filename, canon_fullpath, size, mtime, inode)).fetchone()
+        if row is None:
+            raise sqlite3.IntegrityError(f"File {fullpath}{filename} is indexed under a different path.")
+        file_id = row[0]
+        self.__record(Stage.FILES, start)
+        names = entry.names if entry.names is not None else self.parse(filename)
+        logger.debug("'%s' has the ff. names: %s" % (filename, names))
+        result = IndexResult(filename, fullpath, file_id, names, moved_from=entry.moved_from)
+        persons = []
+        certainties = []
+
+        start = time.perf_counter()
+        for name in names:
+            if len(name) == 3:
+                person = person_cache.find(cursor, name[0], name[1])
+                if person is None:
+                    new_person = PersonIndexRecord(
+                        firstname=name[0],
+                        lastname=name[1],
+                        extraction_rule=name[2],
+                        is_deactivated=0,
+                        id=None
+                    )
+                    person_id = new_person.insert(cursor)
 
-            return absolute_path
+                    if person_id is not None:
+                        person_cache.add(new_person)
+                        persons.append(new_person)
+                        result.new_persons.append(person_id)
+                        certainties.append(Indexerdem.SQLITE_TRUE if decide_certainty(name) else Indexerdem.SQLITE_FALSE)
+                elif person.id is not None:
+                    persons.append(person)
+                    result.existing_persons.append(person.id)
+                    certainties.append(Indexerdem.SQLITE_TRUE if person.extraction_rule is NameDecisionRule.ALMOST_CERTAIN else Indexerdem.SQLITE_FALSE)
+            else:
+                logger.error("Found an odd name: %s" % str(name))
+        self.__record(Stage.PERSONS, start)
 
-        try:
-            cleaned = self.__normalize_filename(filename)
-            file_id: Optional[int] = -1
-            cursor = self.conn.cursor()
-            canon_fullpath = make_canonical(fullpath)
+        start = time.perf_counter()
+        if (file_record := FileIndexRecord.fetch(cursor, file_id)) is not None:
+            perf_record = PerformanceIndexRecord(
+                files=file_record,
+                performers=tuple(persons)
+            )
+            perf_record.insert(
+                cursor,
+                PerformanceIndexRecord.ExtraArgs(certainties=tuple(certainties))
+            )
+        self.__record(Stage.PARTICIPATION, start)
+
+        return result
+
+    def index(self, filename: str, fullpath: str) -> None:
+        with self.connections.write_lock:
             try:
-                cursor.execute("INSERT INTO files (filename, fullpath) VALUES (?, ?)", (filename, canon_fullpath))
-                file_id = cursor.lastrowid
-            except sqlite3.IntegrityError:
-                file_id = cursor.execute("SELECT id FROM files WHERE filename=? AND fullpath=? LIMIT 1;", (filename, canon_fullpath)).fetchone()[0]
-                logger.warn("File %s%s previously indexed as id %s." % (fullpath, filename, file_id))
-            names = self.__find_names(cleaned)
-            logger.info("'%s' has the ff. names: %s" % (filename, names))
-            persons = []
-            certainties = []
+                self.__index_file(self.conn.cursor(), IndexEntry(filename, fullpath), PersonCache())
+            except:
+                logger.exception("Ran into some problems...")
+            finally:
+                start = time.perf_counter()
+                self.conn.commit()
+                self.__record(Stage.COMMIT, start)
+
+    def __fetch_file_ids(self, cursor, filenames: List[str]) -> dict[Tuple[str, str], int]:
+        file_ids: dict[Tuple[str, str], int] = {}
+        for chunk in chunked(filenames):
+            rows = cursor.execute(
+                f"SELECT id, filename, fullpath FROM files WHERE filename IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            file_ids.update(((filename, fullpath), _id) for _id, filename, fullpath in rows)
+        return file_ids
+
+    def __take_over(self, cursor, paths: List[Tuple[str, str]]) -> dict[Tuple[str, str], int]:
+        """
+        Move the rows of files indexed under another path than the one in
+        `paths` over to it, as long as the file is gone from the old path. That
+        is a move the inode can't tell: a copy and delete, or a move across
+        devices. Returns the ids of the rows taken over, by their new path.
+        """
+        new_fullpaths = dict(paths)
+        taken: dict[Tuple[str, str], int] = {}
+        for chunk in chunked(list(new_fullpaths)):
+            rows = cursor.execute(
+                f"SELECT id, filename, fullpath, is_missing FROM files WHERE filename IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for file_id, filename, old_fullpath, is_missing in rows.fetchall():
+                new_fullpath = new_fullpaths[filename]
+                if old_fullpath == new_fullpath:
+                    continue
+                if is_missing or not os.path.exists(os.path.join(old_fullpath, filename)):
+                    taken[(filename, new_fullpath)] = file_id
+                    logger.debug("File %s moved from %s%s to %s%s." % (file_id, old_fullpath, filename, new_fullpath, filename))
+        cursor.executemany(
+            "UPDATE files SET fullpath=?, is_missing=0 WHERE id=?",
+            [(fullpath, file_id) for (_, fullpath), file_id in taken.items()]
+        )
+        return taken
+
+    def __index_batch(self, cursor, entries: List["IndexEntry"], person_cache: "PersonCache") -> List["IndexResult"]:
+        """
+        Batched counterpart of `__index_file`. Each table is written with a
+        single `executemany` for the whole batch instead of one statement per
+        file and name.
+        """
+        start = time.perf_counter()
+        by_path: dict[Tuple[str, str], IndexEntry] = {}
+        for entry in entries:
+            by_path.setdefault((entry.filename, self.__make_canonical(entry.fullpath)), entry)
+        canon_entries = list(by_path)
+
+        moves = [
+            (filename, fullpath, by_path[(filename, fullpath)].moved_from)
+            for filename, fullpath in canon_entries
+            if by_path[(filename, fullpath)].moved_from is not None
+        ]
+        cursor.executemany("UPDATE files SET filename=?, fullpath=? WHERE id=?", moves)
+        cursor.executemany(Indexerdem.PARSED_PARTICIPATION_DELETE_QUERY, [(file_id,) for _, _, file_id in moves])
+        for filename, fullpath, file_id in moves:
+            logger.debug("File %s moved to %s%s." % (file_id, fullpath, filename))
+
+        filenames = [filename for filename, _ in canon_entries]
+        file_ids = self.__fetch_file_ids(cursor, filenames)
+        # Re-indexing a tree finds most of it already indexed; only look when
+        # anyone is listening.
+        if logger.isEnabledFor(logging.DEBUG):
+            for path in canon_entries:
+                if path in file_ids:
+                    logger.debug("File %s%s previously indexed as id %s." % (path[1], path[0], file_ids[path]))
+
+        known_filenames = set(filename for filename, _ in file_ids)
+        file_ids.update(self.__take_over(
+            cursor, [path for path in canon_entries if path[0] in known_filenames and path not in file_ids]
+        ))
+        new_entries = [path for path in canon_entries if path[0] not in known_filenames]
+        cursor.executemany("INSERT INTO files (filename, fullpath) VALUES (?, ?)", new_entries)
+        file_ids.update(self.__fetch_file_ids(cursor, [filename for filename, _ in new_entries]))
+
+        cursor.executemany(
+            "UPDATE files SET size=?, mtime=?, inode=?, is_missing=0 WHERE id=?",
+            [
+                (*by_path[path].stat, file_ids[path]) # type: ignore
+                for path in canon_entries
+                if path in file_ids and by_path[path].stat is not None
+            ]
+        )
+        self.__record(Stage.FILES, start, len(canon_entries))
+
+        unparsed = [path for path in canon_entries if by_path[path].names is None]
+        for path, names in zip(unparsed, self.parse_many(filename for filename, _ in unparsed)):
+            by_path[path].names = names
+
+        results: List[IndexResult] = []
+        file_names: List[Tuple[IndexResult, List[NameTuple]]] = []
+        for filename, fullpath in canon_entries:
+            entry = by_path[(filename, fullpath)]
+            names = cast(List[NameTuple], entry.names)
+            if (filename, fullpath) not in file_ids:
+                logger.error("File %s%s is indexed under a different path." % (fullpath, filename))
+                results.append(IndexResult(entry.filename, entry.fullpath, None, names, error="Indexed under a different path"))
+                continue
+            logger.debug("'%s' has the ff. names: %s" % (filename, names))
+            result = IndexResult(entry.filename, entry.fullpath, file_ids[(filename, fullpath)], names, moved_from=entry.moved_from)
+            results.append(result)
+            file_names.append((result, names))
 
+        # Names are resolved once per batch. A person created by an earlier
+        # file in the batch is "existing" for the files after it.
+        start = time.perf_counter()
+        persons: dict[Tuple[str, Optional[str]], PersonIndexRecord] = {}
+        new_persons: List[PersonIndexRecord] = []
+        for _, names in file_names:
             for name in names:
-                if len(name) == 3:
-                    person = PersonIndexRecord.find_by_name(cursor, name[0], name[1])
-                    if person is None:
-                        new_person = PersonIndexRecord(
-                            firstname=name[0],
-                            lastname=name[1],
-                            extraction_rule=name[2],
-                            is_deactivated=0,
-                            id=None
-                        )
-                        person_id = new_person.insert(cursor)
-
-                        if person_id is not None:
-                            persons.append(person_id)
-                            certainties.append(Indexerdem.SQLITE_TRUE if decide_certainty(name) else Indexerdem.SQLITE_FALSE)
-                    elif person.id is not None:
-                        persons.append(person.id)
-                        certainties.append(Indexerdem.SQLITE_TRUE if person.extraction_rule is NameDecisionRule.ALMOST_CERTAIN else Indexerdem.SQLITE_FALSE)
-                else:
+                if len(name) != 3:
                     logger.error("Found an odd name: %s" % str(name))
-
-            if file_id is not None and file_id != -1:
-                if (file_record := FileIndexRecord.fetch(cursor, file_id)) is not None:
-                    perf_record = PerformanceIndexRecord(
-                        files=file_record,
-                        performers=tuple(spam for spam in (PersonIndexRecord.fetch(cursor, pid) for pid in persons) if spam is not None)
+                    continue
+                key = (name[0], name[1])
+                if key in persons:
+                    continue
+                person = person_cache.find(cursor, name[0], name[1])
+                if person is None:
+                    person = PersonIndexRecord(
+                        firstname=name[0],
+                        lastname=name[1],
+                        extraction_rule=name[2],
+                        is_deactivated=0,
+                        id=None
                     )
-                    try:
-                        perf_record.insert(
-                            cursor,
-                            PerformanceIndexRecord.ExtraArgs(certainties=tuple(certainties))
-                        )
-                    except sqlite3.IntegrityError:
-                        logger.warn(f"Some persons are already associated with {file_record}")
-        except:
-            logger.exception("Ran into some problems...")
+                    new_persons.append(person)
+                persons[key] = person
+
+        if new_persons:
+            # Ids are handed out in increasing order and we are the only
+            # writer, so whatever lies past the current maximum is ours.
+            max_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM persons").fetchone()[0]
+            cursor.executemany(
+                """INSERT INTO persons (firstname, lastname, extraction_rule, is_deactivated)
+                VALUES(?, ?, ?, ?)""",
+                [(p.firstname, p.lastname, str(p.extraction_rule), p.is_deactivated) for p in new_persons]
+            )
+            new_ids = cursor.execute("SELECT id FROM persons WHERE id > ? ORDER BY id", (max_id,)).fetchall()
+            if len(new_ids) != len(new_persons):
+                raise sqlite3.DatabaseError(f"Inserted {len(new_persons)} persons but found {len(new_ids)}")
+            for person, (person_id,) in zip(new_persons, new_ids):
+                person.id = person_id
+                person_cache.add(person)
+        self.__record(Stage.PERSONS, start, len(file_names))
+
+        # A new person counts as new only for the first file it was found in.
+        start = time.perf_counter()
+        unclaimed = set(id(person) for person in new_persons)
+        participation: List[Tuple[int, int, int]] = []
+        for result, names in file_names:
+            seen: Set[int] = set()
+            for name in names:
+                if len(name) != 3:
+                    continue
+                person = persons[(name[0], name[1])]
+                if person.id is None or person.id in seen:
+                    continue
+                seen.add(person.id)
+                if id(person) in unclaimed:
+                    unclaimed.discard(id(person))
+                    result.new_persons.append(person.id)
+                else:
+                    result.existing_persons.append(person.id)
+                participation.append((
+                    person.id,
+                    cast(int, result.file_id),
+                    Indexerdem.SQLITE_TRUE if person.extraction_rule is NameDecisionRule.ALMOST_CERTAIN else Indexerdem.SQLITE_FALSE
+                ))
+
+        cursor.executemany(PerformanceIndexRecord.UPSERT_QUERY, participation)
+        self.__record(Stage.PARTICIPATION, start, len(file_names))
+        return results
+
+    def index_many(self, entries: Iterable[Tuple[str, str]]) -> List["IndexResult"]:
+        """
+        Index a batch of `(filename, fullpath)` pairs in a single transaction.
+
+        The whole batch is first attempted with batched statements. Should that
+        fail, the batch is replayed file by file, each inside its own savepoint,
+        so that a bad file is logged and skipped without losing the rest of the
+        batch.
+        """
+        return self.__commit_batch([IndexEntry(filename, fullpath) for filename, fullpath in entries])
+
+    def __commit_batch(self, entries: List["IndexEntry"]) -> List["IndexResult"]:
+        """
+        Write `entries` in a single transaction. Entries whose names are `None`
+        have not been parsed yet and will be parsed here.
+        """
+        if not entries:
+            return []
+
+        # Outside of an indexing session, fall back to a cold cache that looks
+        # persons up as they are needed.
+        with self.connections.write_lock:
+            person_cache = self.__person_cache if self.__person_cache is not None else PersonCache()
+            cursor = self.conn.cursor()
+            results: List[IndexResult] = []
+            start = time.perf_counter()
+            try:
+                if not self.conn.in_transaction:
+                    cursor.execute("BEGIN")
+                batch_mark = person_cache.mark()
+                try:
+                    with self.__savepoint(cursor, "batch"):
+                        results = self.__index_batch(cursor, entries, person_cache)
+                except:
+                    logger.warning("Batch of %d files failed, retrying one by one." % len(entries), exc_info=True)
+                    person_cache.rollback_to(batch_mark)
+                    results = []
+                    for entry in entries:
+                        file_mark = person_cache.mark()
+                        try:
+                            with self.__savepoint(cursor, "single"):
+                                results.append(self.__index_file(cursor, entry, person_cache))
+                        except Exception as e:
+                            person_cache.rollback_to(file_mark)
+                            logger.exception("Ran into some problems with %s%s" % (entry.fullpath, entry.filename))
+                            results.append(IndexResult(entry.filename, entry.fullpath, None, entry.names or [], error=f"{type(e).__name__}: {e}"))
+            finally:
+                commit_start = time.perf_counter()
+                self.conn.commit()
+                self.__record(Stage.COMMIT, commit_start, len(entries))
+                person_cache.commit()
+
+        share = (time.perf_counter() - start) / len(results) if results else 0.0
+        for result in results:
+            result.seconds = share
+        return results
+
+    @contextmanager
+    def __indexing_session(self, warm: bool = True):
+        """
+        Keep a `PersonCache` around for every batch committed within the
+        block. Persons written by anyone else in the meantime won't be seen, so
+        sessions should not outlive a single run.
+
+        Warming the cache loads every person, which only pays off when the
+        block indexes enough files; otherwise persons are looked up by name
+        as they come.
+        """
+        person_cache = PersonCache()
+        if warm:
+            person_cache.warm(self.conn.cursor())
+        self.__person_cache = person_cache
+        try:
+            yield person_cache
         finally:
-            self.conn.commit()
+            self.__person_cache = None
+
+    def __walk(self, dirpath: str, snapshot: "_IndexSnapshot") -> Iterator["IndexEntry"]:
+        for root, _file, st in walk(dirpath, self.extensions, self.prune_rules):
+            entry = snapshot.classify(_file, root, (st.st_size, st.st_mtime_ns, st.st_ino))
+            if entry is not None:
+                logger.debug("processing %s" % _file)
+                yield entry
+
+    def __mark_missing(self, missing: List[Tuple[int, str, str]]) -> List[Tuple[int, str, str]]:
+        if not missing:
+            return missing
 
-    def __get_ext(self, fname: str) -> str:
-        return fname.rsplit(".", 1)[1]
+        with self.writing() as cursor:
+            # Rows taken over by a new path since the snapshot are not missing.
+            missing = [
+                (file_id, filename, fullpath) for file_id, filename, fullpath in missing
+                if cursor.execute(
+                    "UPDATE files SET is_missing=1 WHERE id=? AND filename=? AND fullpath=?", (file_id, filename, fullpath)
+                ).rowcount
+            ]
+        for file_id, filename, fullpath in missing:
+            logger.warning("File %s%s (id %s) is no longer on disk." % (fullpath, filename, file_id))
+        return missing
+
+    def readdir(
+        self,
+        dirpath: str,
+        batch_size: int = 1,
+        batch_seconds: Optional[float] = None,
+        workers: int = 0,
+        incremental: bool = True
+    ) -> None:
+        """
+        Index every file under `dirpath` with a recognized extension.
+
+        Files are committed in batches of `batch_size` files. When
+        `batch_seconds` is given, a batch is also committed once it has been
+        accumulating for that long, whichever comes first.
+
+        With `workers` greater than zero, name extraction is farmed out to that
+        many worker processes while this thread only writes to the index.
+
+        When `incremental`, files whose size, mtime and inode match what was
+        recorded on the last run are skipped. Files that moved within
+        `dirpath` keep their id and files no longer on disk are flagged
+        `is_missing` once the walk completes.
+        """
+        try:
+            self.__readdir(dirpath, batch_size, batch_seconds, workers, incremental)
+        finally:
+            self.conn.close()
 
-    def readdir(self, dirpath: str) -> None:
+    def __readdir(
+        self,
+        dirpath: str,
+        batch_size: int,
+        batch_seconds: Optional[float],
+        workers: int,
+        incremental: bool
+    ) -> None:
         try:
-            for root, dirs, files in os.walk(dirpath):
-                for _file in files:
-                    if self.__get_ext(_file) in self.extensions:
-                        logger.info("processing %s" % _file)
-                        self.index(_file, root)
+            events = self.iter_index(
+                (dirpath,),
+                batch_size=batch_size,
+                batch_seconds=batch_seconds,
+                workers=workers,
+                incremental=incremental,
+                progress_seconds=Indexerdem.PROGRESS_LOG_SECONDS
+            )
+            for event in events:
+                if isinstance(event, IndexProgress):
+                    logger.info(str(event))
         except:
             logger.exception("Ran into some problems...")
+
+    def iter_index(
+        self,
+        paths: Iterable[str],
+        batch_size: int = 500,
+        batch_seconds: Optional[float] = None,
+        workers: int = 0,
+        incremental: bool = True,
+        progress_seconds: Optional[float] = None
+    ) -> Iterator[Union["IndexResult", "IndexProgress"]]:
+        """
+        Index `paths`, which may be directories or individual files, yielding
+        an `IndexResult` for every file as soon as the batch it belongs to is
+        committed. Batching, `workers` and `incremental` work as in `readdir`.
+
+        When `progress_seconds` is given, an `IndexProgress` snapshot is
+        yielded after any batch committed at least that long after the
+        previous snapshot. A final snapshot, with `done` set, is always
+        yielded last.
+
+        Unlike `readdir`, the connection is left open. Closing the generator
+        early commits whatever was already queued but does not flag missing
+        files, since the walk never completed.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size should be at least 1. Given: {batch_size}")
+
+        progress = IndexProgress()
+        last_snapshot = time.monotonic()
+        memo = self.matcher.memo
+        memo_baseline = (memo.hits, memo.misses) if memo is not None else (0, 0)
+
+        def take_snapshot() -> IndexProgress:
+            # Names parsed by workers go through their own memos and are not
+            # counted here.
+            if memo is not None:
+                progress.memo_hits = memo.hits - memo_baseline[0]
+                progress.memo_misses = memo.misses - memo_baseline[1]
+            return progress.snapshot()
+
+        batcher = _Batcher(self.__commit_batch, batch_size, batch_seconds)
+        file_snapshot: Optional[_IndexSnapshot] = None
+
+        def drain() -> Iterator[Union[IndexResult, IndexProgress]]:
+            nonlocal last_snapshot
+            results = batcher.drain()
+            for result in results:
+                progress.add(result)
+                yield result
+            now = time.monotonic()
+            if results and progress_seconds is not None and now - last_snapshot >= progress_seconds:
+                last_snapshot = now
+                yield take_snapshot()
+
+        with self.__indexing_session():
+            try:
+                for path in paths:
+                    if os.path.isdir(path):
+                        snapshot = _IndexSnapshot(self.conn.cursor(), self.__make_canonical(path), incremental)
+                        if workers > 0:
+                            chunks: Generator[List[IndexEntry], None, None] = self.__parse_parallel(path, workers, snapshot)
+                        else:
+                            chunks = ([entry] for entry in self.__timed(self.__walk(path, snapshot), Stage.WALK))
+                        try:
+                            for chunk in chunks:
+                                progress.queued += len(chunk)
+                                batcher.add(chunk)
+                                yield from drain()
+                        finally:
+                            # Winds down the parse workers right away should
+                            # the caller stop early.
+                            chunks.close()
+                        batcher.flush()
+                        yield from drain()
+                        progress.skipped += snapshot.skipped
+                        progress.missing += len(self.__mark_missing(snapshot.missing()))
+                    else:
+                        if file_snapshot is None:
+                            file_snapshot = _IndexSnapshot(self.conn.cursor(), "", incremental)
+                        root, filename = os.path.split(path)
+                        if get_ext(filename) not in self.extensions:
+                            continue
+                        try:
+                            st = os.stat(path)
+                        except OSError as e:
+                            result = IndexResult(filename, root, None, [], error=f"{type(e).__name__}: {e}")
+                            progress.add(result)
+                            yield result
+                            continue
+                        if self.prune_rules.prunes_file(filename, st.st_size):
+                            progress.skipped += 1
+                            continue
+                        entry = file_snapshot.classify(filename, root, (st.st_size, st.st_mtime_ns, st.st_ino))
+                        if entry is None:
+                            progress.skipped += 1
+                            continue
+                        progress.queued += 1
+                        batcher.add([entry])
+                        yield from drain()
+                batcher.flush()
+                yield from drain()
+            finally:
+                # Reached on errors and when the caller stops early.
+                batcher.flush()
+
+        self.checkpoint()
+        progress.done = True
+        for hook in self.hooks:
+            hook.finished()
+        yield take_snapshot()
+
+    def watch(
+        self,
+        dirpath: str,
+        window: float = 2.0,
+        poll_interval: float = 30.0,
+        batch_size: int = 500,
+        use_inotify: bool = True,
+        stop: Optional[threading.Event] = None
+    ) -> None:
+        """
+        Keep the index in sync with `dirpath` until interrupted or until `stop`
+        is set.
+
+        After an initial incremental `readdir`, filesystem changes are picked
+        up through inotify, or by rescanning every `poll_interval` seconds
+        where inotify is unavailable. Changes are coalesced for `window`
+        seconds so a bulk copy ends up as a handful of transactions.
+        """
+        watcher = make_watcher(dirpath, poll_interval, use_inotify)
+        logger.info("Watching %s with %s" % (dirpath, type(watcher).__name__))
+        try:
+            self.__readdir(dirpath, batch_size, None, 0, True)
+            while stop is None or not stop.is_set():
+                changes = watcher.coalesce(window, timeout=0.5)
+                if changes:
+                    try:
+                        self.__apply_changes(dirpath, changes, batch_size)
+                    except:
+                        logger.exception("Ran into some problems...")
+        except KeyboardInterrupt:
+            pass
         finally:
+            watcher.close()
             self.conn.close()
 
-    def __sqliteify(self, b: bool) -> int:
-        return Indexerdem.SQLITE_TRUE if b else Indexerdem.SQLITE_FALSE
+    def __apply_changes(self, dirpath: str, changes: List[Change], batch_size: int) -> None:
+        if any(change.kind is ChangeKind.RESCAN for change in changes):
+            self.__readdir(dirpath, batch_size, None, 0, True)
+            return
 
-    def fetch_files(self, limit: Optional[int] = None) -> tuple[FileIndexRecord, ...]:
-        cursor = self.conn.cursor()
-        query = (
-            f"SELECT * FROM files LIMIT={limit}"
-            if limit is not None else
-            "SELECT * FROM files"
+        # A window holds a handful of changes, not worth loading every person
+        # for.
+        with self.__indexing_session(warm=False):
+            self.__apply_file_changes(dirpath, changes, batch_size)
+        self.checkpoint()
+
+    def __apply_file_changes(self, dirpath: str, changes: List[Change], batch_size: int) -> None:
+        # (filename, root, stat) of every file added or modified.
+        found: List[Tuple[str, str, FileStat]] = []
+        removed_files: Set[Tuple[str, str]] = set()
+        removed_dirs: List[str] = []
+        for change in changes:
+            if change.kind is ChangeKind.REMOVED:
+                if change.is_dir:
+                    removed_dirs.append(self.__make_canonical(change.path))
+                else:
+                    root, filename = os.path.split(change.path)
+                    removed_files.add((filename, self.__make_canonical(root)))
+            elif change.is_dir:
+                if self.prune_rules.prunes_subtree(dirpath, change.path):
+                    continue
+                found.extend(
+                    (filename, root, (st.st_size, st.st_mtime_ns, st.st_ino))
+                    for root, filename, st in walk(change.path, self.extensions, self.prune_rules)
+                )
+            else:
+                root, filename = os.path.split(change.path)
+                if get_ext(filename) not in self.extensions:
+                    continue
+                try:
+                    st = os.stat(change.path)
+                except OSError:
+                    # Gone again before we got to it.
+                    continue
+                if self.prune_rules.prunes_path(dirpath, change.path, st.st_size):
+                    continue
+                found.append((filename, root, (st.st_size, st.st_mtime_ns, st.st_ino)))
+
+        # Only what the index knows about the paths and inodes at hand, rather
+        # than all of `dirpath`, which is most of the index.
+        snapshot = _IndexSnapshot.of_changes(
+            self.conn.cursor(),
+            {self.__make_canonical(root) for _, root, _ in found} | {fullpath for _, fullpath in removed_files},
+            {stat[2] for _, _, stat in found},
+            removed_dirs
         )
-        return tuple(FileIndexRecord(*row) for row in cursor.execute(query).fetchall())
-    
-    def get_file_record_from_id(self, id: int) -> Optional[FileIndexRecord]:
-        cursor = self.conn.cursor()
-        query = f"SELECT * FROM files WHERE id={id} LIMIT 1"
-        result = cursor.execute(query).fetchone()
-        return FileIndexRecord(*result) if result is not None else None
-    
-    def fetch_persons(self, activity_status: Optional[bool] = None) -> tuple[PersonIndexRecord, ...]:
-        cursor = self.conn.cursor()
-        query = (
-            f"SELECT * FROM persons WHERE is_deactivated={self.__sqliteify(activity_status)}"
-            if activity_status is not None else
-            "SELECT * FROM persons"
+        batcher = _Batcher(self.__commit_batch, batch_size, None)
+        for filename, root, stat in found:
+            entry = snapshot.classify(filename, root, stat)
+            if entry is not None:
+                logger.debug("processing %s" % filename)
+                batcher.add([entry])
+        batcher.flush()
+
+        # Anything moved within the library was seen by `classify` above, so
+        # only files that really left it are flagged.
+        self.__mark_missing([
+            (file_id, filename, fullpath)
+            for file_id, filename, fullpath in snapshot.missing()
+            if (filename, fullpath) in removed_files or any(fullpath.startswith(d) for d in removed_dirs)
+        ])
+
+    def __parse_parallel(self, dirpath: str, workers: int, snapshot: "_IndexSnapshot") -> Generator[List["IndexEntry"], None, None]:
+        """
+        Pipelined walk of `dirpath`. A walker thread feeds chunks of paths to a
+        pool of worker processes which extract the names; parsed chunks are
+        yielded to this thread, the only one touching the connection, for
+        writing. The stages are joined by bounded queues so a fast walker can't
+        outrun the writer.
+        """
+        stop = threading.Event()
+        chunks: queue.Queue = queue.Queue(maxsize=workers * 2)
+        parsed: queue.Queue = queue.Queue(maxsize=workers * 2)
+
+        def walk() -> None:
+            last_item: Any = _PIPELINE_DONE
+            try:
+                chunk: List[IndexEntry] = []
+                for entry in self.__timed(self.__walk(dirpath, snapshot), Stage.WALK):
+                    chunk.append(entry)
+                    if len(chunk) >= PARSE_CHUNK_SIZE:
+                        _put(chunks, chunk, stop)
+                        chunk = []
+                if chunk:
+                    _put(chunks, chunk, stop)
+            except BaseException as e:
+                last_item = e
+            finally:
+                _put(chunks, last_item, stop)
+
+        def feed(pool: ProcessPoolExecutor) -> None:
+            try:
+                while (item := _get(chunks, stop)) is not None:
+                    if item is _PIPELINE_DONE or isinstance(item, BaseException):
+                        _put(parsed, item, stop)
+                        return
+                    _put(parsed, (item, pool.submit(_parse_chunk, item)), stop)
+            except BaseException as e:
+                _put(parsed, e, stop)
+
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_parse_worker,
+            initargs=(self.locales, tuple(self.extensions), self.lexicon_dir)
         )
-        return tuple(PersonIndexRecord.from_sqlite_record(row) for row in cursor.execute(query).fetchall())
-    
-    def search_files(self, searchterm: str) -> Union[tuple[FileIndexRecord, ...], tuple]:
-        cursor = self.conn.cursor()
-        query = f"SELECT id, filename, fullpath, review, rating FROM files WHERE filename LIKE '%{searchterm}%'"
-        return tuple(FileIndexRecord(*row) for row in cursor.execute(query).fetchall())
+        walker = threading.Thread(target=walk, name="indexerdem-walker", daemon=True)
+        feeder = threading.Thread(target=feed, args=(pool,), name="indexerdem-feeder", daemon=True)
+        walker.start()
+        feeder.start()
+        try:
+            while (item := _get(parsed, stop)) not in (None, _PIPELINE_DONE):
+                if isinstance(item, BaseException):
+                    raise item
+                chunk, future = item
+                try:
+                    results = future.result()
+                except Exception:
+                    logger.exception("Parse worker failed, parsing %d files on the writer." % len(chunk))
+                    results = chunk
+                yield results
+        finally:
+            stop.set()
+            walker.join()
+            feeder.join()
+            pool.shutdown(cancel_futures=True)
 
-    def search_performers(self, searchterm: str) -> Union[tuple[PersonIndexRecord, ...], tuple]:
-        cursor = self.conn.cursor()
-        query = f"SELECT * FROM persons WHERE firstname LIKE '%{searchterm}%' OR lastname LIKE '%{searchterm}%'"
-        return tuple(PersonIndexRecord(*row) for row in cursor.execute(query).fetchall())
+@dataclass
+class IndexEntry:
+    """
+    A file about to be written to the index.
+    """
+    filename: str
+    fullpath: str
+    # `None` when the file has not been parsed yet.
+    names: Optional[List[NameTuple]] = None
+    stat: Optional[FileStat] = None
+    # The id of the indexed file this entry is a move of, if any.
+    moved_from: Optional[int] = None
+
+@dataclass
+class IndexResult:
+    """
+    What became of a single file handed to the indexer.
+    """
+    filename: str
+    fullpath: str
+    # `None` if the file could not be indexed; see `error`.
+    file_id: Optional[int]
+    names: List[NameTuple]
+    # Ids of the persons first created for this file and of those that were
+    # already in the index.
+    new_persons: List[int] = field(default_factory=list)
+    existing_persons: List[int] = field(default_factory=list)
+    moved_from: Optional[int] = None
+    # This file's share of the time spent committing its batch.
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+@dataclass
+class IndexProgress:
+    """
+    Running totals of an `iter_index` run.
+    """
+    # Files handed to the writer, which includes those still in flight.
+    queued: int = 0
+    indexed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    missing: int = 0
+    names: int = 0
+    new_persons: int = 0
+    # Filenames whose names came out of, or missed, the `NameMemo`.
+    memo_hits: int = 0
+    memo_misses: int = 0
+    started: float = field(default_factory=time.monotonic)
+    elapsed: float = 0.0
+    done: bool = False
+
+    def add(self, result: IndexResult) -> None:
+        if result.error is None:
+            self.indexed += 1
+        else:
+            self.failed += 1
+        self.names += len(result.names)
+        self.new_persons += len(result.new_persons)
+
+    def snapshot(self) -> "IndexProgress":
+        self.elapsed = time.monotonic() - self.started
+        return replace(self)
+
+    @property
+    def files_per_second(self) -> float:
+        return self.indexed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.indexed} files indexed ({self.files_per_second:.0f}/s), {self.failed} failed, "
+            f"{self.skipped} unchanged, {self.missing} missing, {self.new_persons} new persons, "
+            f"{self.memo_hits}/{self.memo_hits + self.memo_misses} names memoized"
+            f"{' (done)' if self.done else ''}"
+        )
+
+class PersonCache(object):
+    """
+    Maps `(firstname, lastname)` to the persons in the index so that name
+    resolution while indexing is a dict lookup.
+
+    A warm cache holds every person, so a miss means the person doesn't exist
+    yet. A cold cache looks misses up in the index and remembers the answer.
+
+    Persons added since the last `commit` can be forgotten with `rollback_to`
+    when the transaction that inserted them is rolled back.
+    """
+
+    def __init__(self):
+        self.persons: dict[Tuple[str, Optional[str]], PersonIndexRecord] = {}
+        self.is_warm = False
+        self.journal: List[Tuple[str, Optional[str]]] = []
+
+    def warm(self, cursor) -> None:
+        for person in PersonIndexRecord.hydrate(cursor, f"SELECT {PersonIndexRecord.COLUMNS} FROM persons ORDER BY id"):
+            self.persons.setdefault((person.firstname, person.lastname), person)
+        self.is_warm = True
+
+    def find(self, cursor, firstname: str, lastname: Optional[str]) -> Optional[PersonIndexRecord]:
+        key = (firstname, lastname)
+        if key in self.persons or self.is_warm:
+            return self.persons.get(key)
+
+        person = PersonIndexRecord.find_by_name(cursor, firstname, lastname)
+        if person is not None:
+            self.add(person)
+        return person
+
+    def add(self, person: PersonIndexRecord) -> None:
+        key = (person.firstname, person.lastname)
+        self.persons[key] = person
+        self.journal.append(key)
+
+    def mark(self) -> int:
+        return len(self.journal)
+
+    def rollback_to(self, mark: int) -> None:
+        for key in self.journal[mark:]:
+            self.persons.pop(key, None)
+        del self.journal[mark:]
+
+    def commit(self) -> None:
+        self.journal.clear()
+
+class _IndexSnapshot(object):
+    """
+    What the index knows about the files under `root`, loaded in a single scan
+    before a walk. The walker consults this to decide which files need work and
+    afterwards to tell which files have gone missing.
+    """
+
+    COLUMNS = "id, filename, fullpath, size, mtime, inode, is_missing"
+
+    def __init__(self, cursor, root: str, skip_unchanged: bool, rows: Optional[Iterable[tuple]] = None):
+        """
+        Loads every file under `root`, unless given the `rows` to load
+        instead.
+        """
+        self.skip_unchanged = skip_unchanged
+        # (filename, fullpath) -> (id, stat, is_missing)
+        self.by_path: dict[Tuple[str, str], Tuple[int, FileStat, bool]] = {}
+        # inode -> (id, filename, fullpath, size)
+        self.by_inode: dict[int, Tuple[int, str, str, int]] = {}
+        self.seen: Set[int] = set()
+        # How many files `classify` found unchanged.
+        self.skipped = 0
+        if rows is None:
+            rows = cursor.execute(f"SELECT {_IndexSnapshot.COLUMNS} FROM files")
+        for file_id, filename, fullpath, size, mtime, inode, is_missing in rows:
+            if not fullpath.startswith(root):
+                continue
+            self.by_path[(filename, fullpath)] = (file_id, (size, mtime, inode), bool(is_missing))
+            if inode is not None:
+                self.by_inode[inode] = (file_id, filename, fullpath, size)
+
+    @staticmethod
+    def of_changes(cursor, fullpaths: Iterable[str], inodes: Iterable[int], subtrees: Iterable[str]) -> "_IndexSnapshot":
+        """
+        Only the files directly in one of the directories `fullpaths`, with one
+        of `inodes` or anywhere under one of `subtrees`. That is all `classify`
+        and `missing` need to know about for a handful of changes to those.
+        """
+        rows: Dict[int, tuple] = {}
+        for column, values in (("fullpath", list(fullpaths)), ("inode", list(inodes))):
+            for chunk in chunked(values):
+                query = f"SELECT {_IndexSnapshot.COLUMNS} FROM files WHERE {column} IN ({','.join('?' * len(chunk))})"
+                rows.update((row[0], row) for row in cursor.execute(query, chunk))
+        for subtree in subtrees:
+            query = f"SELECT {_IndexSnapshot.COLUMNS} FROM files WHERE substr(fullpath, 1, ?)=?"
+            rows.update((row[0], row) for row in cursor.execute(query, (len(subtree), subtree)))
+        return _IndexSnapshot(cursor, "", True, rows.values())
+
+    def classify(self, filename: str, root: str, stat: FileStat) -> Optional[IndexEntry]:
+        """
+        Return the entry to index for the file, or `None` if it is unchanged
+        since the last run and can be skipped.
+        """
+        canon_root = root if root.endswith(os.path.sep) else f"{root}{os.path.sep}"
+        known = self.by_path.get((filename, canon_root))
+        if known is not None:
+            file_id, known_stat, is_missing = known
+            self.seen.add(file_id)
+            if self.skip_unchanged and known_stat == stat and not is_missing:
+                self.skipped += 1
+                return None
+            return IndexEntry(filename, root, stat=stat)
+
+        candidate = self.by_inode.get(stat[2])
+        if candidate is not None:
+            file_id, old_filename, old_fullpath, size = candidate
+            is_move = (
+                file_id not in self.seen and
+                size == stat[0] and
+                not os.path.exists(os.path.join(old_fullpath, old_filename))
+            )
+            if is_move:
+                self.seen.add(file_id)
+                return IndexEntry(filename, root, stat=stat, moved_from=file_id)
+
+        return IndexEntry(filename, root, stat=stat)
+
+    def missing(self) -> List[Tuple[int, str, str]]:
+        """
+        Files known to be under the root which were neither seen nor moved
+        during the walk and are not flagged missing yet.
+        """
+        return [
+            (file_id, filename, fullpath)
+            for (filename, fullpath), (file_id, _, is_missing) in self.by_path.items()
+            if file_id not in self.seen and not is_missing
+        ]
+
+class _Batcher(object):
+    """
+    Accumulates parsed entries and hands them to `commit` whenever the batch is
+    full or, if `batch_seconds` is set, has been open for too long.
+    """
+
+    def __init__(self, commit: Callable[[List[IndexEntry]], List["IndexResult"]], batch_size: int, batch_seconds: Optional[float]):
+        self.commit = commit
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.pending: List[IndexEntry] = []
+        # Results of the batches committed since the last `drain`.
+        self.done: List[IndexResult] = []
+        self.batch_start = time.monotonic()
+
+    def add(self, entries: Iterable[IndexEntry]) -> None:
+        for entry in entries:
+            if not self.pending:
+                self.batch_start = time.monotonic()
+            self.pending.append(entry)
+
+            is_batch_stale = (
+                self.batch_seconds is not None and
+                time.monotonic() - self.batch_start >= self.batch_seconds
+            )
+            if len(self.pending) >= self.batch_size or is_batch_stale:
+                self.flush()
+
+    def flush(self) -> None:
+        pending, self.pending = self.pending, []
+        self.done.extend(self.commit(pending))
+
+    def drain(self) -> List["IndexResult"]:
+        done, self.done = self.done, []
+        return done
+
+_PIPELINE_DONE = object()
+# How many paths a parse worker receives at a time.
+PARSE_CHUNK_SIZE = 256
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> None:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+def _get(q: queue.Queue, stop: threading.Event) -> Any:
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+# Set once per worker process by `_init_parse_worker`.
+_parse_worker: Optional[Indexerdem] = None
+
+def _init_parse_worker(locales: Tuple[str, ...], extensions: Tuple[str, ...], lexicon_dir: Optional[str]) -> None:
+    global _parse_worker
+    _parse_worker = Indexerdem(":memory:", locales, extensions, lexicon_dir)
+
+def _parse_chunk(chunk: List[IndexEntry]) -> List[IndexEntry]:
+    indexer = cast(Indexerdem, _parse_worker)
+    for entry, names in zip(chunk, indexer.parse_many(entry.filename for entry in chunk)):
+        entry.names = names
+    return chunk
+
+def _index_shard(shard: Shard, indexer_args: Dict[str, Any], readdir_args: Dict[str, Any]) -> None:
+    indexer = Indexerdem(shard.index_filename, **indexer_args)
+    indexer.init()
+    indexer.readdir(shard.root, **readdir_args)
+
+def index_shards(
+    shard_set: ShardSet,
+    processes: Optional[int] = None,
+    indexer_args: Optional[Dict[str, Any]] = None,
+    **readdir_args: Any
+) -> None:
+    """
+    Index every root of `shard_set` into its own shard, each in a process of
+    its own, up to `processes` at a time (all of them by default). Shards
+    don't share a write lock, so none of them waits on another.
+
+    `indexer_args` are passed on to every `Indexerdem` and `readdir_args` to
+    every `readdir`.
+    """
+    with ProcessPoolExecutor(max_workers=processes or len(shard_set), mp_context=get_context("spawn")) as pool:
+        futures = {
+            pool.submit(_index_shard, shard, indexer_args or {}, readdir_args): shard for shard in shard_set.shards
+        }
+        for future in as_completed(futures):
+            future.result()
+            shard = futures[future]
+            logger.info("Indexed %s into %s." % (shard.root, shard.index_filename))
 
 if __name__ == "__main__":
     parser = ArgumentParser(description="indexer for erdem.")
     parser.add_argument(
-        "--filepath", "-f", required=True, type=str,
-        help="The full filepath of the directory to index."
+        "--filepath", "-f", required=True, type=str, action="append",
+        help="The full filepath of the directory to index. May be given more than once with --shard-dir."
+    )
+    parser.add_argument(
+        "--shard-dir", type=str, default=None,
+        help="Index every --filepath into an index of its own in this directory, all at the same time."
     )
     parser.add_argument(
         "--locales", "-l", type=str, default="en,en_GB,en_US,en_NZ",
@@ -374,7 +1315,106 @@ if __name__ == "__main__":
         # TODO Ensure overwrite guarantee is true!
         help="filepath to output file. An existing file will be appended to."
     )
+    parser.add_argument(
+        "--batch-size", "-b", type=int, default=1,
+        help="Number of files committed per transaction."
+    )
+    parser.add_argument(
+        "--batch-seconds", type=float, default=None,
+        help="Commit a batch once it has been accumulating for this many seconds, even if it is not yet full."
+    )
+    parser.add_argument(
+        "--full", action="store_true",
+        help="Re-process every file, even those unchanged since the last run."
+    )
+    parser.add_argument(
+        "--workers", "-w", type=int, default=0,
+        help="Number of worker processes used to extract names. 0 does everything in a single process."
+    )
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="Keep running and index changes to the directory as they happen."
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=30.0,
+        help="With --watch, seconds between rescans when inotify is unavailable."
+    )
+    parser.add_argument(
+        "--skip-hidden", action="store_true",
+        help="Leave out files and directories whose names start with a dot."
+    )
+    parser.add_argument(
+        "--skip-dir", action="append", default=[],
+        help="Leave out directories with this name. May be given more than once."
+    )
+    parser.add_argument(
+        "--min-size", type=int, default=None,
+        help="Leave out files smaller than this many bytes."
+    )
+    parser.add_argument(
+        "--max-size", type=int, default=None,
+        help="Leave out files larger than this many bytes."
+    )
+    parser.add_argument(
+        "--follow-symlinks", action="store_true",
+        help="Descend into symlinked directories. Symlink loops are skipped."
+    )
+    parser.add_argument(
+        "--storage", choices=sorted(STORAGE_PROFILES), default="default",
+        help="Connection profile. 'concurrent' switches the index to WAL so it can be browsed while indexing."
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Print how long each stage of indexing took once done."
+    )
+    parser.add_argument(
+        "--profile-json", type=str, default=None,
+        help="Write how long each stage of indexing took to this file once done."
+    )
     args = vars(parser.parse_args())
-    indexer: Indexerdem = Indexerdem(args["output"], args["locales"].split(","), Indexerdem.DEFAULT_EXTENSIONS)
+    if len(args["filepath"]) > 1 and args["shard_dir"] is None:
+        parser.error("indexing more than one --filepath takes --shard-dir")
+    if args["watch"] and args["shard_dir"] is not None:
+        parser.error("--watch can't be combined with --shard-dir")
+    prune_rules = PruneRules(
+        skip_hidden=args["skip_hidden"],
+        skip_dirs=frozenset(args["skip_dir"]),
+        min_size=args["min_size"],
+        max_size=args["max_size"],
+        follow_symlinks=args["follow_symlinks"]
+    )
+    if args["shard_dir"] is not None:
+        os.makedirs(args["shard_dir"], exist_ok=True)
+        index_shards(
+            ShardSet.from_roots(args["shard_dir"], args["filepath"]),
+            indexer_args={
+                "locales": args["locales"].split(","),
+                "prune_rules": prune_rules,
+                "storage": STORAGE_PROFILES[args["storage"]],
+            },
+            batch_size=args["batch_size"],
+            batch_seconds=args["batch_seconds"],
+            workers=args["workers"],
+            incremental=not args["full"]
+        )
+        sys.exit(0)
+    indexer: Indexerdem = Indexerdem(
+        args["output"],
+        args["locales"].split(","),
+        Indexerdem.DEFAULT_EXTENSIONS,
+        prune_rules=prune_rules,
+        storage=STORAGE_PROFILES[args["storage"]]
+    )
+    if args["profile"] or args["profile_json"]:
+        indexer.add_hook(StageTimer(sys.stderr if args["profile"] else None, args["profile_json"]))
     indexer.init()
-    indexer.readdir(args["filepath"])
+    if args["watch"]:
+        indexer.watch(args["filepath"][0], poll_interval=args["poll_interval"])
+    else:
+        indexer.readdir(
+            args["filepath"][0],
+            batch_size=args["batch_size"],
+            batch_seconds=args["batch_seconds"],
+            workers=args["workers"],
+            incremental=not args["full"]
+        )
@@ -0,0 +1,154 @@
+"""
+Precompiled name lexicons.
+
+Building the first and last name sets means importing Faker's person provider
+for every locale, which dominates the startup time of the indexer. The merged
+sets are therefore compiled once into a small msgpack file and loaded from
+there on every later run. A lexicon file is only ever used for the exact
+Faker version and locale list it was built from.
+"""
+from argparse import ArgumentParser
+from collections import OrderedDict
+from dataclasses import dataclass
+from importlib import import_module
+from importlib.metadata import PackageNotFoundError, version
+from typing import Iterable, Optional, Set, Tuple, Union
+
+import hashlib
+import logging
+import msgpack # type: ignore[import-untyped]
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout of the file changes.
+LEXICON_FORMAT = 1
+
+@dataclass
+class Lexicon:
+    first_names: Set[str]
+    last_names: Set[str]
+
+def faker_version() -> str:
+    # Read from the package metadata so that Faker itself is not imported.
+    try:
+        return version("Faker")
+    except PackageNotFoundError:
+        return "unknown"
+
+def lexicon_key(locales: Iterable[str]) -> Tuple:
+    return (LEXICON_FORMAT, faker_version(), sorted(set(locales)))
+
+def default_lexicon_dir() -> str:
+    """
+    `$ERDEM_LEXICON_DIR` if set, otherwise `erdem` under the user's cache
+    directory.
+    """
+    configured = os.environ.get("ERDEM_LEXICON_DIR")
+    if configured:
+        return configured
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "erdem")
+
+def lexicon_path(locales: Iterable[str], directory: Optional[str] = None) -> str:
+    key = repr(lexicon_key(locales)).encode("utf-8")
+    digest = hashlib.sha1(key).hexdigest()[:16]
+    return os.path.join(directory or default_lexicon_dir(), f"lexicon-{digest}.msgpack")
+
+def _extract_names(faker_listings: Union[OrderedDict, Tuple]) -> Set[str]:
+    if isinstance(faker_listings, tuple):
+        return set(faker_listings)
+    elif isinstance(faker_listings, OrderedDict):
+        return set(faker_listings.keys())
+    else:
+        raise TypeError("We can only operate with OrderedDicts or tuples. Given: %s" % type(faker_listings))
+
+def build_lexicon(locales: Iterable[str]) -> Lexicon:
+    """
+    Build the lexicon straight from Faker's person providers.
+    """
+    lexicon = Lexicon(set(), set())
+    for loc in locales:
+        person_providers_module = import_module("faker.providers.person.%s" % loc)
+        lexicon.first_names |= _extract_names(person_providers_module.Provider.first_names_female) # type: ignore
+        lexicon.last_names |= _extract_names(person_providers_module.Provider.last_names) # type: ignore
+        lexicon.last_names |= _extract_names(person_providers_module.Provider.first_names_male) # type: ignore
+    return lexicon
+
+def save_lexicon(lexicon: Lexicon, locales: Iterable[str], path: str) -> None:
+    """
+    Write `lexicon` to `path`. The file is written next to its final location
+    and moved into place so concurrent readers never see half of it.
+    """
+    payload = msgpack.packb(
+        {
+            "key": list(lexicon_key(locales)),
+            "first_names": sorted(lexicon.first_names),
+            "last_names": sorted(lexicon.last_names),
+        }
+    )
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp:
+            temp.write(payload)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def read_lexicon(locales: Iterable[str], path: str) -> Optional[Lexicon]:
+    """
+    Read the lexicon at `path`, or `None` if there isn't one or it was built
+    from a different Faker version or locale list.
+    """
+    try:
+        with open(path, "rb") as lexicon_file:
+            data = msgpack.unpackb(lexicon_file.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, msgpack.UnpackException) as e:
+        logger.warning("Ignoring unreadable lexicon %s: %s" % (path, e))
+        return None
+
+    if not isinstance(data, dict) or data.get("key") != list(lexicon_key(locales)):
+        return None
+    return Lexicon(set(data["first_names"]), set(data["last_names"]))
+
+def load_lexicon(locales: Iterable[str], directory: Optional[str] = None) -> Lexicon:
+    """
+    Load the precompiled lexicon for `locales`, building and saving it first
+    if needed. Failing to save is not fatal; the lexicon is simply rebuilt on
+    the next run.
+    """
+    locales = tuple(locales)
+    path = lexicon_path(locales, directory)
+    lexicon = read_lexicon(locales, path)
+    if lexicon is not None:
+        return lexicon
+
+    lexicon = build_lexicon(locales)
+    try:
+        save_lexicon(lexicon, locales, path)
+    except OSError as e:
+        logger.warning("Could not save the lexicon to %s: %s" % (path, e))
+    return lexicon
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="precompile the name lexicon used by the erdem indexer.")
+    parser.add_argument(
+        "--locales", "-l", type=str, default="en,en_GB,en_US,en_NZ",
+        help="Comma-separated list of locales that we will use to detect names."
+    )
+    parser.add_argument(
+        "--output-dir", "-o", type=str, default=None,
+        help="Where to write the lexicon. Defaults to $ERDEM_LEXICON_DIR or the user's cache directory."
+    )
+    args = parser.parse_args()
+    locales = args.locales.split(",")
+    path = lexicon_path(locales, args.output_dir)
+    lexicon = build_lexicon(locales)
+    save_lexicon(lexicon, locales, path)
+    print(f"Wrote {len(lexicon.first_names)} first names and {len(lexicon.last_names)} last names to {path}")
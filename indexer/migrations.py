@@ -0,0 +1,198 @@
+"""
+In-place upgrades of existing indices.
+
+Every change to the layout of the index is a `Migration` to the index version
+it introduces. `migrate` brings an index up to `IndexReader.INDEX_VERSION` by
+applying whatever migrations are newer than the version recorded in its
+metadata, each in a transaction of its own, so an upgrade never needs a full
+re-index. Migrations must be safe to apply to an index that already has their
+changes; new indices are created by applying all of them.
+
+To upgrade an index without indexing anything:
+
+    python -m indexer.migrations -i cache.db
+"""
+from .errors import MigrationError
+
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class Migration:
+    # The index version this migration upgrades to.
+    version: str
+    description: str
+    apply: Callable[[sqlite3.Cursor], None]
+
+def parse_version(version: str) -> Tuple[int, ...]:
+    """
+    Raises `ValueError` for anything that isn't a dotted list of integers.
+    """
+    return tuple(int(part) for part in version.split("."))
+
+def _add_file_stats(cursor: sqlite3.Cursor) -> None:
+    # (column, definition) of the stats incremental indexing relies on.
+    file_stat_columns = (
+        ("size", "INTEGER"),
+        ("mtime", "INTEGER"),
+        ("inode", "INTEGER"),
+        ("is_missing", "TINYINT DEFAULT 0 NOT NULL"),
+    )
+    file_columns = set(row[1] for row in cursor.execute("PRAGMA table_info(files)"))
+    for column, definition in file_stat_columns:
+        if column not in file_columns:
+            cursor.execute(f"ALTER TABLE files ADD COLUMN {column} {definition}")
+
+def _index_participation_by_file(cursor: sqlite3.Cursor) -> None:
+    # UNIQUE(person_id, file_id) already serves lookups by person. Looking up
+    # the performers of a file, as the TUI and the backend do for every file
+    # shown, was a full scan. Covering, so the table itself is never read.
+    #
+    # Lookups of persons by name and of files by filename need nothing new:
+    # UNIQUE(firstname, lastname) and UNIQUE(filename) make those a search
+    # and SQLite prefers them over any other index on the same columns.
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS participation_by_file ON participation (file_id, person_id, is_certain)"
+    )
+
+def has_trigram_search(cursor: sqlite3.Cursor) -> bool:
+    """
+    Whether this SQLite has FTS5 and its trigram tokenizer (3.34 and later).
+    """
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(probe, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return False
+    cursor.execute("DROP TABLE temp.trigram_probe")
+    return True
+
+# (search table, content table, indexed columns)
+SEARCH_TABLES = (
+    ("files_search", "files", ("filename",)),
+    ("persons_search", "persons", ("firstname", "lastname")),
+)
+
+def fill_search(cursor: sqlite3.Cursor, search_table: str) -> None:
+    """
+    (Re)index all of the table `search_table` covers.
+    """
+    table, columns = next((table, columns) for name, table, columns in SEARCH_TABLES if name == search_table)
+    column_list = ", ".join(columns)
+    cursor.execute(f"INSERT INTO {search_table} ({search_table}) VALUES ('delete-all')")
+    # Unlike the 'rebuild' command, this keeps SQLite from reading the rows
+    # through a covering index, in whatever order that has. FTS5 takes rows in
+    # rowid order more than twice as fast.
+    cursor.execute(
+        f"INSERT INTO {search_table} (rowid, {column_list}) SELECT id, {column_list} FROM {table} ORDER BY id"
+    )
+
+def search_triggers(search_table: str) -> Dict[str, str]:
+    """
+    The statements creating the triggers that keep `search_table` in sync with
+    the table it covers, by trigger name, as SQLite records them.
+    """
+    table, columns = next((table, columns) for name, table, columns in SEARCH_TABLES if name == search_table)
+    column_list = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    return {
+        f"{search_table}_insert": f"""CREATE TRIGGER {search_table}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {search_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END""",
+        f"{search_table}_delete": f"""CREATE TRIGGER {search_table}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {search_table} ({search_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            END""",
+        f"{search_table}_update": f"""CREATE TRIGGER {search_table}_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+                INSERT INTO {search_table} ({search_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                INSERT INTO {search_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+            END""",
+    }
+
+def _add_search(cursor: sqlite3.Cursor) -> None:
+    # Trigrams keep the substring semantics of the LIKE '%term%' searches this
+    # replaces. The tables only hold the index; the text stays in the tables
+    # they cover and triggers keep the two in sync.
+    if not has_trigram_search(cursor):
+        logger.warning("This SQLite has no FTS5 trigram tokenizer; searches will scan the index.")
+        return
+    for search_table, table, columns in SEARCH_TABLES:
+        column_list = ", ".join(columns)
+        cursor.execute(
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {search_table}
+            USING fts5({column_list}, content='{table}', content_rowid='id', tokenize='trigram')"""
+        )
+        for trigger in search_triggers(search_table).values():
+            cursor.execute(trigger.replace("CREATE TRIGGER", "CREATE TRIGGER IF NOT EXISTS", 1))
+        fill_search(cursor, search_table)
+
+MIGRATIONS: Tuple[Migration, ...] = (
+    Migration("2.0", "Track file stats for incremental indexing", _add_file_stats),
+    Migration("2.1", "Index participation by file", _index_participation_by_file),
+    Migration("2.2", "Add full-text search over filenames and names", _add_search),
+)
+
+def pending_migrations(version: Optional[str]) -> List[Migration]:
+    """
+    The migrations an index at `version` still needs, oldest first. All of
+    them when `version` is `None`.
+    """
+    if version is None:
+        return list(MIGRATIONS)
+    current = parse_version(version)
+    return [migration for migration in MIGRATIONS if parse_version(migration.version) > current]
+
+def _fetch_version(cursor: sqlite3.Cursor) -> Optional[str]:
+    row = cursor.execute("SELECT val FROM __metadata WHERE key='index_version' LIMIT 1").fetchone()
+    return row[0] if row is not None else None
+
+def migrate(conn: sqlite3.Connection) -> List[Migration]:
+    """
+    Upgrade the index behind `conn` in place and return the migrations that
+    were applied. An index without a recorded version gets every migration.
+
+    Raises `MigrationError` should a migration fail, and `ValueError` if the
+    recorded version can't be parsed.
+    """
+    cursor = conn.cursor()
+    applied: List[Migration] = []
+    for migration in pending_migrations(_fetch_version(cursor)):
+        if not conn.in_transaction:
+            cursor.execute("BEGIN")
+        try:
+            migration.apply(cursor)
+            cursor.execute(
+                """INSERT INTO __metadata (key, val) VALUES ('index_version', ?)
+                ON CONFLICT(key) DO UPDATE SET val=excluded.val""",
+                (migration.version,)
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise MigrationError(migration.version, e) from e
+        logger.info("Migrated the index to %s: %s" % (migration.version, migration.description))
+        applied.append(migration)
+    return applied
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="upgrade an erdem index in place.")
+    parser.add_argument("--index", "-i", type=str, default="cache.db", help="The index to upgrade.")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the migrations that would be applied.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    conn = sqlite3.connect(args.index)
+    try:
+        if args.dry_run:
+            for migration in pending_migrations(_fetch_version(conn.cursor())):
+                print(f"{migration.version}: {migration.description}")
+        else:
+            applied = migrate(conn)
+            print(f"Applied {len(applied)} migration(s).")
+    finally:
+        conn.close()
@@ -0,0 +1,187 @@
+from .data import NameDecisionRule, NameTuple
+
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import re
+
+NONWORD: re.Pattern = re.compile(r"[\W\_]+")
+DIGITS: re.Pattern = re.compile(r"[0-9]")
+# Masks the digits of a UTF-8 encoded string for `NameMemo` keys. Bytes of
+# multibyte characters are never in the ASCII range so they are left alone.
+DIGIT_MASK = bytes.maketrans(b"0123456789", b"0000000000")
+
+class NameMemo(object):
+    """
+    Bounded LRU memo of the names found in a string, keyed on the string with
+    its digits masked.
+
+    Digits are never part of a name in the lexicon, so strings that differ
+    only in their digits tokenize and match the same way: "Show S01E01 Jane
+    Doe" and "Show S01E02 Jane Doe" share one entry. Each digit is masked on
+    its own, so "720p" and "1080p" still make different keys. The only exception is
+    when a digit-bearing token ends up in a name, e.g. via
+    `LASTNAME_BACKWARD`; such results are never stored.
+
+    Keying, looking up and storing a string that misses costs about half as
+    much again as scanning it, so the memo only pays off on libraries with
+    runs of such strings. Every `WINDOW` lookups, if fewer than `MIN_HITS` of
+    them hit, the memo rests for the next `REST` strings: they are scanned
+    without going through it at all and count as misses. A run over a library
+    of one-off filenames then only keys one string in sixteen.
+    """
+
+    WINDOW = 1024
+    MIN_HITS = 64
+    REST = 15 * WINDOW
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: OrderedDict[bytes, Tuple[NameTuple, ...]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.__window = 0
+        self.__window_hits = 0
+        self.__rest = 0
+
+    def resting(self) -> bool:
+        """
+        Whether the next string should skip the memo. If so, it is counted as a
+        miss.
+        """
+        if self.__rest:
+            self.__rest -= 1
+            self.misses += 1
+            return True
+        return False
+
+    @staticmethod
+    def key(haystack: str) -> bytes:
+        # Way cheaper than masking the str.
+        return haystack.encode("utf-8", "surrogatepass").translate(DIGIT_MASK)
+
+    def get(self, key: bytes) -> Optional[Tuple[NameTuple, ...]]:
+        names = self.entries.get(key)
+        if names is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.__window_hits += 1
+            self.entries.move_to_end(key)
+        self.__window += 1
+        if self.__window == NameMemo.WINDOW:
+            if self.__window_hits < NameMemo.MIN_HITS:
+                self.__rest = NameMemo.REST
+            self.__window = 0
+            self.__window_hits = 0
+        return names
+
+    def put(self, key: bytes, names: List[NameTuple]) -> None:
+        if any(DIGITS.search(name[0]) or (name[1] and DIGITS.search(name[1])) for name in names):
+            return
+        self.entries[key] = tuple(names)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class NameMatcher(object):
+    """
+    Finds person names in a string using a lexicon of first and last names.
+
+    This is the scan the indexer has always used: the string is split into
+    words and a first name followed by a last name makes a name. First names
+    followed by more first names are read on as middle names, as long as a
+    last name comes after them, so "Mary Jane Watson" comes out whole.
+
+    Names that can't be completed fall back to the same rules as ever: a lone
+    first name is `TRUNCATED_FIRSTNAME` and a lone last name takes the word
+    before it as `LASTNAME_BACKWARD`.
+    """
+
+    # The longest name we will try to read, middle names included.
+    MAX_NAME_TOKENS = 4
+    # How many filenames `NameMemo` remembers the names of.
+    MEMO_SIZE = 65_536
+
+    def __init__(self, first_names: Iterable[str], last_names: Iterable[str], memo_size: int = MEMO_SIZE):
+        # Words are title-cased before they are looked up so the lexicon must
+        # be too.
+        self.first_names = frozenset(name.title() for name in first_names)
+        self.last_names = frozenset(name.title() for name in last_names)
+        self.memo: Optional[NameMemo] = NameMemo(memo_size) if memo_size > 0 else None
+
+    def find(self, haystack: str) -> List[NameTuple]:
+        memo = self.memo
+        if memo is None or memo.resting():
+            return self.__scan(haystack)
+        key = memo.key(haystack)
+        memoized = memo.get(key)
+        if memoized is not None:
+            return list(memoized)
+        names = self.__scan(haystack)
+        memo.put(key, names)
+        return names
+
+    def find_many(self, haystacks: Iterable[str]) -> List[List[NameTuple]]:
+        """
+        `find` for each of `haystacks`.
+        """
+        return [self.find(haystack) for haystack in haystacks]
+
+    def __scan(self, haystack: str) -> List[NameTuple]:
+        # Title-casing the whole string in one go is a lot cheaper than doing
+        # it word by word and comes out the same: every word starts after a
+        # separator, which has no case.
+        words: List[str] = NONWORD.split(haystack.title())
+        first_names = self.first_names
+        last_names = self.last_names
+        names: List[NameTuple] = []
+        i = 0
+        limit = len(words)
+
+        while i < limit:
+            word = words[i]
+
+            if word in first_names:
+                forward = i + 1
+                following = words[forward] if forward < limit else ""
+                # Middle names only count if a last name follows them.
+                while following in first_names and following not in last_names and forward - i < NameMatcher.MAX_NAME_TOKENS - 1:
+                    forward += 1
+                    following = words[forward] if forward < limit else ""
+                if following in last_names:
+                    if forward == i + 1:
+                        firstname = word.capitalize()
+                    else:
+                        firstname = " ".join([middle.capitalize() for middle in words[i:forward]])
+                    names.append(
+                        (
+                            firstname,
+                            following.capitalize(),
+                            NameDecisionRule.ALMOST_CERTAIN
+                        )
+                    )
+                    i = forward + 1
+                    continue
+                names.append(
+                    (
+                        word.capitalize(),
+                        None,
+                        NameDecisionRule.TRUNCATED_FIRSTNAME
+                    )
+                )
+            elif word in last_names and i > 0 and words[i - 1]:
+                names.append(
+                    (
+                        words[i - 1].capitalize(),
+                        word.capitalize(),
+                        NameDecisionRule.LASTNAME_BACKWARD
+                    )
+                )
+
+            i += 1
+
+        return names
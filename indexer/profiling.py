@@ -0,0 +1,94 @@
+"""
+Hooks for profiling the indexer.
+
+`Indexerdem` reports the wall time of every stage of its hot path to the hooks
+added with `Indexerdem.add_hook`. `StageTimer` is the stock hook; it tallies
+the time, calls and files per stage and can print or save a summary. Anything
+else, say a collector feeding a metrics system, only has to implement
+`ProfilingHook`.
+"""
+from abc import ABC, abstractmethod
+from enum import StrEnum
+from typing import Dict, Optional, TextIO
+
+import json
+import threading
+
+class Stage(StrEnum):
+    WALK = "walk"
+    NORMALIZE = "normalize"
+    FIND_NAMES = "find-names"
+    PERSONS = "persons"
+    FILES = "files"
+    PARTICIPATION = "participation"
+    COMMIT = "commit"
+
+class ProfilingHook(ABC):
+
+    @abstractmethod
+    def record(self, stage: Stage, seconds: float, items: int) -> None:
+        """
+        Called every time the indexer leaves `stage`, having spent `seconds` in
+        it on `items` files. This may be called from more than one thread.
+        """
+        pass
+
+    def finished(self) -> None:
+        """
+        Called when a `readdir` or `iter_index` run completes.
+        """
+        pass
+
+class StageTimer(ProfilingHook):
+    """
+    Accumulates wall time, calls and files per stage. When `stream` or
+    `json_path` are given, a summary is written to them at the end of every
+    run.
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, json_path: Optional[str] = None):
+        self.stream = stream
+        self.json_path = json_path
+        self.lock = threading.Lock()
+        # stage -> [seconds, calls, items]
+        self.stages: Dict[Stage, list] = {}
+
+    def record(self, stage: Stage, seconds: float, items: int) -> None:
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+            totals[2] += items
+
+    def finished(self) -> None:
+        if self.stream is not None:
+            print(self.format_table(), file=self.stream)
+        if self.json_path is not None:
+            with open(self.json_path, "w") as json_file:
+                json.dump(self.summary(), json_file, indent=2)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stages.clear()
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        with self.lock:
+            return {
+                str(stage): {"seconds": seconds, "calls": calls, "items": items}
+                for stage, (seconds, calls, items) in self.stages.items()
+            }
+
+    def format_table(self) -> str:
+        summary = self.summary()
+        total = sum(row["seconds"] for row in summary.values())
+        lines = [f"{'stage':<14} {'seconds':>9} {'share':>7} {'calls':>9} {'files':>9} {'us/file':>9}"]
+        for stage in Stage:
+            row = summary.get(str(stage))
+            if row is None:
+                continue
+            share = row["seconds"] / total if total else 0.0
+            per_item = row["seconds"] / row["items"] * 1e6 if row["items"] else 0.0
+            lines.append(
+                f"{stage:<14} {row['seconds']:>9.3f} {share:>7.1%} {row['calls']:>9} {row['items']:>9} {per_item:>9.1f}"
+            )
+        return "\n".join(lines)
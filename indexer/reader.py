@@ -0,0 +1,351 @@
+"""
+The read side of the index.
+
+`IndexReader` answers queries against an existing index and nothing else. It
+doesn't load name lexicons or know how to write to the index, which keeps it
+cheap to construct for front-ends like the TUI. `Indexerdem` builds on it.
+"""
+from .data import FileIndexRecord, FileListing, MetadataRecord, PersonIndexRecord, PersonListing, starfields
+from .migrations import parse_version, pending_migrations
+from .cache import CacheStats
+from .storage import ConnectionManager, DEFAULT_PROFILE, StorageProfile
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import Enum, StrEnum
+from typing import cast, Generic, Iterator, Optional, Set, TypeVar, Union
+
+import sqlite3
+
+# The shortest term the full-text search can look up. Shorter ones fall back to
+# scanning.
+SEARCH_MIN_LENGTH = 3
+
+# `FileIndexRecord.LISTING_COLUMNS`, for queries joining other tables.
+LISTING_COLUMNS_OF_FILES = ",".join(f"files.{column}" for column in FileIndexRecord.LISTING_COLUMNS.split(","))
+
+# Records fetched per query when streaming.
+PAGE_SIZE = 500
+
+class FileOrder(StrEnum):
+    ID = "id"
+    # Filenames are unique, so they make a keyset of their own.
+    FILENAME = "filename"
+
+# What a listing is resumed after: the sort key of the last record seen, that
+# is, its id or its filename.
+ResumeToken = Union[int, str]
+
+Record = TypeVar("Record", FileIndexRecord, PersonIndexRecord)
+
+@dataclass(frozen=True)
+class Page(Generic[Record]):
+    records: tuple[Record, ...]
+    # Where the next page starts, or `None` if this is the last one.
+    resume_token: Optional[ResumeToken]
+
+class MetadataCheckResult(Enum):
+    COMPLETELY_COMPATIBLE = 1
+    LIKELY_COMPATIBLE = 2
+    INCOMPATIBLE = 3
+    INDETERMINATE = 4
+    # Older than the current index version but can be upgraded in place; see
+    # `indexer.migrations`.
+    MIGRATABLE = 5
+
+class IndexReader(object):
+
+    SQLITE_TRUE = 1
+    SQLITE_FALSE = 0
+
+    # The version of the index produced. This will be saved in the DB as
+    # metadata. The major version should guarantee compatibility with similar
+    # major versions of the indexer. The minor version represents changes that
+    # might produce inconsistencies when presenting the data; this usually means
+    # the code handling the data has changed assumptions somewhat. Schema
+    # changes are _always_ major version bumps.
+    #
+    # Every bump comes with a migration in `indexer.migrations`.
+    INDEX_VERSION = "2.2"
+
+    def __init__(
+        self,
+        index_filename: str,
+        read_only: bool = False,
+        storage: StorageProfile = DEFAULT_PROFILE,
+        cache_size: int = 0
+    ):
+        """
+        With `read_only`, the index is opened so that SQLite itself refuses any
+        writes. The index must then already exist.
+
+        `storage` sets up the connections; see `indexer.storage`. With a
+        positive `cache_size`, each connection keeps that many of the records
+        fetched by id in memory; see `indexer.cache`.
+
+        Queries are safe to run from any thread. Records can be fetched and
+        saved from any thread too, with a cursor from `reading` or `writing`:
+
+            with index.writing() as cursor:
+                record.save(cursor)
+        """
+        self.storage = storage
+        self.__search_tables: Set[str] = set()
+        self.connections = ConnectionManager(index_filename, storage, read_only, cache_size)
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        The writer connection. Only to be used by the thread that opened the
+        index or while holding `connections.write_lock`.
+        """
+        return self.connections.writer
+
+    @contextmanager
+    def reading(self) -> Iterator[sqlite3.Cursor]:
+        with self.connections.reading() as cursor:
+            yield cursor
+
+    @contextmanager
+    def writing(self) -> Iterator[sqlite3.Cursor]:
+        with self.connections.writing() as cursor:
+            yield cursor
+
+    def cache_stats(self) -> CacheStats:
+        return self.connections.cache_stats()
+
+    def check_compatibility(self) -> MetadataCheckResult:
+        try:
+            index_version = self.fetch_index_version()
+            if index_version is not None:
+                index_version_parse = index_version.val.split(".")
+                indexer_version_parse = IndexReader.INDEX_VERSION.split(".")
+
+                if index_version.val == IndexReader.INDEX_VERSION:
+                    return MetadataCheckResult.COMPLETELY_COMPATIBLE
+                elif self.__is_migratable(index_version.val):
+                    return MetadataCheckResult.MIGRATABLE
+                elif index_version_parse[0] == indexer_version_parse[0]:
+                    return MetadataCheckResult.LIKELY_COMPATIBLE
+                else:
+                    return MetadataCheckResult.INCOMPATIBLE
+            else:
+                return MetadataCheckResult.INDETERMINATE
+        except Exception as e:
+            return MetadataCheckResult.INDETERMINATE
+
+    def __is_migratable(self, version: str) -> bool:
+        try:
+            return (
+                parse_version(version) < parse_version(IndexReader.INDEX_VERSION) and
+                len(pending_migrations(version)) > 0
+            )
+        except ValueError:
+            return False
+
+    def fetch_index_version(self) -> Optional[MetadataRecord]:
+        """
+        Fetch the index version of the loaded index.
+        """
+        with self.reading() as cursor:
+            return MetadataRecord.fetch(cursor, "index_version")
+
+    def __sqliteify(self, b: bool) -> int:
+        return IndexReader.SQLITE_TRUE if b else IndexReader.SQLITE_FALSE
+
+    def fetch_review(self, id: int) -> Optional[str]:
+        with self.reading() as cursor:
+            row = cursor.execute("SELECT review FROM files WHERE id=? LIMIT 1", (id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def __file_without_review(self, cursor, row) -> FileIndexRecord:
+        return FileIndexRecord.without_review(row, self.fetch_review)
+
+    def fetch_files(self, limit: Optional[int] = None) -> tuple[FileIndexRecord, ...]:
+        """
+        The files in the index. Their reviews are only loaded once read, and
+        then from this index, so read them while it is open.
+        """
+        query = f"SELECT {FileIndexRecord.LISTING_COLUMNS} FROM files"
+        params: tuple = ()
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (limit,)
+        with self.reading() as cursor:
+            return tuple(FileIndexRecord.hydrate(cursor, query, params, self.__file_without_review))
+
+    def fetch_file_listings(self, limit: Optional[int] = None) -> tuple[FileListing, ...]:
+        """
+        Only what it takes to list the files in the index.
+        """
+        query = f"SELECT {FileListing.COLUMNS} FROM files"
+        params: tuple = ()
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (limit,)
+        with self.reading() as cursor:
+            return tuple(FileListing.hydrate(cursor, query, params))
+
+    def fetch_files_page(
+        self,
+        after: Optional[ResumeToken] = None,
+        size: int = PAGE_SIZE,
+        order_by: FileOrder = FileOrder.ID
+    ) -> Page[FileIndexRecord]:
+        """
+        Up to `size` files, ordered by `order_by`, starting right after the
+        file whose sort key is `after`. Pass a page's `resume_token` to get the
+        next one. Every page is a search on an index, however deep into the
+        library it is.
+        """
+        key = FileOrder(order_by).value
+        query = f"SELECT {FileIndexRecord.LISTING_COLUMNS} FROM files"
+        params: tuple = (size,)
+        if after is not None:
+            query += f" WHERE {key} > ?"
+            params = (after, size)
+        with self.reading() as cursor:
+            records = tuple(FileIndexRecord.hydrate(
+                cursor, f"{query} ORDER BY {key} LIMIT ?", params, self.__file_without_review
+            ))
+        return Page(records, getattr(records[-1], key) if len(records) == size else None)
+
+    def iter_files(
+        self,
+        after: Optional[ResumeToken] = None,
+        page_size: int = PAGE_SIZE,
+        order_by: FileOrder = FileOrder.ID
+    ) -> Iterator[FileIndexRecord]:
+        """
+        Stream the files, a page at a time; see `fetch_files_page`. The index
+        is not held between pages, so writers are never kept waiting on a
+        slow consumer. To resume later, pass the sort key of the last file
+        seen as `after`.
+        """
+        while True:
+            page = self.fetch_files_page(after, page_size, order_by)
+            yield from page.records
+            if page.resume_token is None:
+                return
+            after = page.resume_token
+    
+    def get_file_record_from_id(self, id: int) -> Optional[FileIndexRecord]:
+        with self.reading() as cursor:
+            return FileIndexRecord.fetch(cursor, id)
+    
+    def fetch_persons(self, activity_status: Optional[bool] = None) -> tuple[PersonIndexRecord, ...]:
+        query = (
+            f"SELECT {PersonIndexRecord.COLUMNS} FROM persons WHERE is_deactivated={self.__sqliteify(activity_status)}"
+            if activity_status is not None else
+            f"SELECT {PersonIndexRecord.COLUMNS} FROM persons"
+        )
+        with self.reading() as cursor:
+            return tuple(PersonIndexRecord.hydrate(cursor, query))
+
+    def fetch_person_listings(self, activity_status: Optional[bool] = None) -> tuple[PersonListing, ...]:
+        """
+        Only what it takes to list the persons in the index.
+        """
+        query = f"SELECT {PersonListing.COLUMNS} FROM persons"
+        params: tuple = ()
+        if activity_status is not None:
+            query += " WHERE is_deactivated=?"
+            params = (self.__sqliteify(activity_status),)
+        with self.reading() as cursor:
+            return tuple(PersonListing.hydrate(cursor, query, params))
+
+    def fetch_persons_page(
+        self,
+        after: Optional[int] = None,
+        size: int = PAGE_SIZE,
+        activity_status: Optional[bool] = None
+    ) -> Page[PersonIndexRecord]:
+        """
+        Up to `size` persons by id, starting right after the person with id
+        `after`. Persons are only paged by id: lastnames may be NULL, so names
+        make no keyset.
+        """
+        conditions = []
+        params: list = []
+        if activity_status is not None:
+            conditions.append("is_deactivated=?")
+            params.append(self.__sqliteify(activity_status))
+        if after is not None:
+            conditions.append("id > ?")
+            params.append(after)
+        query = f"SELECT {PersonIndexRecord.COLUMNS} FROM persons"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self.reading() as cursor:
+            records = tuple(PersonIndexRecord.hydrate(cursor, f"{query} ORDER BY id LIMIT ?", (*params, size)))
+        return Page(records, records[-1].id if len(records) == size else None)
+
+    def iter_persons(
+        self,
+        after: Optional[int] = None,
+        page_size: int = PAGE_SIZE,
+        activity_status: Optional[bool] = None
+    ) -> Iterator[PersonIndexRecord]:
+        """
+        Stream the persons a page at a time, like `iter_files`.
+        """
+        while True:
+            page = self.fetch_persons_page(after, page_size, activity_status)
+            yield from page.records
+            if page.resume_token is None:
+                return
+            after = cast(int, page.resume_token)
+    
+    def __has_search(self, cursor, search_table: str) -> bool:
+        """
+        Whether the index has `search_table`. Only a positive answer is
+        remembered, since the index may be migrated while we hold it open.
+        """
+        if search_table in self.__search_tables:
+            return True
+        found = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (search_table,)
+        ).fetchone() is not None
+        if found:
+            self.__search_tables.add(search_table)
+        return found
+
+    def __search_query(self, searchterm: str) -> str:
+        # Quoted, so that the whole term is matched as is.
+        return '"%s"' % searchterm.replace('"', '""')
+
+    def search_files(self, searchterm: str) -> Union[tuple[FileIndexRecord, ...], tuple]:
+        """
+        Files whose names contain `searchterm`, ignoring case, best matches
+        first.
+        """
+        with self.reading() as cursor:
+            # Trigrams can't match anything shorter than three characters.
+            if len(searchterm) >= SEARCH_MIN_LENGTH and self.__has_search(cursor, "files_search"):
+                query = f"""SELECT {LISTING_COLUMNS_OF_FILES} FROM files_search
+                    JOIN files ON files.id=files_search.rowid
+                    WHERE files_search MATCH ?
+                    ORDER BY files_search.rank"""
+                params: tuple = (self.__search_query(searchterm),)
+            else:
+                query = f"SELECT {FileIndexRecord.LISTING_COLUMNS} FROM files WHERE filename LIKE ?"
+                params = (f"%{searchterm}%",)
+            records = FileIndexRecord.hydrate(cursor, query, params, self.__file_without_review)
+            return tuple(records)
+
+    def search_performers(self, searchterm: str) -> Union[tuple[PersonIndexRecord, ...], tuple]:
+        """
+        Persons with `searchterm` in their first or last name, ignoring case,
+        best matches first.
+        """
+        with self.reading() as cursor:
+            if len(searchterm) >= SEARCH_MIN_LENGTH and self.__has_search(cursor, "persons_search"):
+                query = f"""SELECT {starfields(PersonIndexRecord, "persons")} FROM persons_search
+                    JOIN persons ON persons.id=persons_search.rowid
+                    WHERE persons_search MATCH ?
+                    ORDER BY persons_search.rank"""
+                records = PersonIndexRecord.hydrate(cursor, query, (self.__search_query(searchterm),))
+            else:
+                query = f"SELECT {PersonIndexRecord.COLUMNS} FROM persons WHERE firstname LIKE ? OR lastname LIKE ?"
+                records = PersonIndexRecord.hydrate(cursor, query, (f"%{searchterm}%", f"%{searchterm}%"))
+            return tuple(records)
@@ -0,0 +1,266 @@
+"""
+One library, indexed as several SQLite files.
+
+A `ShardSet` assigns every library root an index file of its own, its shard.
+Shards are ordinary indices: each is written by its own indexer, with its own
+write lock, so roots can be re-indexed in parallel, and damage to one file
+only ever costs its root a re-index. See `index_shards` in
+`indexer.indexerdem`.
+
+`ShardedIndex` reads a shard set as one library. Every query runs on all the
+shards at once, each on a connection of its own, and the results are merged.
+`ATTACH` was passed over: SQLite allows only ten attached databases by default
+and a single connection would run the shards one after another.
+
+Ids are only unique within a shard, so records read through a `ShardedIndex`
+carry global ids; see `global_id`. Persons have no shard of their own: the
+same name in two shards is the same person, just as it is within an index,
+and their global id is that of the first shard they appear in, whether or not
+they are active there.
+"""
+from .data import FileIndexRecord, FileListing, PerformanceIndexRecord, PersonIndexRecord, PersonListing, rows_by_key
+from .reader import IndexReader
+from .storage import DEFAULT_PROFILE, StorageProfile
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, cast, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar, Union
+
+import hashlib
+import os
+
+# Global ids keep the shard in their lowest bits.
+MAX_SHARDS = 256
+
+T = TypeVar("T")
+
+def global_id(shard: int, local_id: int) -> int:
+    return local_id * MAX_SHARDS + shard
+
+def split_global_id(id: int) -> Tuple[int, int]:
+    """
+    `(shard, local id)` of a global id.
+    """
+    return id % MAX_SHARDS, id // MAX_SHARDS
+
+@dataclass(frozen=True)
+class Shard:
+    root: str
+    index_filename: str
+
+class ShardSet(object):
+
+    def __init__(self, shards: Sequence[Shard]):
+        if not 0 < len(shards) <= MAX_SHARDS:
+            raise ValueError(f"A shard set holds 1 to {MAX_SHARDS} shards. Given: {len(shards)}")
+        self.shards: Tuple[Shard, ...] = tuple(shards)
+
+    @staticmethod
+    def from_roots(directory: str, roots: Iterable[str]) -> "ShardSet":
+        """
+        A shard per root, all in `directory`. The name of a shard is derived
+        from its root, so the same roots always map to the same files.
+        """
+        shards = []
+        for root in roots:
+            root = os.path.abspath(root)
+            digest = hashlib.sha1(root.encode()).hexdigest()[:8]
+            name = f"{os.path.basename(root.rstrip(os.sep)) or 'root'}-{digest}.db"
+            shards.append(Shard(root, os.path.join(directory, name)))
+        return ShardSet(shards)
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def shard_of(self, path: str) -> Optional[int]:
+        """
+        The shard whose root holds `path`, if any.
+        """
+        path = os.path.abspath(path)
+        for i, shard in enumerate(self.shards):
+            if os.path.commonpath((shard.root, path)) == shard.root:
+                return i
+        return None
+
+PersonKey = Tuple[str, Optional[str]]
+
+class ShardedIndex(object):
+    """
+    Read access to every shard of `shard_set` as one index.
+    """
+
+    def __init__(self, shard_set: ShardSet, read_only: bool = True, storage: StorageProfile = DEFAULT_PROFILE):
+        self.shard_set = shard_set
+        self.readers = tuple(
+            IndexReader(shard.index_filename, read_only=read_only, storage=storage) for shard in shard_set.shards
+        )
+        self.__pool = ThreadPoolExecutor(max_workers=len(self.readers), thread_name_prefix="shard")
+
+    def close(self) -> None:
+        self.__pool.shutdown()
+        for reader in self.readers:
+            reader.connections.close()
+
+    def __fan_out(self, query: Callable[[IndexReader], T]) -> List[T]:
+        """
+        `query` on every shard, in parallel. SQLite lets go of the GIL while it
+        runs a statement.
+        """
+        return list(self.__pool.map(query, self.readers))
+
+    def __globalize_file(self, shard: int, record: T) -> T:
+        record.id = global_id(shard, record.id) # type: ignore
+        if isinstance(record, FileIndexRecord) and record._review_loader is not None:
+            record._review_loader = self.fetch_review
+        return record
+
+    def __merge_persons(self, per_shard: List[Iterable[T]], filtered: bool) -> Tuple[T, ...]:
+        """
+        Persons of every shard, each once, in the order they are first seen.
+        Unless the shards were `filtered`, the first shard a person is seen in
+        is the first they are in at all, so it gives their global id.
+        """
+        persons: Dict[PersonKey, T] = {}
+        for shard, records in enumerate(per_shard):
+            for record in records:
+                key = (record.firstname, record.lastname) # type: ignore
+                if key not in persons:
+                    record.id = global_id(shard, record.id) # type: ignore
+                    persons[key] = record
+        if filtered and persons:
+            ids = self.__canonical_person_ids(persons)
+            for key, record in persons.items():
+                record.id = ids[key] # type: ignore
+        return tuple(persons.values())
+
+    def __interleave(self, per_shard: Sequence[Sequence[T]]) -> Tuple[T, ...]:
+        # Ranks aren't comparable between shards, so take the best of each in
+        # turn.
+        merged: List[T] = []
+        for i in range(max((len(records) for records in per_shard), default=0)):
+            merged.extend(records[i] for records in per_shard if i < len(records))
+        return tuple(merged)
+
+    def __canonical_person_ids(self, names: Iterable[PersonKey]) -> Dict[PersonKey, int]:
+        """
+        The global ids of the persons by `names` in any shard, looked up with
+        one query per shard (and `SQLITE_MAX_PARAMS` first names).
+        """
+        wanted = set(names)
+
+        def find(reader: IndexReader) -> Dict[PersonKey, int]:
+            ids: Dict[PersonKey, int] = {}
+            with reader.reading() as cursor:
+                rows = rows_by_key(
+                    cursor,
+                    "SELECT firstname, lastname, id FROM persons WHERE firstname IN ({}) ORDER BY id",
+                    (firstname for firstname, _ in wanted)
+                )
+            for firstname_rows in rows.values():
+                for firstname, lastname, id in firstname_rows:
+                    if (firstname, lastname) in wanted:
+                        ids.setdefault((firstname, lastname), id)
+            return ids
+
+        canonical: Dict[PersonKey, int] = {}
+        for shard, ids in enumerate(self.__fan_out(find)):
+            for key, local_id in ids.items():
+                canonical.setdefault(key, global_id(shard, local_id))
+        return canonical
+
+    def fetch_files(self, limit: Optional[int] = None) -> Tuple[FileIndexRecord, ...]:
+        per_shard = self.__fan_out(lambda reader: reader.fetch_files(limit))
+        files = tuple(
+            self.__globalize_file(shard, record) for shard, records in enumerate(per_shard) for record in records
+        )
+        return files[:limit] if limit is not None else files
+
+    def fetch_file_listings(self, limit: Optional[int] = None) -> Tuple[FileListing, ...]:
+        per_shard = self.__fan_out(lambda reader: reader.fetch_file_listings(limit))
+        listings = tuple(
+            self.__globalize_file(shard, listing) for shard, listings in enumerate(per_shard) for listing in listings
+        )
+        return listings[:limit] if limit is not None else listings
+
+    def get_file_record_from_id(self, id: int) -> Optional[FileIndexRecord]:
+        shard, local_id = split_global_id(id)
+        if shard >= len(self.readers):
+            return None
+        record = self.readers[shard].get_file_record_from_id(local_id)
+        return self.__globalize_file(shard, record) if record is not None else None
+
+    def fetch_review(self, id: int) -> Optional[str]:
+        shard, local_id = split_global_id(id)
+        return self.readers[shard].fetch_review(local_id) if shard < len(self.readers) else None
+
+    def search_files(self, searchterm: str) -> Tuple[FileIndexRecord, ...]:
+        per_shard = self.__fan_out(lambda reader: reader.search_files(searchterm))
+        return self.__interleave([
+            [self.__globalize_file(shard, record) for record in records] for shard, records in enumerate(per_shard)
+        ])
+
+    def fetch_persons(self, activity_status: Optional[bool] = None) -> Tuple[PersonIndexRecord, ...]:
+        return self.__merge_persons(
+            self.__fan_out(lambda reader: reader.fetch_persons(activity_status)), activity_status is not None
+        )
+
+    def fetch_person_listings(self, activity_status: Optional[bool] = None) -> Tuple[PersonListing, ...]:
+        return self.__merge_persons(
+            self.__fan_out(lambda reader: reader.fetch_person_listings(activity_status)), activity_status is not None
+        )
+
+    def get_person_from_id(self, id: int) -> Optional[PersonIndexRecord]:
+        shard, local_id = split_global_id(id)
+        if shard >= len(self.readers):
+            return None
+        with self.readers[shard].reading() as cursor:
+            person = PersonIndexRecord.fetch(cursor, local_id)
+        if person is None:
+            return None
+        key = (person.firstname, person.lastname)
+        person.id = self.__canonical_person_ids([key]).get(key)
+        return person
+
+    def search_performers(self, searchterm: str) -> Tuple[PersonIndexRecord, ...]:
+        per_shard = self.__fan_out(lambda reader: reader.search_performers(searchterm))
+        # Interleaved by rank, but with the global id of the first shard each
+        # person appears in, which need not be the shard that ranked them first.
+        merged: Dict[PersonKey, PersonIndexRecord] = {}
+        for record in self.__interleave(per_shard):
+            merged.setdefault((record.firstname, record.lastname), record)
+        ids = self.__canonical_person_ids(merged)
+        for key, record in merged.items():
+            record.id = ids[key]
+        return tuple(merged.values())
+
+    def fetch_performances(self, root: Union[PersonIndexRecord, FileIndexRecord]) -> PerformanceIndexRecord:
+        """
+        Like `PerformanceIndexRecord.fetch`, for a record read through this
+        index. The performances of a person are those of their name in every
+        shard.
+        """
+        if isinstance(root, PersonIndexRecord):
+            def performances(reader: IndexReader) -> Tuple[FileIndexRecord, ...]:
+                with reader.reading() as cursor:
+                    person = PersonIndexRecord.find_by_name(cursor, root.firstname, root.lastname)
+                    if person is None:
+                        return tuple()
+                    return PerformanceIndexRecord.fetch(cursor, person).files # type: ignore
+
+            files = tuple(
+                self.__globalize_file(shard, record)
+                for shard, records in enumerate(self.__fan_out(performances)) for record in records
+            )
+            return PerformanceIndexRecord(files=files, performers=root)
+
+        shard, local_id = split_global_id(cast(int, root.id))
+        with self.readers[shard].reading() as cursor:
+            local_root = FileIndexRecord.fetch(cursor, local_id)
+            performers = (
+                PerformanceIndexRecord.fetch(cursor, local_root).performers # type: ignore
+                if local_root is not None else tuple()
+            )
+        ids = self.__canonical_person_ids((performer.firstname, performer.lastname) for performer in performers) # type: ignore
+        for performer in performers: # type: ignore
+            performer.id = ids.get((performer.firstname, performer.lastname))
+        return PerformanceIndexRecord(files=root, performers=performers)
@@ -0,0 +1,251 @@
+"""
+Compact, streaming snapshots of a whole index.
+
+A snapshot holds the rows of `SNAPSHOT_TABLES` and the schema of the index,
+and none of the free pages or search tables of the index file it came from. It
+is a stream of msgpack objects:
+
+- a header, `{"format": "erdem-snapshot", "version": ..., "index_version":
+  ..., "schema": [[type, name, sql], ...], "tables": [...]}`;
+- for every table, `{"table": name, "columns": [...]}`, then its rows in
+  arrays of at most `BATCH_ROWS` rows, then `{"end": name, "rows": count}`.
+
+Rows are written in primary key order, so snapshots of the same index are
+identical byte for byte and snapshots of similar indices differ only where the
+indices do.
+
+Importing loads the rows into a new index with bulk inserts, and only then
+creates its secondary indices, triggers and search tables, which are filled in
+one pass each instead of row by row:
+
+    python -m indexer.snapshot export -i cache.db -o cache.snapshot
+    python -m indexer.snapshot import -i cache.snapshot -o cache.db
+"""
+from .errors import SnapshotError
+from .migrations import SEARCH_TABLES, fill_search, search_triggers
+
+from argparse import ArgumentParser
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import logging
+import msgpack # type: ignore[import-untyped]
+import os
+import re
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = "erdem-snapshot"
+SNAPSHOT_VERSION = 1
+
+# In the order they are loaded: persons and files before the participation
+# referring to them.
+SNAPSHOT_TABLES = ("__metadata", "files", "persons", "participation")
+
+# Rows per msgpack array and per `executemany`.
+BATCH_ROWS = 10000
+
+# (type, name, sql) of an object in the schema.
+SchemaEntry = Tuple[str, str, str]
+
+# The tables FTS5 keeps a virtual table in, which it creates along with it.
+FTS5_SHADOW_SUFFIXES = ("_data", "_idx", "_content", "_docsize", "_config")
+
+# What a snapshot may create, and the table it belongs to.
+SCHEMA_STATEMENTS = {
+    "table": re.compile(r"CREATE\s+TABLE\s+[\"'`\[]?(\w+)", re.IGNORECASE),
+    "virtual table": re.compile(r"CREATE\s+VIRTUAL\s+TABLE\s+[\"'`\[]?(\w+)[\"'`\]]?\s+USING\s+fts5\b", re.IGNORECASE),
+    "index": re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+\S+\s+ON\s+[\"'`\[]?(\w+)", re.IGNORECASE),
+}
+
+def _is_virtual(sql: str) -> bool:
+    return sql.upper().startswith("CREATE VIRTUAL TABLE")
+
+def _fetch_schema(cursor: sqlite3.Cursor) -> List[SchemaEntry]:
+    rows = cursor.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY rowid"
+    ).fetchall()
+    virtual_tables = [name for type, name, sql in rows if _is_virtual(sql)]
+    return [
+        (type, name, sql) for type, name, sql in rows
+        if not (
+            type == "table"
+            and any(name == f"{virtual}{suffix}" for virtual in virtual_tables for suffix in FTS5_SHADOW_SUFFIXES)
+        )
+    ]
+
+def _check_schema_entry(type: str, name: str, sql: str) -> None:
+    """
+    Raises `SnapshotError` unless `sql` creates a table of `SNAPSHOT_TABLES`,
+    a search table, an index on one of `SNAPSHOT_TABLES`, or exactly one of the
+    triggers keeping a search table in sync.
+    """
+    search_tables = [search_table for search_table, _, _ in SEARCH_TABLES]
+    triggers = {name: sql for search_table in search_tables for name, sql in search_triggers(search_table).items()}
+    if type == "table" and _is_virtual(sql):
+        match = SCHEMA_STATEMENTS["virtual table"].match(sql)
+        allowed = match is not None and match.group(1) == name and name in search_tables
+    elif type == "table":
+        match = SCHEMA_STATEMENTS["table"].match(sql)
+        allowed = match is not None and match.group(1) == name and name in SNAPSHOT_TABLES
+    elif type == "index":
+        match = SCHEMA_STATEMENTS["index"].match(sql)
+        allowed = match is not None and match.group(1) in SNAPSHOT_TABLES
+    elif type == "trigger":
+        # Their bodies run on every write, so nothing but what the migrations
+        # create will do.
+        allowed = name in triggers and sql.split() == triggers[name].split()
+    else:
+        allowed = False
+    if not allowed:
+        raise SnapshotError(f"unexpected {type} {name} in the schema")
+
+def export_snapshot(conn: sqlite3.Connection, out: BinaryIO) -> Dict[str, int]:
+    """
+    Write a snapshot of the index behind `conn` to `out`. The snapshot is read
+    in one transaction, so it is consistent even while the index is being
+    written to. Returns the number of rows written per table.
+    """
+    cursor = conn.cursor()
+    packer = msgpack.Packer()
+    counts: Dict[str, int] = {}
+    owns_transaction = not conn.in_transaction
+    if owns_transaction:
+        cursor.execute("BEGIN")
+    try:
+        version = cursor.execute("SELECT val FROM __metadata WHERE key='index_version' LIMIT 1").fetchone()
+        out.write(packer.pack({
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "index_version": version[0] if version is not None else None,
+            "schema": _fetch_schema(cursor),
+            "tables": SNAPSHOT_TABLES,
+        }))
+        for table in SNAPSHOT_TABLES:
+            columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+            out.write(packer.pack({"table": table, "columns": columns}))
+            rows = cursor.execute(f"SELECT {','.join(columns)} FROM {table} ORDER BY rowid")
+            count = 0
+            while batch := rows.fetchmany(BATCH_ROWS):
+                out.write(packer.pack(batch))
+                count += len(batch)
+            out.write(packer.pack({"end": table, "rows": count}))
+            counts[table] = count
+    finally:
+        if owns_transaction:
+            conn.rollback()
+    return counts
+
+def _expect_map(unpacker: msgpack.Unpacker, key: str) -> Dict[str, Any]:
+    try:
+        obj = next(unpacker)
+    except StopIteration:
+        raise SnapshotError(f"ended while expecting {key}")
+    except ValueError as e:
+        # Any of msgpack's complaints about malformed data.
+        raise SnapshotError(str(e)) from e
+    if not isinstance(obj, dict) or key not in obj:
+        raise SnapshotError(f"expected {key}")
+    return obj
+
+def _load_table(cursor: sqlite3.Cursor, unpacker: msgpack.Unpacker, table: str) -> int:
+    header = _expect_map(unpacker, "table")
+    columns = header["columns"]
+    if header["table"] != table or not all(isinstance(column, str) and column.isidentifier() for column in columns):
+        raise SnapshotError(f"unexpected columns for {table}")
+    query = f"INSERT INTO {table} ({','.join(columns)}) VALUES ({','.join('?' * len(columns))})"
+    count = 0
+    for obj in unpacker:
+        if isinstance(obj, dict):
+            if obj.get("end") != table or obj.get("rows") != count:
+                raise SnapshotError(f"{table} ended after {count} rows; expected {obj.get('rows')}")
+            return count
+        cursor.executemany(query, obj)
+        count += len(obj)
+    raise SnapshotError(f"{table} was cut short after {count} rows")
+
+def import_snapshot(stream: BinaryIO, index_filename: str) -> Dict[str, int]:
+    """
+    Restore the snapshot in `stream` as a new index at `index_filename`, which
+    must not exist yet. The index is built next to it and only moved into
+    place once complete. Returns the number of rows loaded per table.
+
+    Raises `SnapshotError` should the snapshot be malformed, of an unknown
+    format version, or hold anything but the tables of an index.
+    """
+    if os.path.exists(index_filename):
+        raise FileExistsError(index_filename)
+    unpacker = msgpack.Unpacker(stream, use_list=False)
+    header = _expect_map(unpacker, "format")
+    if header["format"] != SNAPSHOT_FORMAT or header.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotError(f"unknown format {header['format']} {header.get('version')}")
+    schema: List[SchemaEntry] = [tuple(entry) for entry in header["schema"]] # type: ignore
+    for type, name, sql in schema:
+        _check_schema_entry(type, name, sql)
+    if not set(header["tables"]) <= set(SNAPSHOT_TABLES):
+        raise SnapshotError(f"unexpected tables {header['tables']}")
+
+    partial = f"{index_filename}.importing"
+    if os.path.exists(partial):
+        os.remove(partial)
+    conn = sqlite3.connect(partial)
+    counts: Dict[str, int] = {}
+    try:
+        cursor = conn.cursor()
+        # Nothing to lose should this fail halfway: the index isn't in place yet.
+        cursor.execute("PRAGMA journal_mode=OFF")
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA cache_size=-262144")
+        cursor.execute("BEGIN")
+        deferred = []
+        for type, name, sql in schema:
+            if type == "table" and not _is_virtual(sql):
+                cursor.execute(sql)
+            else:
+                deferred.append((type, name, sql))
+        for table in header["tables"]:
+            try:
+                counts[table] = _load_table(cursor, unpacker, table)
+            except ValueError as e:
+                raise SnapshotError(str(e)) from e
+        # Building on top of a page cache full of the rows just loaded would
+        # keep spilling it to disk.
+        conn.commit()
+        cursor.execute("BEGIN")
+        for type, name, sql in deferred:
+            cursor.execute(sql)
+            if any(name == search_table for search_table, _, _ in SEARCH_TABLES):
+                fill_search(cursor, name)
+        conn.commit()
+    except:
+        conn.close()
+        os.remove(partial)
+        raise
+    conn.close()
+    os.replace(partial, index_filename)
+    return counts
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="export an erdem index to a snapshot, or import one.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a snapshot of an index.")
+    export_parser.add_argument("--index", "-i", type=str, default="cache.db", help="The index to export.")
+    export_parser.add_argument("--output", "-o", type=str, required=True, help="Where to write the snapshot.")
+    import_parser = commands.add_parser("import", help="Restore a snapshot as a new index.")
+    import_parser.add_argument("--input", "-i", type=str, required=True, help="The snapshot to import.")
+    import_parser.add_argument("--output", "-o", type=str, default="cache.db", help="The index to create.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    counts: Optional[Dict[str, int]] = None
+    if args.command == "export":
+        conn = sqlite3.connect(args.index)
+        try:
+            with open(args.output, "wb") as f:
+                counts = export_snapshot(conn, f)
+        finally:
+            conn.close()
+    else:
+        with open(args.input, "rb") as snapshot:
+            counts = import_snapshot(snapshot, args.output)
+    print(", ".join(f"{count} {table}" for table, count in counts.items()))
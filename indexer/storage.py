@@ -0,0 +1,268 @@
+"""
+How connections to the index are set up.
+
+A `StorageProfile` is the set of pragmas every connection is opened with. The
+default profile leaves the journal alone and only makes connections wait on a
+locked index instead of failing outright. `CONCURRENT_PROFILE` switches the
+index to WAL so that readers (the TUI, the backend) never block on, or are
+blocked by, an indexer writing to it. WAL is a property of the database file:
+once an indexer has switched an index over, every later connection uses it
+regardless of its own profile.
+
+WAL needs shared memory between the connections, so it is unsuitable for an
+index on a network filesystem.
+"""
+from .cache import CacheStats, RecordCache
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import logging
+import sqlite3
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class StorageProfile:
+    # `None` keeps whatever the index already uses.
+    journal_mode: Optional[str] = None
+    synchronous: Optional[str] = None
+    # How long to wait on a lock held by another connection.
+    busy_timeout_ms: int = 5000
+    # Page cache per connection, in KiB.
+    cache_size_kib: Optional[int] = None
+    # How much of the index to memory-map, in bytes.
+    mmap_size: Optional[int] = None
+    # Pages the WAL may grow to before it is checkpointed automatically.
+    wal_autocheckpoint: Optional[int] = None
+
+    def apply(self, conn: sqlite3.Connection, read_only: bool = False) -> None:
+        """
+        Set the pragmas of this profile on a freshly opened `conn`. Changing
+        the journal mode takes a write, so it is skipped when `read_only`.
+        """
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        if self.journal_mode is not None and not read_only:
+            mode = conn.execute(f"PRAGMA journal_mode={self.journal_mode}").fetchone()[0]
+            if mode.lower() != self.journal_mode.lower():
+                # In-memory indices, for one, can't do WAL.
+                logger.warning("Asked for journal mode %s but the index uses %s." % (self.journal_mode, mode))
+        if self.synchronous is not None:
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        if self.cache_size_kib is not None:
+            # Negative sizes are in KiB rather than pages.
+            conn.execute(f"PRAGMA cache_size={-int(self.cache_size_kib)}")
+        if self.mmap_size is not None:
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        if self.wal_autocheckpoint is not None:
+            conn.execute(f"PRAGMA wal_autocheckpoint={int(self.wal_autocheckpoint)}")
+
+class IndexConnection(sqlite3.Connection):
+    """
+    A connection that can carry a `RecordCache`; see `indexer.cache`.
+    """
+    record_cache: Optional[RecordCache] = None
+
+DEFAULT_PROFILE = StorageProfile()
+CONCURRENT_PROFILE = StorageProfile(
+    journal_mode="WAL",
+    # Safe with WAL; a crash may only lose the last few commits.
+    synchronous="NORMAL",
+    cache_size_kib=64 * 1024,
+    mmap_size=256 * 2**20,
+)
+
+STORAGE_PROFILES: Dict[str, StorageProfile] = {
+    "default": DEFAULT_PROFILE,
+    "concurrent": CONCURRENT_PROFILE,
+}
+
+def connect(
+    index_filename: str,
+    profile: StorageProfile = DEFAULT_PROFILE,
+    read_only: bool = False,
+    check_same_thread: bool = True,
+    cache_size: int = 0
+) -> IndexConnection:
+    """
+    With a positive `cache_size`, the connection caches up to that many
+    records; see `indexer.cache`.
+    """
+    conn: IndexConnection
+    if read_only:
+        conn = sqlite3.connect( # type: ignore
+            f"file:{index_filename}?mode=ro", uri=True, check_same_thread=check_same_thread, factory=IndexConnection
+        )
+    else:
+        conn = sqlite3.connect(index_filename, check_same_thread=check_same_thread, factory=IndexConnection) # type: ignore
+    profile.apply(conn, read_only)
+    if cache_size > 0:
+        conn.record_cache = RecordCache(cache_size)
+    return conn
+
+class _ThreadReader(object):
+    """
+    The reader connection of one thread, kept in its thread-local storage. The
+    thread's locals, and so this, go away when it exits.
+    """
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: IndexConnection):
+        self.conn = conn
+
+class ConnectionManager(object):
+    """
+    Hands out connections to one index to any number of threads.
+
+    There is a single writer connection, `writer`, and whoever holds it holds
+    the write lock; `writing` takes it and commits (or rolls back) on the way
+    out. Reads on the thread that created the manager go through the writer
+    too, so they see whatever that thread has written but not yet committed,
+    just as a lone connection would. Every other thread reads on a connection
+    of its own, opened on its first `reading` and closed once the thread
+    exits, and never waits on the writer in WAL mode.
+
+    In-memory indices can't be shared between connections, so there every
+    read goes through the writer as well.
+
+    With a positive `cache_size`, every connection handed out caches that many
+    records of its own.
+    """
+
+    def __init__(
+        self,
+        index_filename: str,
+        profile: StorageProfile = DEFAULT_PROFILE,
+        read_only: bool = False,
+        cache_size: int = 0
+    ):
+        self.index_filename = index_filename
+        self.profile = profile
+        self.read_only = read_only
+        self.cache_size = cache_size
+        self.owner = threading.get_ident()
+        self.writer = connect(index_filename, profile, read_only, check_same_thread=False, cache_size=cache_size)
+        self.write_lock = threading.RLock()
+        # How many `writing` blocks the holder of `write_lock` is in.
+        self.__write_depth = 0
+        self.__shared = index_filename in ("", ":memory:") or "mode=memory" in index_filename
+        self.__local = threading.local()
+        self.__readers: List[IndexConnection] = []
+        self.__readers_lock = threading.Lock()
+        # The record cache statistics of the readers closed so far.
+        self.__closed_stats = CacheStats()
+
+    def __reader(self) -> IndexConnection:
+        reader = getattr(self.__local, "reader", None)
+        if reader is None:
+            # Read-only, so a reader can never write behind the writer's back.
+            # Only ever used by this thread, but it is closed from whichever
+            # thread collects it, or calls `close`.
+            conn = connect(
+                self.index_filename, self.profile, read_only=True, check_same_thread=False, cache_size=self.cache_size
+            )
+            reader = _ThreadReader(conn)
+            self.__local.reader = reader
+            with self.__readers_lock:
+                self.__readers.append(conn)
+            # Short-lived threads, like the TUI's workers, would otherwise
+            # each leave a connection open until `close`.
+            weakref.finalize(reader, self.__close_reader, conn)
+        return reader.conn
+
+    def __close_reader(self, conn: IndexConnection) -> None:
+        with self.__readers_lock:
+            if not any(reader is conn for reader in self.__readers):
+                # Closed by `close` already.
+                return
+            self.__readers = [reader for reader in self.__readers if reader is not conn]
+            if conn.record_cache is not None:
+                self.__closed_stats += conn.record_cache.stats
+        conn.close()
+
+    @contextmanager
+    def reading(self) -> Iterator[sqlite3.Cursor]:
+        if self.__shared or threading.get_ident() == self.owner:
+            with self.write_lock:
+                yield self.writer.cursor()
+        else:
+            yield self.__reader().cursor()
+
+    @contextmanager
+    def writing(self) -> Iterator[sqlite3.Cursor]:
+        """
+        Hold the writer for the enclosed block, committing when it completes
+        and rolling back should it raise. Nested blocks join the transaction
+        of the outermost one, whether or not it has written anything yet:
+        they are committed along with it, and should they raise, only what
+        they wrote is rolled back. A rollback empties the writer's record
+        cache, which may hold records read within the transaction.
+        """
+        with self.write_lock:
+            cursor = self.writer.cursor()
+            # A transaction the owner opened on the writer outside of `writing`
+            # is joined like that of an enclosing block: only its part is
+            # undone on failure, and it isn't committed here.
+            outermost = self.__write_depth == 0 and not self.writer.in_transaction
+            savepoint = f"writing_{self.__write_depth}"
+            cursor.execute("BEGIN" if outermost else f"SAVEPOINT {savepoint}")
+            self.__write_depth += 1
+            try:
+                yield cursor
+            except:
+                if outermost:
+                    self.writer.rollback()
+                else:
+                    cursor.execute(f"ROLLBACK TO {savepoint}")
+                    cursor.execute(f"RELEASE {savepoint}")
+                if self.writer.record_cache is not None:
+                    self.writer.record_cache.clear()
+                raise
+            else:
+                if outermost:
+                    self.writer.commit()
+                else:
+                    cursor.execute(f"RELEASE {savepoint}")
+            finally:
+                self.__write_depth -= 1
+
+    def cache_stats(self) -> CacheStats:
+        """
+        The record cache statistics of all the connections so far, combined.
+        """
+        with self.__readers_lock:
+            connections = [self.writer, *self.__readers]
+            stats = self.__closed_stats
+        for conn in connections:
+            if conn.record_cache is not None:
+                stats += conn.record_cache.stats
+        return stats
+
+    def close(self) -> None:
+        """
+        Close the writer and every reader opened so far. Meant for when no
+        other thread is using the index anymore.
+        """
+        with self.__readers_lock:
+            readers, self.__readers = self.__readers, []
+        for conn in readers:
+            conn.close()
+        with self.write_lock:
+            self.writer.close()
+
+def is_wal(conn: sqlite3.Connection) -> bool:
+    return conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+
+def checkpoint(conn: sqlite3.Connection, mode: str = "TRUNCATE") -> Optional[Tuple[int, int, int]]:
+    """
+    Copy the WAL back into the index. `TRUNCATE` also empties the WAL file.
+    Returns SQLite's `(busy, log pages, checkpointed pages)`, where `busy` is
+    set if readers kept the checkpoint from completing, or `None` if the index
+    is not in WAL mode.
+    """
+    if not is_wal(conn):
+        return None
+    return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()) # type: ignore
@@ -0,0 +1,10 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Every Indexerdem built by the tests (parse workers included) would otherwise
+# build its lexicon under the user's cache directory.
+LEXICON_DIR = tempfile.mkdtemp(prefix="erdem-lexicon-tests-")
+os.environ["ERDEM_LEXICON_DIR"] = LEXICON_DIR
+atexit.register(shutil.rmtree, LEXICON_DIR, ignore_errors=True)
@@ -9,7 +9,8 @@ class SQLiteTest(unittest.TestCase):
 
     def __init__(self, *args, **kwargs):
         super(SQLiteTest, self).__init__(*args, **kwargs)
-        self.indexerdem = Indexerdem(f"/tmp/indexerdem-tests-{uuid.uuid1()}.db")
+        self.db_path = f"/tmp/indexerdem-tests-{uuid.uuid1()}.db"
+        self.indexerdem = Indexerdem(self.db_path)
 
     @property
     def cursor(self):
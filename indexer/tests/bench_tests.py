@@ -0,0 +1,30 @@
+from ..bench import LibraryGenerator, run_benchmark
+from ..indexerdem import Indexerdem
+
+import os
+import tempfile
+import unittest
+
+class BenchTests(unittest.TestCase):
+
+    def test_generator_is_deterministic(self):
+        assert (
+            [LibraryGenerator(7).filename() for _ in range(50)] ==
+            [LibraryGenerator(7).filename() for _ in range(50)]
+        )
+        assert LibraryGenerator(7).filename() != LibraryGenerator(8).filename()
+
+    def test_run_benchmark(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            library = os.path.join(scratch, "library")
+            media = LibraryGenerator().generate(library, 300)
+            files = sum(len(filenames) for _, _, filenames in os.walk(library))
+            assert files == 300
+            assert 0 < media <= 300
+
+            result = run_benchmark(library, os.path.join(scratch, "index.db"), batch_size=100)
+            assert result.files == media
+            assert result.name_matches > 0
+            assert result.files_per_second > 0
+            assert result.db_bytes > 0
+            assert result.peak_rss_kb > 0
@@ -0,0 +1,79 @@
+from ..cache import RecordCache
+from ..data import FileIndexRecord, NameDecisionRule, PersonIndexRecord
+from ..indexerdem import Indexerdem
+from ..reader import IndexReader
+from ..storage import CONCURRENT_PROFILE
+
+import os
+import tempfile
+import unittest
+
+class RecordCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "index.db")
+        self.indexer = Indexerdem(self.db_path, storage=CONCURRENT_PROFILE)
+        self.indexer.init()
+        self.indexer.index_many([(f"Clip {i}.mp4", "/clips") for i in range(5)])
+        self.reader = IndexReader(self.db_path, storage=CONCURRENT_PROFILE, cache_size=3)
+
+    def tearDown(self):
+        self.reader.connections.close()
+        self.indexer.connections.close()
+        self.directory.cleanup()
+
+    def fetch(self, id):
+        with self.reader.reading() as cursor:
+            return FileIndexRecord.fetch(cursor, id)
+
+    def test_identity(self):
+        first = self.fetch(1)
+        assert self.fetch(1) is first
+        assert self.fetch(9999) is None
+        stats = self.reader.cache_stats()
+        assert stats.hits == 1 and stats.misses == 2
+        assert stats.hit_rate == 1 / 3
+
+    def test_eviction(self):
+        first = self.fetch(1)
+        for id in (2, 3, 4):
+            self.fetch(id)
+        assert self.reader.cache_stats().evictions == 1
+        assert self.fetch(1) is not first
+        assert len(self.reader.conn.record_cache) == 3
+
+    def test_invalidated_by_writes(self):
+        first = self.fetch(1)
+        with self.reader.writing() as cursor:
+            first.delete(cursor)
+        assert self.reader.cache_stats().invalidations == 1
+        assert self.fetch(1) is not first
+
+        person = PersonIndexRecord(None, "Jane", "Doe", NameDecisionRule.MANUAL_INPUT)
+        with self.reader.writing() as cursor:
+            person.insert(cursor)
+            assert PersonIndexRecord.fetch(cursor, person.id) == person
+
+    def test_invalidated_by_other_connections(self):
+        self.fetch(1)
+        with self.indexer.writing() as cursor:
+            cursor.execute("UPDATE files SET rating=7 WHERE id=1")
+        assert self.fetch(1).rating == 7
+
+    def test_rollback(self):
+        try:
+            with self.reader.writing() as cursor:
+                cursor.execute("UPDATE files SET rating=7 WHERE id=1")
+                assert self.fetch(1).rating == 7
+                raise RuntimeError("changed my mind")
+        except RuntimeError:
+            pass
+        assert self.fetch(1).rating == 0
+
+    def test_capacity(self):
+        try:
+            RecordCache(0)
+            assert False, "Expected an empty cache to be refused"
+        except ValueError:
+            pass
@@ -29,6 +29,18 @@ class FileIndexRecordTests(SQLiteTest):
         fetch_is_fine = FileIndexRecord.fetch(self.cursor, fine.id)
         assert fine == fetch_is_fine
 
+    def test_fetch_many(self):
+        records = [self.insert(FileIndexRecord, None, f"Clip {i}.mp4", "/", "", 0) for i in range(1200)]
+        ids = [record.id for record in reversed(records)] + [9999]
+        assert FileIndexRecord.fetch_many(self.cursor, ids) == tuple(reversed(records))
+        assert FileIndexRecord.fetch_many(self.cursor, []) == tuple()
+
+    def test_hydrate(self):
+        fine = self.insert(FileIndexRecord, None, "This Is Fine.mp4", "/var/srv/videos", None, 5)
+        records = list(FileIndexRecord.hydrate(self.cursor, f"SELECT {FileIndexRecord.COLUMNS} FROM files WHERE rating=?", (5,)))
+        assert records == [fine]
+        assert not hasattr(records[0], "__dict__")
+
 class PersonIndexRecordTests(SQLiteTest):
 
     def test_fetch(self):
@@ -42,6 +54,13 @@ class PersonIndexRecordTests(SQLiteTest):
         fetch_scarjo = PersonIndexRecord.fetch(self.cursor, scarjo.id)
         assert scarjo == fetch_scarjo
 
+    def test_fetch_many(self):
+        scarjo = self.insert(PersonIndexRecord, None, "Scarlett", "Johansson", NameDecisionRule.ALMOST_CERTAIN)
+        zendaya = self.insert(PersonIndexRecord, None, "Zendaya", None, NameDecisionRule.MANUAL_INPUT)
+        assert PersonIndexRecord.fetch_many(self.cursor, (zendaya.id, scarjo.id, zendaya.id)) == (zendaya, scarjo, zendaya)
+        hydrated = PersonIndexRecord.hydrate(self.cursor, f"SELECT {PersonIndexRecord.COLUMNS} FROM persons ORDER BY id")
+        assert [person.extraction_rule for person in hydrated] == [NameDecisionRule.ALMOST_CERTAIN, NameDecisionRule.MANUAL_INPUT]
+
     def test_find_by_name(self):
         scarjo = PersonIndexRecord(
             None,
@@ -73,10 +92,30 @@ class PersonIndexRecordTests(SQLiteTest):
             None
         ) is None
 
+    def test_insert_existing(self):
+        scarjo = self.insert(PersonIndexRecord, None, "Scarlett", "Johansson", NameDecisionRule.ALMOST_CERTAIN)
+        again = self.insert(PersonIndexRecord, None, "Scarlett", "Johansson", NameDecisionRule.MANUAL_INPUT)
+        assert again.id == scarjo.id
+        assert PersonIndexRecord.fetch(self.cursor, scarjo.id) == scarjo
+
+        zendaya = self.insert(PersonIndexRecord, None, "Zendaya", None, NameDecisionRule.MANUAL_INPUT)
+        again = self.insert(PersonIndexRecord, None, "Zendaya", None, NameDecisionRule.MANUAL_INPUT)
+        assert again.id == zendaya.id
+        assert self.cursor.execute("SELECT COUNT(*) FROM persons").fetchone()[0] == 2
+
+    def test_insert_existing_writes_nothing(self):
+        scarjo = self.insert(PersonIndexRecord, None, "Scarlett", "Johansson", NameDecisionRule.ALMOST_CERTAIN)
+        changes = self.connection.total_changes
+        again = self.insert(PersonIndexRecord, None, "Scarlett", "Johansson", NameDecisionRule.MANUAL_INPUT)
+        assert again.id == scarjo.id
+        # Not even the search triggers.
+        assert self.connection.total_changes == changes
+
 class MetadataRecordTests(SQLiteTest):
 
     def test_fetch(self):
         assert MetadataRecord.fetch(self.cursor, "index_version") is not None
+        assert [record.key for record in MetadataRecord.fetch_many(self.cursor, ("nope", "index_version"))] == ["index_version"]
 
     def test_delete(self):
         index_version_record = MetadataRecord.fetch(self.cursor, "index_version")
@@ -170,6 +209,24 @@ class PerformanceIndexRecordTests(SQLiteTest):
         assert len(self.p_and_r_perf.performers) == 1
         assert self.jslate in self.p_and_r_perf.performers
     
+    def test_insert_merges(self):
+        lead = self.insert(PersonIndexRecord, None, "Ke Huy", "Quan", NameDecisionRule.ALMOST_CERTAIN, 0)
+        written = PerformanceIndexRecord(self.everything_everywhere, (self.myeoh, lead)).insert(
+            self.cursor, PerformanceIndexRecord.ExtraArgs((1, 1))
+        )
+        assert written == 2
+        ee_perfs = PerformanceIndexRecord.fetch(self.cursor, self.everything_everywhere)
+        assert len(ee_perfs.performers) == 3
+        assert lead in ee_perfs.performers
+
+        # Certainty is never downgraded, only upgraded.
+        PerformanceIndexRecord(self.dune, (self.zendaya,)).insert(self.cursor, PerformanceIndexRecord.ExtraArgs((0,)))
+        certainty = "SELECT is_certain FROM participation WHERE person_id=? AND file_id=?"
+        assert self.cursor.execute(certainty, (self.zendaya.id, self.dune.id)).fetchone()[0] == 1
+        PerformanceIndexRecord(self.p_and_r, (self.myeoh,)).insert(self.cursor, PerformanceIndexRecord.ExtraArgs((0,)))
+        PerformanceIndexRecord(self.p_and_r, (self.myeoh,)).insert(self.cursor, PerformanceIndexRecord.ExtraArgs((1,)))
+        assert self.cursor.execute(certainty, (self.myeoh.id, self.p_and_r.id)).fetchone()[0] == 1
+
     def test_fetch(self):
         # Fetch with a performer
         jslate_perfs = PerformanceIndexRecord.fetch(self.cursor, self.jslate)
@@ -181,3 +238,34 @@ class PerformanceIndexRecordTests(SQLiteTest):
         # Fetch performer with no last name
         zendaya_perfs = PerformanceIndexRecord.fetch(self.cursor, self.zendaya)
         assert zendaya_perfs.performers == self.zendaya
+
+    def test_fetch_many(self):
+        ee_perfs, zendaya_perfs = PerformanceIndexRecord.fetch_many(self.cursor, (self.everything_everywhere, self.zendaya))
+        assert ee_perfs.files == self.everything_everywhere
+        assert len(ee_perfs.performers) == 2
+        assert self.jslate in ee_perfs.performers and self.myeoh in ee_perfs.performers
+        assert zendaya_perfs.performers == self.zendaya
+        assert len(zendaya_perfs.files) == 2
+        assert self.dune in zendaya_perfs.files and self.spiderman in zendaya_perfs.files
+
+    def test_fetch_loads_reviews_lazily(self):
+        zendaya_perfs = PerformanceIndexRecord.fetch(self.cursor, self.zendaya)
+        self.cursor.execute("UPDATE files SET review='Sandworms' WHERE id=?", (self.dune.id,))
+        (dune,) = [record for record in zendaya_perfs.files if record.id == self.dune.id]
+        assert dune.review == "Sandworms"
+        zendaya_perfs = PerformanceIndexRecord.fetch(self.cursor, self.zendaya, lambda id: f"Review {id}")
+        assert sorted(record.review for record in zendaya_perfs.files) == sorted(
+            f"Review {id}" for id in (self.dune.id, self.spiderman.id)
+        )
+
+    def test_fetch_queries(self):
+        files = tuple(FileIndexRecord(None, f"Yeoh {i}.mp4", "/", "", 0) for i in range(2000))
+        PerformanceIndexRecord(files, self.myeoh).insert(self.cursor, PerformanceIndexRecord.ExtraArgs((1,) * len(files)))
+        queries = []
+        self.connection.set_trace_callback(queries.append)
+        try:
+            performances = self.myeoh.load_performances(self.cursor)
+        finally:
+            self.connection.set_trace_callback(None)
+        assert len(performances) == 2001
+        assert len(queries) == 1
@@ -1,7 +1,11 @@
 from .base import SQLiteTest
 
 from ..data import FileIndexRecord, MetadataRecord, PersonIndexRecord
-from ..indexerdem import MetadataCheckResult, NameDecisionRule
+from ..indexerdem import IndexProgress, IndexResult, Indexerdem, MetadataCheckResult, NameDecisionRule, PersonCache
+
+import os
+import shutil
+import tempfile
 
 class IndexerdemTests(SQLiteTest):
 
@@ -30,10 +34,14 @@ class IndexerdemTests(SQLiteTest):
     def test_check_compatibility(self):
         assert self.indexerdem.check_compatibility() == MetadataCheckResult.COMPLETELY_COMPATIBLE
         index_version_record = MetadataRecord.fetch(self.cursor, "index_version")
-        index_version_record.val = "1.1"
+        index_version_record.val = "2.9"
         assert index_version_record.save(self.cursor)
         self.connection.commit()
         assert self.indexerdem.check_compatibility() == MetadataCheckResult.LIKELY_COMPATIBLE
+        index_version_record.val = "2.0"
+        assert index_version_record.save(self.cursor)
+        self.connection.commit()
+        assert self.indexerdem.check_compatibility() == MetadataCheckResult.MIGRATABLE
         index_version_record.val = "blerp"
         assert index_version_record.save(self.cursor)
         self.connection.commit()
@@ -45,3 +53,300 @@ class IndexerdemTests(SQLiteTest):
         assert index_version_record.delete(self.cursor)
         self.connection.commit()
         assert self.indexerdem.check_compatibility() == MetadataCheckResult.INDETERMINATE
+
+class IndexerdemBatchTests(SQLiteTest):
+
+    def count(self, table: str) -> int:
+        return self.cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def test_index_many(self):
+        self.indexerdem.index_many((
+            ("Emily Browning - Sucker Punch.mp4", "/movies"),
+            ("Sucker Punch Extras Emily Browning.mp4", "/movies"),
+            ("Nobody.mp4", "/movies"),
+        ))
+        assert self.count("files") == 3
+        assert self.count("persons") == 1
+        assert self.count("participation") == 2
+        browning = PersonIndexRecord.find_by_name(self.cursor, "Emily", "Browning")
+        assert browning is not None
+        assert len(browning.load_performances(self.cursor)) == 2
+
+    def test_index_many_reindex(self):
+        entries = (("Emily Browning - Sucker Punch.mp4", "/movies/"),)
+        self.indexerdem.index_many(entries)
+        self.indexerdem.index_many(entries)
+        assert self.count("files") == 1
+        assert self.count("persons") == 1
+        assert self.count("participation") == 1
+
+    def test_index_reingest(self):
+        self.indexerdem.index("Emily Browning - Sucker Punch.mp4", "/movies")
+        file_id = self.cursor.execute("SELECT id FROM files").fetchone()[0]
+        self.indexerdem.index("Emily Browning - Sucker Punch.mp4", "/movies")
+        assert self.count("files") == 1
+        assert self.count("persons") == 1
+        assert self.count("participation") == 1
+        assert self.cursor.execute("SELECT id FROM files").fetchone()[0] == file_id
+
+        # Not indexed a second time under another path while it is still at
+        # the first.
+        with tempfile.TemporaryDirectory() as movies:
+            open(os.path.join(movies, "Emily Browning - Sucker Punch.mp4"), "w").close()
+            self.indexerdem.index("Emily Browning - Sucker Punch.mp4", movies)
+            self.indexerdem.index("Emily Browning - Sucker Punch.mp4", "/elsewhere")
+            assert self.cursor.execute("SELECT fullpath FROM files").fetchall() == [(os.path.join(movies, ""),)]
+        assert self.count("participation") == 1
+
+    def test_index_many_isolates_failures(self):
+        self.indexerdem.index_many((
+            ("Emily Browning - Sucker Punch.mp4", "/movies"),
+            # An empty path can't be canonicalized.
+            ("Broken.mp4", ""),
+            ("Nobody.mp4", "/movies"),
+        ))
+        filenames = set(row[0] for row in self.cursor.execute("SELECT filename FROM files"))
+        assert filenames == {"Emily Browning - Sucker Punch.mp4", "Nobody.mp4"}
+        assert self.count("participation") == 1
+
+    def test_readdir_batched(self):
+        with tempfile.TemporaryDirectory() as library:
+            os.mkdir(os.path.join(library, "nested"))
+            for fname in ("Emily Browning - Sucker Punch.mp4", "nested/Nobody.mkv", "nested/notes.txt"):
+                open(os.path.join(library, fname), "w").close()
+            Indexerdem(self.db_path).readdir(library, batch_size=2)
+
+        filenames = set(row[0] for row in self.cursor.execute("SELECT filename FROM files"))
+        assert filenames == {"Emily Browning - Sucker Punch.mp4", "Nobody.mkv"}
+        assert self.count("participation") == 1
+
+    def test_readdir_parallel(self):
+        with tempfile.TemporaryDirectory() as library:
+            for i in range(10):
+                open(os.path.join(library, f"Emily Browning - Episode {i}.mp4"), "w").close()
+            open(os.path.join(library, "Nobody.avi"), "w").close()
+            Indexerdem(self.db_path, self.indexerdem.locales).readdir(library, batch_size=4, workers=2)
+
+        assert self.count("files") == 11
+        assert self.count("persons") == 1
+        assert self.count("participation") == 10
+
+class IndexerdemIncrementalTests(SQLiteTest):
+
+    def setUp(self):
+        super().setUp()
+        self.library = tempfile.TemporaryDirectory()
+        for fname in ("Emily Browning - Sucker Punch.mp4", "Nobody.mkv"):
+            open(os.path.join(self.library.name, fname), "w").close()
+        self.readdir()
+
+    def tearDown(self):
+        self.library.cleanup()
+        super().tearDown()
+
+    def readdir(self, incremental: bool = True):
+        Indexerdem(self.db_path, self.indexerdem.locales).readdir(self.library.name, incremental=incremental)
+
+    def file_row(self, filename: str):
+        return self.cursor.execute(
+            "SELECT id, filename, size, mtime, inode, is_missing FROM files WHERE filename=?",
+            (filename,)
+        ).fetchone()
+
+    def test_records_stats(self):
+        row = self.file_row("Nobody.mkv")
+        st = os.stat(os.path.join(self.library.name, "Nobody.mkv"))
+        assert row[2:] == (st.st_size, st.st_mtime_ns, st.st_ino, 0)
+
+    def test_skips_unchanged(self):
+        self.cursor.execute("DELETE FROM participation")
+        self.connection.commit()
+        self.readdir()
+        assert self.cursor.execute("SELECT COUNT(*) FROM participation").fetchone()[0] == 0
+        self.readdir(incremental=False)
+        assert self.cursor.execute("SELECT COUNT(*) FROM participation").fetchone()[0] == 1
+
+    def test_reindexes_changed(self):
+        self.cursor.execute("DELETE FROM participation")
+        self.connection.commit()
+        with open(os.path.join(self.library.name, "Emily Browning - Sucker Punch.mp4"), "w") as f:
+            f.write("director's cut")
+        self.readdir()
+        assert self.cursor.execute("SELECT COUNT(*) FROM participation").fetchone()[0] == 1
+
+    def test_tombstones_removed(self):
+        os.remove(os.path.join(self.library.name, "Nobody.mkv"))
+        self.readdir()
+        assert self.file_row("Nobody.mkv")[5] == 1
+        assert self.file_row("Emily Browning - Sucker Punch.mp4")[5] == 0
+
+        open(os.path.join(self.library.name, "Nobody.mkv"), "w").close()
+        self.readdir()
+        assert self.file_row("Nobody.mkv")[5] == 0
+
+    def test_detects_moves(self):
+        before = self.file_row("Nobody.mkv")
+        os.mkdir(os.path.join(self.library.name, "archive"))
+        os.rename(
+            os.path.join(self.library.name, "Nobody.mkv"),
+            os.path.join(self.library.name, "archive", "Nobody Again.mkv")
+        )
+        self.readdir()
+        assert self.file_row("Nobody.mkv") is None
+        after = self.file_row("Nobody Again.mkv")
+        assert after[0] == before[0]
+        assert after[5] == 0
+        assert self.cursor.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 2
+
+    def performers(self, file_id: int):
+        return sorted(self.cursor.execute(
+            """SELECT firstname, lastname FROM persons
+            JOIN participation ON participation.person_id=persons.id
+            WHERE participation.file_id=?""",
+            (file_id,)
+        ).fetchall())
+
+    def test_rename_replaces_parsed_performers(self):
+        file_id = self.file_row("Emily Browning - Sucker Punch.mp4")[0]
+        director = self.insert(PersonIndexRecord, None, "Zack", "Snyder", NameDecisionRule.MANUAL_INPUT, 0)
+        self.cursor.execute("INSERT INTO participation (person_id, file_id) VALUES (?, ?)", (director.id, file_id))
+        self.connection.commit()
+        os.rename(
+            os.path.join(self.library.name, "Emily Browning - Sucker Punch.mp4"),
+            os.path.join(self.library.name, "Jane Watson - Sucker Punch.mp4")
+        )
+        self.readdir()
+        assert self.file_row("Jane Watson - Sucker Punch.mp4")[0] == file_id
+        assert self.performers(file_id) == [("Jane", "Watson"), ("Zack", "Snyder")]
+
+    def test_takes_over_moves_with_a_new_inode(self):
+        before = self.file_row("Nobody.mkv")
+        old_path = os.path.join(self.library.name, "Nobody.mkv")
+        os.mkdir(os.path.join(self.library.name, "archive"))
+        # A copy and delete gives the file a new inode.
+        shutil.copy(old_path, os.path.join(self.library.name, "archive", "Nobody.mkv"))
+        os.remove(old_path)
+        self.readdir()
+        after = self.file_row("Nobody.mkv")
+        assert after[0] == before[0]
+        assert after[5] == 0
+        assert self.cursor.execute("SELECT fullpath FROM files WHERE id=?", (after[0],)).fetchone()[0] == (
+            os.path.join(self.library.name, "archive", "")
+        )
+
+    def test_takes_over_missing_files(self):
+        os.mkdir(os.path.join(self.library.name, "archive"))
+        os.rename(os.path.join(self.library.name, "Nobody.mkv"), os.path.join(self.library.name, "archive", "Nobody.mkv"))
+        self.cursor.execute("UPDATE files SET is_missing=1, inode=NULL WHERE filename='Nobody.mkv'")
+        self.connection.commit()
+        self.indexerdem.index("Nobody.mkv", os.path.join(self.library.name, "archive"))
+        row = self.file_row("Nobody.mkv")
+        assert row[5] == 0
+        assert self.cursor.execute("SELECT fullpath FROM files WHERE id=?", (row[0],)).fetchone()[0] == (
+            os.path.join(self.library.name, "archive", "")
+        )
+
+class IndexerdemStreamingTests(SQLiteTest):
+
+    def setUp(self):
+        super().setUp()
+        self.library = tempfile.TemporaryDirectory()
+        for fname in ("Emily Browning - Sucker Punch.mp4", "Emily Browning - Extras.mp4", "Nobody.mkv", "notes.txt", "README"):
+            open(os.path.join(self.library.name, fname), "w").close()
+
+    def tearDown(self):
+        self.library.cleanup()
+        super().tearDown()
+
+    def test_results(self):
+        events = list(self.indexerdem.iter_index([self.library.name], batch_size=2))
+        results = [event for event in events if isinstance(event, IndexResult)]
+        assert sorted(result.filename for result in results) == [
+            "Emily Browning - Extras.mp4", "Emily Browning - Sucker Punch.mp4", "Nobody.mkv"
+        ]
+        assert all(result.file_id is not None and result.error is None for result in results)
+        browning = [result for result in results if result.names]
+        assert sum(len(result.new_persons) for result in browning) == 1
+        assert sum(len(result.existing_persons) for result in browning) == 1
+
+        progress = events[-1]
+        assert isinstance(progress, IndexProgress)
+        assert progress.done
+        assert progress.indexed == 3
+        assert progress.new_persons == 1
+        # The connection stays usable.
+        assert len(self.indexerdem.fetch_files()) == 3
+
+    def test_progress_snapshots(self):
+        events = list(self.indexerdem.iter_index([self.library.name], batch_size=1, progress_seconds=0))
+        snapshots = [event for event in events if isinstance(event, IndexProgress)]
+        assert len(snapshots) == 4
+        assert [snapshot.indexed for snapshot in snapshots] == [1, 2, 3, 3]
+        assert [snapshot.done for snapshot in snapshots] == [False, False, False, True]
+
+    def test_files_and_errors(self):
+        path = os.path.join(self.library.name, "Nobody.mkv")
+        gone = os.path.join(self.library.name, "Gone.mp4")
+        events = list(self.indexerdem.iter_index([path, gone]))
+        assert [(event.filename, event.error is None) for event in events[:-1]] == [
+            ("Gone.mp4", False), ("Nobody.mkv", True)
+        ]
+        # Unchanged files are skipped on the next run.
+        progress = list(self.indexerdem.iter_index([path]))[-1]
+        assert progress.indexed == 0 and progress.skipped == 1
+
+    def test_stop_early(self):
+        events = self.indexerdem.iter_index([self.library.name], batch_size=1)
+        first = next(events)
+        assert isinstance(first, IndexResult)
+        events.close()
+        assert len(self.indexerdem.fetch_files()) >= 1
+        # Nothing was flagged missing for the files never reached.
+        assert self.cursor.execute("SELECT COUNT(*) FROM files WHERE is_missing=1").fetchone()[0] == 0
+
+class PersonCacheTests(SQLiteTest):
+
+    def setUp(self):
+        super().setUp()
+        self.browning = self.insert(PersonIndexRecord, None, "Emily", "Browning", NameDecisionRule.ALMOST_CERTAIN, 0)
+        self.connection.commit()
+
+    def test_warm(self):
+        cache = PersonCache()
+        cache.warm(self.cursor)
+        assert cache.find(self.cursor, "Emily", "Browning") == self.browning
+        self.insert(PersonIndexRecord, None, "Emma", "Stone", NameDecisionRule.ALMOST_CERTAIN, 0)
+        # A warm cache never goes to the index.
+        assert cache.find(self.cursor, "Emma", "Stone") is None
+
+    def test_cold(self):
+        cache = PersonCache()
+        assert cache.find(self.cursor, "Emma", "Stone") is None
+        assert cache.find(self.cursor, "Emily", "Browning") == self.browning
+
+    def test_rollback(self):
+        cache = PersonCache()
+        cache.warm(self.cursor)
+        mark = cache.mark()
+        stone = PersonIndexRecord(None, "Emma", "Stone", NameDecisionRule.ALMOST_CERTAIN)
+        cache.add(stone)
+        assert cache.find(self.cursor, "Emma", "Stone") == stone
+        cache.rollback_to(mark)
+        assert cache.find(self.cursor, "Emma", "Stone") is None
+        assert cache.find(self.cursor, "Emily", "Browning") == self.browning
+
+    def count_selects(self, filename: str) -> int:
+        statements: list[str] = []
+        with tempfile.TemporaryDirectory() as library:
+            open(os.path.join(library, filename), "w").close()
+            indexer = Indexerdem(self.db_path, self.indexerdem.locales)
+            indexer.conn.set_trace_callback(statements.append)
+            indexer.readdir(library)
+        return len([stmt for stmt in statements if stmt.lstrip().startswith("SELECT")])
+
+    def test_selects_independent_of_performers(self):
+        assert (
+            self.count_selects("Emma Stone - La La Land.mp4") ==
+            self.count_selects("Anne Smith, Jane Watson and Mary Stone.mp4")
+        )
+        assert self.cursor.execute("SELECT COUNT(*) FROM persons").fetchone()[0] == 5
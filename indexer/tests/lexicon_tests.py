@@ -0,0 +1,49 @@
+from ..lexicon import Lexicon, build_lexicon, lexicon_path, load_lexicon, read_lexicon, save_lexicon
+from ..indexerdem import Indexerdem
+
+from unittest import mock
+
+import os
+import tempfile
+import unittest
+
+class LexiconTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.locales = ("en_US", "en_GB")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_round_trip(self):
+        lexicon = Lexicon({"Jane", "Mary"}, {"Doe", "Watson"})
+        path = lexicon_path(self.locales, self.tempdir.name)
+        save_lexicon(lexicon, self.locales, path)
+        assert read_lexicon(self.locales, path) == lexicon
+        # Locale order does not matter.
+        assert read_lexicon(tuple(reversed(self.locales)), path) == lexicon
+
+    def test_key_mismatch(self):
+        path = lexicon_path(self.locales, self.tempdir.name)
+        save_lexicon(Lexicon({"Jane"}, {"Doe"}), self.locales, path)
+        assert read_lexicon(("en_US",), path) is None
+        with mock.patch("indexer.lexicon.faker_version", return_value="0.0.0"):
+            assert read_lexicon(self.locales, path) is None
+
+    def test_load_builds_once(self):
+        path = lexicon_path(self.locales, self.tempdir.name)
+        assert not os.path.exists(path)
+        built = load_lexicon(self.locales, self.tempdir.name)
+        assert os.path.exists(path)
+        assert built == build_lexicon(self.locales)
+
+        with mock.patch("indexer.lexicon.build_lexicon") as build:
+            assert load_lexicon(self.locales, self.tempdir.name) == built
+            build.assert_not_called()
+
+    def test_indexerdem_uses_lexicon(self):
+        save_lexicon(Lexicon({"Zelda"}, {"Hyrule"}), self.locales, lexicon_path(self.locales, self.tempdir.name))
+        indexerdem = Indexerdem(":memory:", self.locales, lexicon_dir=self.tempdir.name)
+        assert indexerdem.first_names_female == {"Zelda"}
+        assert indexerdem.parse("Zelda Hyrule.mp4")[0][:2] == ("Zelda", "Hyrule")
@@ -0,0 +1,119 @@
+from .base import SQLiteTest
+
+from .. import migrations
+from ..errors import MigrationError
+from ..indexerdem import Indexerdem
+from ..migrations import MIGRATIONS, Migration, migrate, pending_migrations
+from ..reader import IndexReader, MetadataCheckResult
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from unittest import mock
+
+# The index as the first release of the indexer created it.
+INDEX_1_0 = """
+CREATE TABLE __metadata (key TEXT PRIMARY KEY NOT NULL, val TEXT NOT NULL);
+CREATE TABLE files
+    (id INTEGER PRIMARY KEY ASC,
+     filename TEXT UNIQUE NOT NULL,
+     fullpath TEXT NOT NULL,
+     rating TINYINT DEFAULT 0 CHECK (0 <= rating AND rating <= 10),
+     review TEXT);
+CREATE TABLE persons
+    (id INTEGER PRIMARY KEY ASC,
+     firstname TEXT NOT NULL,
+     lastname TEXT,
+     extraction_rule TEXT NOT NULL,
+     is_deactivated TINYINT DEFAULT 0 NOT NULL,
+     UNIQUE(firstname, lastname));
+CREATE TABLE participation
+    (person_id INTEGER,
+     file_id INTEGER,
+     is_certain INTEGER NOT NULL DEFAULT 1,
+     FOREIGN KEY(person_id) REFERENCES persons(id),
+     FOREIGN KEY(file_id) REFERENCES files(id),
+     UNIQUE(person_id, file_id));
+INSERT INTO __metadata VALUES ('indexer_version', '1.0.0'), ('index_version', '1.0');
+INSERT INTO files (id, filename, fullpath) VALUES (1, 'Jane Doe.mp4', '/movies/');
+INSERT INTO persons (id, firstname, lastname, extraction_rule) VALUES (1, 'Jane', 'Doe', 'almost-certain');
+INSERT INTO participation (person_id, file_id) VALUES (1, 1);
+"""
+
+class MigrationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "cache.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript(INDEX_1_0)
+        conn.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_latest_is_index_version(self):
+        assert MIGRATIONS[-1].version == IndexReader.INDEX_VERSION
+        assert pending_migrations(IndexReader.INDEX_VERSION) == []
+        assert pending_migrations(None) == list(MIGRATIONS)
+
+    def test_upgrade_in_place(self):
+        reader = IndexReader(self.db_path)
+        assert reader.check_compatibility() == MetadataCheckResult.MIGRATABLE
+        applied = migrate(reader.conn)
+        assert [migration.version for migration in applied] == ["2.0", "2.1", "2.2"]
+        assert reader.check_compatibility() == MetadataCheckResult.COMPLETELY_COMPATIBLE
+        assert migrate(reader.conn) == []
+
+        # Nothing was lost on the way.
+        assert [record.filename for record in reader.fetch_files()] == ["Jane Doe.mp4"]
+        columns = set(row[1] for row in reader.conn.execute("PRAGMA table_info(files)"))
+        assert {"size", "mtime", "inode", "is_missing"} <= columns
+        reader.conn.close()
+
+    def test_init_migrates(self):
+        indexer = Indexerdem(self.db_path)
+        indexer.init()
+        assert indexer.check_compatibility() == MetadataCheckResult.COMPLETELY_COMPATIBLE
+        indexer.index("Jane Doe - Extras.mp4", "/movies")
+        assert indexer.conn.execute("SELECT COUNT(*) FROM participation").fetchone()[0] == 2
+        indexer.conn.close()
+
+    def test_failed_migration(self):
+        def fail(cursor):
+            cursor.execute("CREATE INDEX half_done ON files (review)")
+            raise sqlite3.OperationalError("disk on fire")
+
+        conn = sqlite3.connect(self.db_path)
+        with mock.patch.object(migrations, "MIGRATIONS", (MIGRATIONS[0], Migration("2.1", "Fails", fail))):
+            try:
+                migrate(conn)
+                assert False, "Expected the migration to fail"
+            except MigrationError as e:
+                assert e.version == "2.1"
+        # Left at the last version that went through, without any of the
+        # failed migration's changes.
+        assert conn.execute("SELECT val FROM __metadata WHERE key='index_version'").fetchone()[0] == "2.0"
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name='half_done'").fetchone()[0] == 0
+        conn.close()
+
+class QueryPlanTests(SQLiteTest):
+
+    def plan(self, query, *args):
+        return " ".join(row[3] for row in self.cursor.execute(f"EXPLAIN QUERY PLAN {query}", args))
+
+    def test_lookups_use_indices(self):
+        assert "participation_by_file" in self.plan("SELECT person_id FROM participation WHERE file_id=?", 1)
+        assert "SCAN" not in self.plan("SELECT file_id FROM participation WHERE person_id=?", 1)
+        assert "SCAN" not in self.plan("SELECT id, filename, fullpath FROM files WHERE filename IN (?, ?)", "a", "b")
+        assert "SCAN" not in self.plan("SELECT id FROM persons WHERE firstname=? AND lastname IS NULL", "Zendaya")
+        # The backend's /file/:fileid query.
+        assert "SCAN participation" not in self.plan(
+            """SELECT persons.id, files.filename FROM files
+            LEFT JOIN participation ON participation.file_id=files.id
+            LEFT JOIN persons ON persons.id=participation.person_id AND persons.is_deactivated=0
+            WHERE files.id=?""",
+            1
+        )
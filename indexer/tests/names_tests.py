@@ -0,0 +1,100 @@
+from ..names import NameMatcher, NameMemo
+from ..data import NameDecisionRule
+
+import unittest
+
+class NameMatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = NameMatcher(
+            ("Jane", "Mary", "Katie", "Emily"),
+            ("Doe", "Watson", "Browning")
+        )
+
+    def test_two_part_names(self):
+        assert self.matcher.find("jane doe - beach day") == [
+            ("Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN)
+        ]
+        assert self.matcher.find("Jane.Doe_Emily Browning") == [
+            ("Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN),
+            ("Emily", "Browning", NameDecisionRule.ALMOST_CERTAIN),
+        ]
+
+    def test_middle_names(self):
+        assert self.matcher.find("Mary Jane Watson interview") == [
+            ("Mary Jane", "Watson", NameDecisionRule.ALMOST_CERTAIN)
+        ]
+        # No more than MAX_NAME_TOKENS words to a name.
+        assert self.matcher.find("Mary Jane Katie Emily Watson") == [
+            ("Mary", None, NameDecisionRule.TRUNCATED_FIRSTNAME),
+            ("Jane Katie Emily", "Watson", NameDecisionRule.ALMOST_CERTAIN),
+        ]
+
+    def test_possessives(self):
+        assert self.matcher.find("Jane Doe's birthday") == [
+            ("Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN)
+        ]
+
+    def test_fallback_rules(self):
+        assert self.matcher.find("Emily") == [
+            ("Emily", None, NameDecisionRule.TRUNCATED_FIRSTNAME)
+        ]
+        assert self.matcher.find("John Watson") == [
+            ("John", "Watson", NameDecisionRule.LASTNAME_BACKWARD)
+        ]
+        assert self.matcher.find("Watson") == []
+
+    def test_find_many(self):
+        haystacks = ["", "Jane", "Doe", "- Mary Watson -", "nothing here", "Emily Browning"]
+        assert self.matcher.find_many(haystacks) == [self.matcher.find(h) for h in haystacks]
+        assert self.matcher.find_many(haystacks)[1] == [
+            ("Jane", None, NameDecisionRule.TRUNCATED_FIRSTNAME)
+        ]
+        assert self.matcher.find_many([]) == []
+
+class NameMemoTests(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = NameMatcher(("Jane", "John"), ("Doe", "Watson"), memo_size=2)
+
+    def test_series_share_an_entry(self):
+        episodes = [f"Jane Doe Show S01E{i:02d} 1080p" for i in range(1, 11)]
+        results = self.matcher.find_many(episodes)
+        assert all(names == [("Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN)] for names in results)
+        assert self.matcher.memo.misses == 1
+        assert self.matcher.memo.hits == 9
+        assert self.matcher.find("Jane Doe Show S02E01 2160p") == results[0]
+        assert self.matcher.memo.hits == 10
+        assert len(self.matcher.memo) == 1
+
+    def test_digits_in_names_are_not_stored(self):
+        assert self.matcher.find("2019 Watson") == [("2019", "Watson", NameDecisionRule.LASTNAME_BACKWARD)]
+        assert self.matcher.find("2020 Watson") == [("2020", "Watson", NameDecisionRule.LASTNAME_BACKWARD)]
+        assert len(self.matcher.memo) == 0
+
+    def test_bounded(self):
+        for haystack in ("Jane Doe", "John Doe", "Jane Watson"):
+            self.matcher.find(haystack)
+        assert len(self.matcher.memo) == 2
+        self.matcher.find("Jane Doe")
+        assert self.matcher.memo.hits == 0
+
+    def test_results_are_copies(self):
+        self.matcher.find("Jane Doe").clear()
+        assert self.matcher.find("Jane Doe") == [("Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN)]
+
+    def test_rests_when_missing(self):
+        matcher = NameMatcher(("Jane",), ("Doe",))
+        matcher.find_many(["Jane Doe " + "x" * i for i in range(NameMemo.WINDOW)])
+        assert len(matcher.memo) == NameMemo.WINDOW
+        # Not even looked up, let alone stored.
+        assert matcher.find("Jane Doe") == [("Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN)]
+        assert matcher.find("Jane Doe") == [("Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN)]
+        assert len(matcher.memo) == NameMemo.WINDOW
+        assert matcher.memo.hits == 0
+        assert matcher.memo.misses == NameMemo.WINDOW + 2
+
+    def test_disabled(self):
+        matcher = NameMatcher(("Jane",), ("Doe",), memo_size=0)
+        assert matcher.memo is None
+        assert matcher.find("Jane Doe") == [("Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN)]
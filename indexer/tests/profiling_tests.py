@@ -0,0 +1,69 @@
+from .base import SQLiteTest
+
+from ..profiling import ProfilingHook, Stage, StageTimer
+
+import json
+import os
+import tempfile
+
+class RecordingHook(ProfilingHook):
+
+    def __init__(self):
+        self.records = []
+        self.runs = 0
+
+    def record(self, stage, seconds, items):
+        self.records.append((stage, seconds, items))
+
+    def finished(self):
+        self.runs += 1
+
+class ProfilingTests(SQLiteTest):
+
+    def setUp(self):
+        super().setUp()
+        self.library = tempfile.TemporaryDirectory()
+        for fname in ("Emily Browning - Sucker Punch.mp4", "Nobody.mkv", "Mary Jane Watson.avi"):
+            open(os.path.join(self.library.name, fname), "w").close()
+
+    def tearDown(self):
+        self.library.cleanup()
+        super().tearDown()
+
+    def test_hook_sees_every_stage(self):
+        hook = RecordingHook()
+        self.indexerdem.add_hook(hook)
+        list(self.indexerdem.iter_index([self.library.name], batch_size=2))
+        assert set(stage for stage, _, _ in hook.records) == set(Stage)
+        assert all(seconds >= 0 for _, seconds, _ in hook.records)
+        assert sum(items for stage, _, items in hook.records if stage is Stage.WALK) == 3
+        assert sum(items for stage, _, items in hook.records if stage is Stage.COMMIT) == 3
+        assert hook.runs == 1
+
+        self.indexerdem.remove_hook(hook)
+        self.indexerdem.index("Emily Browning - Extras.mp4", "/movies")
+        assert hook.runs == 1
+        assert sum(items for stage, _, items in hook.records if stage is Stage.COMMIT) == 3
+
+    def test_single_file_stages(self):
+        hook = RecordingHook()
+        self.indexerdem.add_hook(hook)
+        self.indexerdem.index("Emily Browning - Extras.mp4", "/movies")
+        assert [stage for stage, _, _ in hook.records] == [
+            Stage.FILES, Stage.NORMALIZE, Stage.FIND_NAMES, Stage.PERSONS, Stage.PARTICIPATION, Stage.COMMIT
+        ]
+
+    def test_stage_timer(self):
+        with tempfile.TemporaryDirectory() as out:
+            json_path = os.path.join(out, "stages.json")
+            timer = StageTimer(json_path=json_path)
+            self.indexerdem.add_hook(timer)
+            list(self.indexerdem.iter_index([self.library.name]))
+            with open(json_path) as json_file:
+                summary = json.load(json_file)
+        assert summary["walk"]["items"] == 3
+        assert summary["find-names"]["items"] == 3
+        assert summary["commit"]["calls"] == 1
+        table = timer.format_table()
+        assert table.splitlines()[1].startswith("walk")
+        assert "participation" in table
@@ -0,0 +1,144 @@
+from .base import SQLiteTest
+
+from ..data import FileIndexRecord, FileListing, PersonIndexRecord
+from ..indexerdem import NameDecisionRule
+from ..reader import FileOrder, IndexReader, MetadataCheckResult
+
+import sqlite3
+
+class IndexReaderTests(SQLiteTest):
+
+    def setUp(self):
+        super().setUp()
+        self.reader = IndexReader(self.db_path, read_only=True)
+
+    def tearDown(self):
+        self.reader.conn.close()
+        super().tearDown()
+
+    def test_queries(self):
+        record = self.insert(FileIndexRecord, None, "Jane Doe.mp4", "/", "", 3)
+        person = self.insert(PersonIndexRecord, None, "Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN, 0)
+        self.connection.commit()
+        assert self.reader.check_compatibility() == MetadataCheckResult.COMPLETELY_COMPATIBLE
+        assert self.reader.fetch_files() == (record,)
+        assert self.reader.get_file_record_from_id(record.id) == record
+        assert self.reader.search_files("jane") == (record,)
+        assert self.reader.fetch_persons(False) == (person,)
+        assert self.reader.search_performers("doe") == (person,)
+
+    def test_lazy_review(self):
+        record = self.insert(FileIndexRecord, None, "Jane Doe.mp4", "/", "A" * 4096, 3)
+        self.connection.commit()
+        queries = []
+        self.reader.conn.set_trace_callback(queries.append)
+        (fetched,) = self.reader.fetch_files()
+        assert fetched.filename == "Jane Doe.mp4" and fetched.rating == 3
+        assert not any("review" in query for query in queries)
+        assert fetched.review == record.review
+        assert fetched == record
+        self.reader.conn.set_trace_callback(None)
+
+    def test_listings(self):
+        record = self.insert(FileIndexRecord, None, "Jane Doe.mp4", "/", "", 3)
+        jane = self.insert(PersonIndexRecord, None, "Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN, 0)
+        self.insert(PersonIndexRecord, None, "John", "Doe", NameDecisionRule.ALMOST_CERTAIN, 1)
+        self.connection.commit()
+        assert self.reader.fetch_file_listings() == (FileListing(record.id, "Jane Doe.mp4"),)
+        assert [str(listing) for listing in self.reader.fetch_person_listings(False)] == [str(jane)]
+        assert len(self.reader.fetch_person_listings()) == 2
+
+    def test_read_only(self):
+        record = FileIndexRecord(None, "Jane Doe.mp4", "/", "", 3)
+        try:
+            record.insert(self.reader.conn.cursor())
+            assert False, "Expected the insert to be refused"
+        except sqlite3.OperationalError:
+            pass
+
+class SearchTests(SQLiteTest):
+
+    def setUp(self):
+        super().setUp()
+        self.indexerdem.index_many((
+            ("Jane Doe - Interview.mp4", "/shows"),
+            ("Interview with Jane Doe and John Doe.mp4", "/shows"),
+            ("Sunset \"Live\".mkv", "/concerts"),
+            ("Nobody.avi", "/movies"),
+        ))
+
+    def filenames(self, searchterm):
+        return [record.filename for record in self.indexerdem.search_files(searchterm)]
+
+    def test_search_files(self):
+        assert sorted(self.filenames("doe")) == ["Interview with Jane Doe and John Doe.mp4", "Jane Doe - Interview.mp4"]
+        assert self.filenames("INTERVIEW WITH") == ["Interview with Jane Doe and John Doe.mp4"]
+        assert self.filenames('"live"') == ['Sunset "Live".mkv']
+        assert self.filenames("body") == ["Nobody.avi"]
+        # Too short for trigrams.
+        assert self.filenames("No") == ["Nobody.avi"]
+        assert self.filenames("nope") == []
+
+    def test_ranking(self):
+        # More occurrences in a shorter name rank higher.
+        self.indexerdem.index_many((("Doe Doe Doe.mp4", "/shows"),))
+        assert self.filenames("doe")[0] == "Doe Doe Doe.mp4"
+
+    def test_kept_in_sync(self):
+        cursor = self.cursor
+        cursor.execute("UPDATE files SET filename='Nothing to See.avi' WHERE filename='Nobody.avi'")
+        cursor.execute("DELETE FROM participation")
+        cursor.execute("DELETE FROM files WHERE filename='Jane Doe - Interview.mp4'")
+        self.connection.commit()
+        assert self.filenames("nobody") == []
+        assert self.filenames("nothing") == ["Nothing to See.avi"]
+        assert self.filenames("jane") == ["Interview with Jane Doe and John Doe.mp4"]
+
+    def test_search_performers(self):
+        jane = self.insert(PersonIndexRecord, None, "Jane", "Doe", NameDecisionRule.ALMOST_CERTAIN, 0)
+        john = self.insert(PersonIndexRecord, None, "John", "Doe", NameDecisionRule.ALMOST_CERTAIN, 0)
+        self.insert(PersonIndexRecord, None, "Zendaya", None, NameDecisionRule.MANUAL_INPUT, 0)
+        self.connection.commit()
+        doe = self.indexerdem.search_performers("doe")
+        assert len(doe) == 2 and jane in doe and john in doe
+        assert john in self.indexerdem.search_performers("JOH")
+        assert [str(person) for person in self.indexerdem.search_performers("endaya")] == ["Zendaya"]
+
+class PagingTests(SQLiteTest):
+
+    def setUp(self):
+        super().setUp()
+        cursor = self.cursor
+        cursor.executemany(
+            "INSERT INTO files (filename, fullpath) VALUES (?, '/')", ((f"Clip {i:02}.mp4",) for i in reversed(range(25)))
+        )
+        cursor.executemany(
+            "INSERT INTO persons (firstname, lastname, extraction_rule, is_deactivated) VALUES (?, NULL, 'manual-input', ?)",
+            ((f"Person {i}", i % 2) for i in range(25))
+        )
+        self.connection.commit()
+
+    def test_fetch_files_limit(self):
+        assert len(self.indexerdem.fetch_files(3)) == 3
+
+    def test_files_page(self):
+        first = self.indexerdem.fetch_files_page(size=10)
+        assert [record.id for record in first.records] == list(range(1, 11))
+        assert first.resume_token == 10
+        last = self.indexerdem.fetch_files_page(after=20, size=10)
+        assert [record.id for record in last.records] == list(range(21, 26))
+        assert last.resume_token is None
+
+        by_name = self.indexerdem.fetch_files_page(after="Clip 04.mp4", size=2, order_by=FileOrder.FILENAME)
+        assert [record.filename for record in by_name.records] == ["Clip 05.mp4", "Clip 06.mp4"]
+        assert by_name.resume_token == "Clip 06.mp4"
+
+    def test_iter_files(self):
+        by_name = [record.filename for record in self.indexerdem.iter_files(page_size=4, order_by=FileOrder.FILENAME)]
+        assert by_name == [f"Clip {i:02}.mp4" for i in range(25)]
+        assert len(list(self.indexerdem.iter_files(after=5, page_size=5))) == 20
+
+    def test_iter_persons(self):
+        active = list(self.indexerdem.iter_persons(page_size=3, activity_status=False))
+        assert [person.firstname for person in active] == [f"Person {i}" for i in range(0, 25, 2)]
+        assert len(list(self.indexerdem.iter_persons(after=active[-2].id))) == 2
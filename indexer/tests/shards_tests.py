@@ -0,0 +1,116 @@
+from ..indexerdem import Indexerdem, index_shards
+from ..shards import Shard, ShardedIndex, ShardSet, global_id, split_global_id
+
+import os
+import sqlite3
+import tempfile
+import unittest
+
+class ShardSetTests(unittest.TestCase):
+
+    def test_global_id(self):
+        assert split_global_id(global_id(3, 41)) == (3, 41)
+        assert global_id(0, 1) != global_id(1, 1)
+
+    def test_from_roots(self):
+        shard_set = ShardSet.from_roots("/indices", ["/media/movies", "/media/clips/"])
+        assert len(shard_set) == 2
+        assert shard_set.shard_of("/media/clips/Emily Browning.mp4") == 1
+        assert shard_set.shard_of("/media/music/Song.mp3") is None
+        assert ShardSet.from_roots("/indices", ["/media/movies"]).shards[0] == shard_set.shards[0]
+        try:
+            ShardSet([])
+            assert False, "Expected an empty shard set to be refused"
+        except ValueError:
+            pass
+
+class ShardedIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        libraries = (
+            [("Jennifer Lawrence - Passengers.mp4", "/movies"), ("Emily Browning - Sucker Punch.mp4", "/movies")],
+            [("Emily Browning - Sleeping Beauty.mp4", "/clips")],
+        )
+        shards = []
+        for i, entries in enumerate(libraries):
+            shard = Shard(entries[0][1], os.path.join(self.directory.name, f"shard-{i}.db"))
+            indexer = Indexerdem(shard.index_filename)
+            indexer.init()
+            indexer.index_many(entries)
+            indexer.conn.execute("UPDATE files SET review=filename")
+            indexer.conn.commit()
+            indexer.conn.close()
+            shards.append(shard)
+        self.index = ShardedIndex(ShardSet(shards))
+
+    def tearDown(self):
+        self.index.close()
+        self.directory.cleanup()
+
+    def test_files(self):
+        files = self.index.fetch_files()
+        assert [record.filename for record in files] == [
+            "Jennifer Lawrence - Passengers.mp4",
+            "Emily Browning - Sucker Punch.mp4",
+            "Emily Browning - Sleeping Beauty.mp4",
+        ]
+        assert len({record.id for record in files}) == 3
+        sleeping_beauty = self.index.get_file_record_from_id(files[2].id)
+        assert sleeping_beauty.fullpath == "/clips/" and sleeping_beauty.id == files[2].id
+        # Reviews are loaded through the global id.
+        assert files[2].review == files[2].filename
+        assert self.index.fetch_review(files[1].id) == files[1].filename
+        assert [record.filename for record in self.index.search_files("browning")] == [
+            "Emily Browning - Sucker Punch.mp4",
+            "Emily Browning - Sleeping Beauty.mp4",
+        ]
+        assert sorted(listing.id for listing in self.index.fetch_file_listings()) == sorted(record.id for record in files)
+
+    def test_persons(self):
+        persons = self.index.fetch_persons()
+        # Emily Browning is in both shards but is only one person.
+        assert [(person.firstname, person.lastname) for person in persons] == [
+            ("Jennifer", "Lawrence"), ("Emily", "Browning")
+        ]
+        emily = persons[1]
+        assert emily.id == global_id(0, 2)
+        assert self.index.get_person_from_id(emily.id).id == emily.id
+        assert [person.id for person in self.index.search_performers("browning")] == [emily.id]
+
+        performances = self.index.fetch_performances(emily)
+        assert sorted(record.filename for record in performances.files) == [
+            "Emily Browning - Sleeping Beauty.mp4", "Emily Browning - Sucker Punch.mp4"
+        ]
+        sleeping_beauty = self.index.search_files("sleeping")[0]
+        (performer,) = self.index.fetch_performances(sleeping_beauty).performers
+        assert performer.id == emily.id
+
+    def test_persons_inactive_in_first_shard(self):
+        with sqlite3.connect(self.index.shard_set.shards[0].index_filename) as conn:
+            conn.execute("UPDATE persons SET is_deactivated=1 WHERE firstname='Emily'")
+        conn.close()
+        emily_id = global_id(0, 2)
+        (emily,) = [person for person in self.index.fetch_persons(False) if person.firstname == "Emily"]
+        assert emily.id == emily_id
+        (emily_listing,) = [person for person in self.index.fetch_person_listings(False) if person.firstname == "Emily"]
+        assert emily_listing.id == emily_id
+        assert self.index.get_person_from_id(global_id(1, 1)).id == emily_id
+        sleeping_beauty = self.index.search_files("sleeping")[0]
+        (performer,) = self.index.fetch_performances(sleeping_beauty).performers
+        assert performer.id == emily_id
+
+class IndexShardsTests(unittest.TestCase):
+
+    def test_index_shards(self):
+        with tempfile.TemporaryDirectory() as directory:
+            roots = [os.path.join(directory, "movies"), os.path.join(directory, "clips")]
+            for root, filename in zip(roots, ["Emily Browning - Sucker Punch.mp4", "Emily Browning - Sleeping Beauty.mp4"]):
+                os.makedirs(root)
+                open(os.path.join(root, filename), "w").close()
+            shard_set = ShardSet.from_roots(directory, roots)
+            index_shards(shard_set, batch_size=10)
+            index = ShardedIndex(shard_set)
+            assert len(index.fetch_files()) == 2
+            assert len(index.fetch_persons()) == 1
+            index.close()
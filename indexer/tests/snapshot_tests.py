@@ -0,0 +1,118 @@
+from .base import SQLiteTest
+
+from ..data import FileIndexRecord, NameDecisionRule, PerformanceIndexRecord, PersonIndexRecord
+from ..errors import SnapshotError
+from ..reader import IndexReader
+from ..snapshot import export_snapshot, import_snapshot
+
+import io
+import msgpack # type: ignore[import-untyped]
+import os
+import sqlite3
+import tempfile
+
+class SnapshotTests(SQLiteTest):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.restored_path = os.path.join(self.directory.name, "restored.db")
+        dune = self.insert(FileIndexRecord, None, "Dune.mp4", "/movies", "Sand.", 8)
+        zendaya = self.insert(PersonIndexRecord, None, "Zendaya", None, NameDecisionRule.MANUAL_INPUT, 0)
+        self.insert(
+            PerformanceIndexRecord, dune, (zendaya,), insert_extra_args=PerformanceIndexRecord.ExtraArgs((1,))
+        )
+        self.insert(FileIndexRecord, None, "Sunset.mkv", "/concerts", None, 0)
+        self.connection.commit()
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super().tearDown()
+
+    def snapshot(self):
+        out = io.BytesIO()
+        counts = export_snapshot(self.connection, out)
+        return out.getvalue(), counts
+
+    def test_round_trip(self):
+        snapshot, counts = self.snapshot()
+        assert counts["files"] == 2 and counts["persons"] == 1 and counts["participation"] == 1
+        assert import_snapshot(io.BytesIO(snapshot), self.restored_path) == counts
+
+        restored = IndexReader(self.restored_path)
+        assert restored.fetch_files() == self.indexerdem.fetch_files()
+        assert restored.fetch_persons() == self.indexerdem.fetch_persons()
+        assert restored.fetch_index_version() == self.indexerdem.fetch_index_version()
+        # Search tables and secondary indices are rebuilt.
+        assert [record.filename for record in restored.search_files("une")] == ["Dune.mp4"]
+        indices = restored.conn.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall()
+        assert ("participation_by_file",) in indices
+        restored.conn.close()
+
+    def test_search_after_import(self):
+        snapshot, _ = self.snapshot()
+        import_snapshot(io.BytesIO(snapshot), self.restored_path)
+        conn = sqlite3.connect(self.restored_path)
+        # The triggers keeping the search tables in sync are restored too.
+        cursor = conn.cursor()
+        arrival = FileIndexRecord(None, "Arrival.mp4", "/movies", None, 0)
+        arrival.insert(cursor)
+        adams = PersonIndexRecord(None, "Amy", "Adams", NameDecisionRule.MANUAL_INPUT, 0)
+        adams.insert(cursor)
+        conn.commit()
+        conn.close()
+        restored = IndexReader(self.restored_path)
+        assert [record.filename for record in restored.search_files("arrival")] == ["Arrival.mp4"]
+        assert [person.lastname for person in restored.search_performers("adams")] == ["Adams"]
+        restored.conn.close()
+
+    def test_refuses_foreign_schema(self):
+        snapshot, _ = self.snapshot()
+        unpacker = msgpack.Unpacker(io.BytesIO(snapshot), use_list=False)
+        header = next(unpacker)
+        header["schema"] = list(header["schema"]) + [("table", "intruder", "CREATE TABLE intruder (x)")]
+        tampered = msgpack.packb(header) + snapshot[unpacker.tell():]
+        try:
+            import_snapshot(io.BytesIO(tampered), self.restored_path)
+            assert False, "Expected a table outside the index to be refused"
+        except SnapshotError:
+            pass
+        assert os.listdir(self.directory.name) == []
+
+    def test_refuses_foreign_triggers(self):
+        snapshot, _ = self.snapshot()
+        unpacker = msgpack.Unpacker(io.BytesIO(snapshot), use_list=False)
+        header = next(unpacker)
+        # On a table of the index, under the name of a search trigger.
+        intruder = (
+            "trigger", "files_search_insert",
+            "CREATE TRIGGER files_search_insert AFTER INSERT ON files BEGIN DELETE FROM persons; END"
+        )
+        header["schema"] = [entry for entry in header["schema"] if entry[1] != "files_search_insert"] + [intruder]
+        tampered = msgpack.packb(header) + snapshot[unpacker.tell():]
+        try:
+            import_snapshot(io.BytesIO(tampered), self.restored_path)
+            assert False, "Expected a trigger the migrations don't create to be refused"
+        except SnapshotError:
+            pass
+        assert os.listdir(self.directory.name) == []
+
+    def test_deterministic(self):
+        assert self.snapshot()[0] == self.snapshot()[0]
+
+    def test_refuses_existing_index(self):
+        snapshot, _ = self.snapshot()
+        try:
+            import_snapshot(io.BytesIO(snapshot), self.db_path)
+            assert False, "Expected an existing index to be left alone"
+        except FileExistsError:
+            pass
+
+    def test_truncated(self):
+        snapshot, _ = self.snapshot()
+        try:
+            import_snapshot(io.BytesIO(snapshot[:len(snapshot) // 2]), self.restored_path)
+            assert False, "Expected a truncated snapshot to be refused"
+        except SnapshotError:
+            pass
+        assert os.listdir(self.directory.name) == []
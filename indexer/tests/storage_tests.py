@@ -0,0 +1,171 @@
+from ..indexerdem import Indexerdem
+from ..reader import IndexReader
+from ..data import FileIndexRecord
+from ..storage import CONCURRENT_PROFILE, DEFAULT_PROFILE, ConnectionManager, checkpoint, connect, is_wal
+
+from concurrent.futures import ThreadPoolExecutor
+
+from dataclasses import replace
+
+import gc
+import os
+import sqlite3
+import threading
+import tempfile
+import unittest
+
+class StorageProfileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "index.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_default_profile(self):
+        conn = connect(self.db_path)
+        assert not is_wal(conn)
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == DEFAULT_PROFILE.busy_timeout_ms
+        assert checkpoint(conn) is None
+        conn.close()
+
+    def test_concurrent_profile(self):
+        conn = connect(self.db_path, CONCURRENT_PROFILE)
+        assert is_wal(conn)
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -CONCURRENT_PROFILE.cache_size_kib
+        conn.close()
+        # WAL sticks to the index.
+        conn = connect(self.db_path)
+        assert is_wal(conn)
+        conn.close()
+
+    def test_read_while_writing(self):
+        indexer = Indexerdem(self.db_path, storage=CONCURRENT_PROFILE)
+        indexer.init()
+        indexer.index("Emily Browning - Sucker Punch.mp4", "/movies")
+        # Fail right away should the reader be blocked after all.
+        reader = IndexReader(self.db_path, read_only=True, storage=replace(DEFAULT_PROFILE, busy_timeout_ms=0))
+
+        cursor = indexer.conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("INSERT INTO files (filename, fullpath) VALUES ('Uncommitted.mp4', '/movies/')")
+        # Readers see the last commit instead of waiting on the writer.
+        assert [record.filename for record in reader.fetch_files()] == ["Emily Browning - Sucker Punch.mp4"]
+        indexer.conn.commit()
+        assert len(reader.fetch_files()) == 2
+        reader.conn.close()
+
+        indexer.checkpoint()
+        assert os.path.getsize(f"{self.db_path}-wal") == 0
+        indexer.conn.close()
+
+class ConnectionManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "index.db")
+        self.indexer = Indexerdem(self.db_path, storage=CONCURRENT_PROFILE)
+        self.indexer.init()
+        self.indexer.index_many([(f"Clip {i}.mp4", "/clips") for i in range(20)])
+
+    def tearDown(self):
+        self.indexer.connections.close()
+        self.directory.cleanup()
+
+    def test_queries_from_workers(self):
+        def query(i):
+            assert len(self.indexer.fetch_files()) == 20
+            with self.indexer.reading() as cursor:
+                record = FileIndexRecord.fetch(cursor, i + 1)
+            return record.filename, threading.get_ident()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(query, range(20)))
+        assert sorted(filename for filename, _ in results) == sorted(f"Clip {i}.mp4" for i in range(20))
+
+    def test_writes_from_workers(self):
+        def rate(i):
+            with self.indexer.writing() as cursor:
+                record = FileIndexRecord.fetch(cursor, i + 1)
+                cursor.execute("UPDATE files SET rating=? WHERE id=?", (i % 10, record.id))
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(rate, range(20)))
+        with self.indexer.reading() as cursor:
+            ratings = cursor.execute("SELECT id, rating FROM files ORDER BY id").fetchall()
+        assert ratings == [(i + 1, i % 10) for i in range(20)]
+
+    def test_writing_rolls_back(self):
+        try:
+            with self.indexer.writing() as cursor:
+                cursor.execute("DELETE FROM participation")
+                cursor.execute("DELETE FROM files")
+                raise RuntimeError("changed my mind")
+        except RuntimeError:
+            pass
+        assert len(self.indexer.fetch_files()) == 20
+
+    def test_nested_writing(self):
+        try:
+            with self.indexer.writing() as outer:
+                # Nothing written yet, so no transaction is open on its own.
+                outer.execute("SELECT COUNT(*) FROM files")
+                with self.indexer.writing() as inner:
+                    inner.execute("INSERT INTO files (filename, fullpath) VALUES ('Inner.mp4', '/clips/')")
+                raise RuntimeError("changed my mind")
+        except RuntimeError:
+            pass
+        assert len(self.indexer.fetch_files()) == 20
+
+        with self.indexer.writing() as outer:
+            outer.execute("INSERT INTO files (filename, fullpath) VALUES ('Outer.mp4', '/clips/')")
+            try:
+                with self.indexer.writing() as inner:
+                    inner.execute("INSERT INTO files (filename, fullpath) VALUES ('Inner.mp4', '/clips/')")
+                    raise RuntimeError("changed my mind")
+            except RuntimeError:
+                pass
+        assert [record.filename for record in self.indexer.fetch_files()][20:] == ["Outer.mp4"]
+
+    def test_readers_close_with_their_threads(self):
+        readers = []
+
+        def read():
+            with self.indexer.connections.reading() as cursor:
+                readers.append(cursor.connection)
+                cursor.execute("SELECT COUNT(*) FROM files").fetchone()
+
+        for _ in range(3):
+            thread = threading.Thread(target=read)
+            thread.start()
+            thread.join()
+        gc.collect()
+        assert len(set(map(id, readers))) == 3
+        for conn in readers:
+            try:
+                conn.execute("SELECT 1")
+                assert False, "Expected the reader to be closed with its thread"
+            except sqlite3.ProgrammingError:
+                pass
+
+    def test_owner_reads_own_writes(self):
+        self.indexer.conn.execute("INSERT INTO files (filename, fullpath) VALUES ('Uncommitted.mp4', '/clips/')")
+        assert len(self.indexer.fetch_files()) == 21
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            assert pool.submit(lambda: len(self.indexer.fetch_files())).result() == 20
+        self.indexer.conn.rollback()
+
+    def test_in_memory(self):
+        connections = ConnectionManager(":memory:")
+        with connections.writing() as cursor:
+            cursor.execute("CREATE TABLE t (x)")
+            cursor.execute("INSERT INTO t VALUES (1)")
+
+        def count():
+            with connections.reading() as cursor:
+                return cursor.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            assert pool.submit(count).result() == 1
+        connections.close()
@@ -0,0 +1,88 @@
+from ..walker import PruneRules, get_ext, walk
+
+import os
+import tempfile
+import unittest
+
+class WalkerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.library = tempfile.TemporaryDirectory()
+        self.root = self.library.name
+        self.make("Emily Browning - Sucker Punch.mp4", b"x" * 10)
+        self.make("README")
+        self.make("notes.txt")
+        self.make("shows/Mary Jane Watson.avi", b"x" * 1000)
+        self.make("shows/.hidden clip.mkv")
+        self.make(".cache/thumbnail.mp4")
+        self.make(".Trash-1000/files/Deleted.mp4")
+        self.make("extras/.Trash/Also Deleted.flv")
+
+    def tearDown(self):
+        self.library.cleanup()
+
+    def make(self, relative, content=b""):
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+
+    def walked(self, rules=PruneRules(), extensions=("mp4", "avi", "mkv", "flv")):
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, filename), self.root)
+            for dirpath, filename, _ in walk(self.root, extensions, rules)
+        )
+
+    def test_get_ext(self):
+        assert get_ext("movie.mp4") == "mp4"
+        assert get_ext("archive.tar.gz") == "gz"
+        assert get_ext("README") == ""
+        assert get_ext("trailing.") == ""
+
+    def test_default_rules(self):
+        assert self.walked() == [
+            ".cache/thumbnail.mp4",
+            "Emily Browning - Sucker Punch.mp4",
+            "shows/.hidden clip.mkv",
+            "shows/Mary Jane Watson.avi",
+        ]
+
+    def test_stats(self):
+        stats = {filename: st for _, filename, st in walk(self.root, ("avi",))}
+        assert stats["Mary Jane Watson.avi"].st_size == 1000
+
+    def test_prune_rules(self):
+        assert self.walked(PruneRules(skip_hidden=True, skip_dirs=frozenset(("shows",)))) == [
+            "Emily Browning - Sucker Punch.mp4",
+        ]
+        assert self.walked(PruneRules(skip_trash=False, min_size=1)) == [
+            "Emily Browning - Sucker Punch.mp4",
+            "shows/Mary Jane Watson.avi",
+        ]
+        assert self.walked(PruneRules(max_size=100)) == [
+            ".cache/thumbnail.mp4",
+            "Emily Browning - Sucker Punch.mp4",
+            "shows/.hidden clip.mkv",
+        ]
+
+    def test_prunes_path(self):
+        rules = PruneRules(skip_hidden=True)
+        assert rules.prunes_path(self.root, os.path.join(self.root, ".cache", "a.mp4"), 0)
+        assert rules.prunes_path(self.root, os.path.join(self.root, ".Trash", "files", "a.mp4"), 0)
+        assert not rules.prunes_path(self.root, os.path.join(self.root, "shows", "a.mp4"), 0)
+        assert rules.prunes_subtree(self.root, os.path.join(self.root, "shows", ".cache"))
+        assert not rules.prunes_subtree(self.root, self.root)
+
+    def test_symlinks(self):
+        os.symlink(os.path.join(self.root, "shows"), os.path.join(self.root, "linked"))
+        # Loops back to the root.
+        os.symlink(self.root, os.path.join(self.root, "shows", "loop"))
+        assert "linked/Mary Jane Watson.avi" not in self.walked()
+
+        followed = self.walked(PruneRules(follow_symlinks=True))
+        # Each directory is walked once, under whichever path got to it first.
+        assert len([path for path in followed if path.endswith("Mary Jane Watson.avi")]) == 1
+        assert len([path for path in followed if path.endswith("Sucker Punch.mp4")]) == 1
+
+    def test_unreadable_root(self):
+        assert list(walk(os.path.join(self.root, "nope"), ("mp4",))) == []
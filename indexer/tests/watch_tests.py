@@ -0,0 +1,113 @@
+from .base import SQLiteTest
+
+from ..indexerdem import Indexerdem
+from ..watch import Change, ChangeKind, InotifyWatcher, PollingWatcher
+
+from typing import Callable
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+def wait_for(predicate: Callable[[], bool], timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return predicate()
+
+class WatcherTestsMixin(object):
+
+    def make_watcher(self, root: str):
+        raise NotImplementedError()
+
+    def test_create_and_remove(self):
+        with tempfile.TemporaryDirectory() as library:
+            watcher = self.make_watcher(library)
+            try:
+                path = os.path.join(library, "Nobody.mp4")
+                open(path, "w").close()
+                assert Change(ChangeKind.CREATED, path) in watcher.coalesce(0.2, timeout=2)
+                os.remove(path)
+                assert Change(ChangeKind.REMOVED, path) in watcher.coalesce(0.2, timeout=2)
+            finally:
+                watcher.close()
+
+    def test_coalesce(self):
+        with tempfile.TemporaryDirectory() as library:
+            watcher = self.make_watcher(library)
+            try:
+                os.mkdir(os.path.join(library, "season"))
+                for i in range(20):
+                    open(os.path.join(library, "season", f"Episode {i}.mp4"), "w").close()
+                time.sleep(0.1)
+                changes = watcher.coalesce(0.5, timeout=2)
+                created = set(c.path for c in changes if c.kind is ChangeKind.CREATED)
+                assert len(created) == 20
+            finally:
+                watcher.close()
+
+class PollingWatcherTests(WatcherTestsMixin, unittest.TestCase):
+
+    def make_watcher(self, root: str):
+        return PollingWatcher(root, poll_interval=0.1)
+
+@unittest.skipUnless(os.path.exists("/proc/sys/fs/inotify"), "inotify not available")
+class InotifyWatcherTests(WatcherTestsMixin, unittest.TestCase):
+
+    def make_watcher(self, root: str):
+        return InotifyWatcher(root)
+
+class IndexerdemWatchTests(SQLiteTest):
+
+    def file_row(self, filename: str):
+        return self.cursor.execute(
+            "SELECT id, is_missing FROM files WHERE filename=?", (filename,)
+        ).fetchone()
+
+    def check_watch(self, use_inotify: bool):
+        stop = threading.Event()
+        with tempfile.TemporaryDirectory() as library:
+            open(os.path.join(library, "Nobody.mkv"), "w").close()
+
+            def run():
+                Indexerdem(self.db_path, self.indexerdem.locales).watch(
+                    library, window=0.1, poll_interval=0.1, use_inotify=use_inotify, stop=stop
+                )
+
+            watch_thread = threading.Thread(target=run)
+            watch_thread.start()
+            try:
+                assert wait_for(lambda: self.file_row("Nobody.mkv") is not None)
+
+                open(os.path.join(library, "Emily Browning - Sucker Punch.mp4"), "w").close()
+                assert wait_for(lambda: self.file_row("Emily Browning - Sucker Punch.mp4") is not None)
+
+                original = self.file_row("Nobody.mkv")
+                os.rename(os.path.join(library, "Nobody.mkv"), os.path.join(library, "Somebody.mkv"))
+                assert wait_for(lambda: self.file_row("Somebody.mkv") is not None)
+                assert self.file_row("Somebody.mkv")[0] == original[0]
+
+                os.remove(os.path.join(library, "Emily Browning - Sucker Punch.mp4"))
+                assert wait_for(lambda: self.file_row("Emily Browning - Sucker Punch.mp4")[1] == 1)
+
+                clips = os.path.join(library, "clips")
+                os.makedirs(clips)
+                open(os.path.join(clips, "Clip.mp4"), "w").close()
+                assert wait_for(lambda: self.file_row("Clip.mp4") is not None)
+                shutil.rmtree(clips)
+                assert wait_for(lambda: self.file_row("Clip.mp4")[1] == 1)
+            finally:
+                stop.set()
+                watch_thread.join()
+
+    def test_watch_polling(self):
+        self.check_watch(False)
+
+    @unittest.skipUnless(os.path.exists("/proc/sys/fs/inotify"), "inotify not available")
+    def test_watch_inotify(self):
+        self.check_watch(True)
@@ -9,14 +9,15 @@ from textual.widgets import (
     TabbedContent, TabPane
 )
 from textual.widgets.option_list import Option
-from typing import Any, cast, Iterable, Optional
+from typing import Any, cast, Iterable, Optional, Union
 
 import os
 import traceback
 
+from .cache import DEFAULT_CAPACITY
 from .custom import Dynamic, GoodInput
-from .data import FileIndexRecord, PerformanceIndexRecord, PersonIndexRecord
-from .indexerdem import Indexerdem, MetadataCheckResult
+from .data import FileIndexRecord, FileListing, PerformanceIndexRecord, PersonIndexRecord, PersonListing
+from .reader import IndexReader, MetadataCheckResult
 from .errors import InvalidDataClassState
 
 # Source - https://stackoverflow.com/a/76333127
@@ -50,10 +51,10 @@ class ErdemHomeScreen(ErdemScreen):
 
     def __init__(self):
         super().__init__()
-        self.TITLES = self.app.index.fetch_files()
+        self.TITLES = self.app.index.fetch_file_listings()
         self.title_count = Dynamic()
         self.__reset_title_list()
-        self.PERFORMERS = self.app.index.fetch_persons(False)
+        self.PERFORMERS = self.app.index.fetch_person_listings(False)
         self.performer_count = Dynamic()
         self.__reset_performer_list()
         self.list_tabs = TabbedContent(initial="media-tab", id="list-tabs")
@@ -83,7 +84,7 @@ class ErdemHomeScreen(ErdemScreen):
         self.shown_performers.styles.height = "30"
         self.performer_count.text = self.__make_count_label("performer", len(self.PERFORMERS))
 
-    def __make_options_titles(self, titles: Iterable[FileIndexRecord]) -> tuple[Option, ...]:
+    def __make_options_titles(self, titles: Iterable[Union[FileIndexRecord, FileListing]]) -> tuple[Option, ...]:
         title_options = []
         for title in titles:
             if title.id is None:
@@ -106,7 +107,7 @@ class ErdemHomeScreen(ErdemScreen):
         else:
             return f"Showing {count} {list_noun}s."
 
-    def __make_options_performers(self, performers: Iterable[PersonIndexRecord]) -> tuple[Option, ...]:
+    def __make_options_performers(self, performers: Iterable[Union[PersonIndexRecord, PersonListing]]) -> tuple[Option, ...]:
         performer_options = []
         for p in performers:
             if p.id is None:
@@ -192,14 +193,13 @@ class MediaView(ErdemScreen):
 
     def __init__(self, id: int):
         super().__init__()
-        self.record = FileIndexRecord.fetch(self.erdem_app.index.conn.cursor(), id)
+        with self.erdem_app.index.reading() as cursor:
+            self.record = FileIndexRecord.fetch(cursor, id)
+            # Don't use is_error_state for mypy
+            if self.record is not None:
+                performers_result = PerformanceIndexRecord.fetch(cursor, self.record)
         self.is_error_state = self.record is None
-        # Don't use is_error_state for mypy
         if self.record is not None:
-            performers_result = PerformanceIndexRecord.fetch(
-                self.erdem_app.index.conn.cursor(),
-                self.record
-            )
             self.performers = cast(tuple[Optional[PersonIndexRecord], ...], performers_result.performers if performers_result is not None else tuple())
 
     def __update_object(self):
@@ -243,7 +243,7 @@ class MediaView(ErdemScreen):
             Button("Edit", id="edit-review", flat=True),
             classes="span3"
         )
-        yield Markdown(classes="span3")
+        yield Markdown((self.record.review if self.record is not None else None) or "", classes="span3")
         ##############
         yield Footer()
 
@@ -258,7 +258,7 @@ class MediaView(ErdemScreen):
         else:
             self.erdem_app.notify("No ID for given performer. Please check index", severity="warning")
 
-def performer_record_form(record: PersonIndexRecord, cursor) -> ComposeResult:
+def performer_record_form(record: PersonIndexRecord, performances: Iterable[FileIndexRecord]) -> ComposeResult:
     yield Label(f"{record}", id="record-title", classes="span3")
     ###############################################
     yield Label("First name:", classes="span1")
@@ -273,7 +273,7 @@ def performer_record_form(record: PersonIndexRecord, cursor) -> ComposeResult:
         classes="span1 list-action"
     )
     yield OptionList(
-        *tuple(Option(str(_file)) for _file in record.load_performances(cursor)),
+        *tuple(Option(str(_file)) for _file in performances),
         id="performances-list",
         classes="span3"
     )
@@ -283,26 +283,26 @@ class PerformerView(ErdemScreen):
 
     def __init__(self, performer_id: int, is_modal_view: bool = False):
         super().__init__()
-        self.performer = PersonIndexRecord.fetch(
-            self.erdem_app.index.conn.cursor(), performer_id
-        )
         self.is_modal_view = is_modal_view
         self.error_str: Optional[str] = None
-
-        if self.performer is not None:
-            try:
-                self.performances = self.performer.load_performances(self.erdem_app.cursor)
-            except OperationalError as e:
-                self.error_str = error_string(e)
-        else:
-            self.error_str = "Performer not found"
+        self.performances: tuple[FileIndexRecord, ...] = tuple()
+
+        with self.erdem_app.index.reading() as cursor:
+            self.performer = PersonIndexRecord.fetch(cursor, performer_id)
+            if self.performer is not None:
+                try:
+                    self.performances = self.performer.load_performances(cursor) or tuple()
+                except OperationalError as e:
+                    self.error_str = error_string(e)
+            else:
+                self.error_str = "Performer not found"
 
     def compose(self) -> ComposeResult:
         if not self.is_modal_view:
             yield Header()
 
         if self.error_str is None:
-            yield from performer_record_form(self.performer, self.erdem_app.cursor)
+            yield from performer_record_form(self.performer, self.performances)
         else:
             error = Static(f"Error: {self.error_str}")
             error.styles.background = "red"
@@ -330,7 +330,7 @@ class PerformerModal(ModalScreen):
         with CenterMiddle(id="modal-container"):
             yield from performer_record_form(
                 self.parent_screen.performer,
-                self.parent_screen.erdem_app.cursor
+                self.parent_screen.performances
             )
 
     def action_close(self):
@@ -350,7 +350,7 @@ class ErdemApp(App):
 
     def __init__(self):
         super().__init__()
-        self.index = Indexerdem("cache.db")
+        self.index = IndexReader("cache.db", cache_size=DEFAULT_CAPACITY)
         compatibility_check = self.index.check_compatibility()
         CHECK_TITLE = "Index Compatibility Check"
 
@@ -358,15 +358,13 @@ class ErdemApp(App):
             self.notify("Passed.", title=CHECK_TITLE)
         elif compatibility_check == MetadataCheckResult.LIKELY_COMPATIBLE:
             self.notify("Slight compatibility discrepancies detected. Reindex soon.", severity="warning", title=CHECK_TITLE)
+        elif compatibility_check == MetadataCheckResult.MIGRATABLE:
+            self.notify("Index is out of date. Upgrade it with `python -m indexer.migrations`.", severity="warning", title=CHECK_TITLE)
         elif compatibility_check == MetadataCheckResult.INDETERMINATE:
             self.notify("Unable to determine compatibility. Reindexing strongly suggested", severity="error", title=CHECK_TITLE)
         elif compatibility_check == MetadataCheckResult.INCOMPATIBLE:
             self.notify("Compatibility not guaranteed. Reindexing strongly suggested.", severity="error", title=CHECK_TITLE)
 
-    @property
-    def cursor(self):
-        return self.index.conn.cursor()
-
     def on_mount(self) -> None:
         self.app.push_screen("home")
 
@@ -0,0 +1,118 @@
+"""
+Directory walking for the indexer.
+
+`walk` is a streaming, `os.scandir`-based replacement for `os.walk`. Files are
+filtered by extension on their name alone, before anything is stat'ed, and
+whole subtrees can be pruned by the `PruneRules` in effect.
+"""
+from dataclasses import dataclass, field
+from typing import Collection, FrozenSet, Iterator, Optional, Set, Tuple
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+def get_ext(filename: str) -> str:
+    """
+    The extension of `filename`, without the dot. Empty if there is none.
+    """
+    _, dot, ext = filename.rpartition(".")
+    return ext if dot else ""
+
+@dataclass(frozen=True)
+class PruneRules:
+    """
+    What the walker leaves out.
+    """
+    # Skip files and directories whose names start with a dot.
+    skip_hidden: bool = False
+    # Skip trash directories, `.Trash` and the per-user `.Trash-<uid>`.
+    skip_trash: bool = True
+    # Any other directory names to skip.
+    skip_dirs: FrozenSet[str] = field(default_factory=frozenset)
+    # Skip files smaller or larger than these many bytes.
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    # Descend into symlinked directories. Loops are detected and skipped.
+    follow_symlinks: bool = False
+
+    def prunes_dir(self, name: str) -> bool:
+        return (
+            (self.skip_hidden and name.startswith(".")) or
+            (self.skip_trash and (name == ".Trash" or name.startswith(".Trash-"))) or
+            name in self.skip_dirs
+        )
+
+    def prunes_file(self, name: str, size: int) -> bool:
+        return (
+            (self.skip_hidden and name.startswith(".")) or
+            (self.min_size is not None and size < self.min_size) or
+            (self.max_size is not None and size > self.max_size)
+        )
+
+    def prunes_subtree(self, root: str, dirpath: str) -> bool:
+        """
+        Whether a walk of `root` would have left out the directory `dirpath`
+        somewhere under it.
+        """
+        relative = os.path.relpath(dirpath, root)
+        return relative != os.curdir and any(self.prunes_dir(part) for part in relative.split(os.sep))
+
+    def prunes_path(self, root: str, path: str, size: int) -> bool:
+        """
+        Whether a walk of `root` would have left out the file at `path`.
+        """
+        return self.prunes_subtree(root, os.path.dirname(path)) or self.prunes_file(os.path.basename(path), size)
+
+def walk(
+    root: str,
+    extensions: Collection[str],
+    rules: PruneRules = PruneRules()
+) -> Iterator[Tuple[str, str, os.stat_result]]:
+    """
+    Yield `(dirpath, filename, stat)` for every file under `root` with one of
+    `extensions`, top-down like `os.walk`. Only those files are stat'ed;
+    everything else is decided from the directory listing itself.
+
+    Unreadable directories and files are logged and skipped.
+    """
+    pending = [root]
+    # (st_dev, st_ino) of every directory entered, to catch symlink loops.
+    visited: Set[Tuple[int, int]] = set()
+    if rules.follow_symlinks:
+        try:
+            st = os.stat(root)
+            visited.add((st.st_dev, st.st_ino))
+        except OSError:
+            logger.exception("Unable to stat %s" % root)
+            return
+
+    while pending:
+        dirpath = pending.pop()
+        subdirs = []
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=rules.follow_symlinks):
+                            if rules.prunes_dir(entry.name):
+                                continue
+                            if rules.follow_symlinks:
+                                st = entry.stat()
+                                key = (st.st_dev, st.st_ino)
+                                if key in visited:
+                                    logger.warning("Skipping %s, which loops back to a directory already walked." % entry.path)
+                                    continue
+                                visited.add(key)
+                            subdirs.append(entry.path)
+                        elif get_ext(entry.name) in extensions and entry.is_file():
+                            st = entry.stat()
+                            if not rules.prunes_file(entry.name, st.st_size):
+                                yield dirpath, entry.name, st
+                    except OSError:
+                        logger.exception("Unable to stat %s" % entry.path)
+        except OSError:
+            logger.exception("Unable to list %s" % dirpath)
+        # Reversed so that subdirectories are walked in listing order.
+        pending.extend(reversed(subdirs))
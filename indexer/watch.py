@@ -0,0 +1,240 @@
+"""
+Filesystem watchers for keeping an index live.
+
+Two implementations are provided: `InotifyWatcher`, which talks to the Linux
+inotify API directly through ctypes, and `PollingWatcher`, which periodically
+rescans the tree and diffs it against the previous scan. `make_watcher` picks
+the former whenever it is available.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+class ChangeKind(Enum):
+    CREATED = 1
+    REMOVED = 2
+    # The watcher lost track of what happened; the whole tree has to be
+    # rescanned.
+    RESCAN = 3
+
+@dataclass(frozen=True)
+class Change:
+    kind: ChangeKind
+    path: str
+    is_dir: bool = False
+
+class Watcher(ABC):
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @abstractmethod
+    def read(self, timeout: Optional[float]) -> List[Change]:
+        """
+        Return the changes observed since the last call, waiting up to
+        `timeout` seconds (forever if `None`) for at least one to happen.
+        """
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def coalesce(self, window: float, timeout: Optional[float] = None) -> List[Change]:
+        """
+        Wait up to `timeout` seconds for a change and then keep collecting
+        changes for `window` seconds. Only the last change seen for any given
+        path is kept so that, say, a file created and then deleted within the
+        window is reported once.
+        """
+        changes = self.read(timeout)
+        if not changes:
+            return []
+
+        deadline = time.monotonic() + window
+        while (remaining := deadline - time.monotonic()) > 0:
+            changes.extend(self.read(remaining))
+
+        latest: Dict[str, Change] = {}
+        for change in changes:
+            latest.pop(change.path, None)
+            latest[change.path] = change
+        return list(latest.values())
+
+class PollingWatcher(Watcher):
+    """
+    Watcher that works everywhere by rescanning the tree every
+    `poll_interval` seconds.
+    """
+
+    def __init__(self, root: str, poll_interval: float = 30.0):
+        super().__init__(root)
+        self.poll_interval = poll_interval
+        self.state = self.__scan()
+        self.last_poll = time.monotonic()
+
+    def __scan(self) -> Dict[str, Tuple[int, int, int]]:
+        state: Dict[str, Tuple[int, int, int]] = {}
+        pending = [self.root]
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                pending.append(entry.path)
+                            elif entry.is_file():
+                                st = entry.stat()
+                                state[entry.path] = (st.st_size, st.st_mtime_ns, st.st_ino)
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return state
+
+    def read(self, timeout: Optional[float]) -> List[Change]:
+        wait = self.last_poll + self.poll_interval - time.monotonic()
+        if timeout is not None and wait > timeout:
+            time.sleep(max(timeout, 0))
+            return []
+        time.sleep(max(wait, 0))
+
+        current = self.__scan()
+        self.last_poll = time.monotonic()
+        changes = [
+            Change(ChangeKind.CREATED, path)
+            for path, stat in current.items()
+            if self.state.get(path) != stat
+        ]
+        changes.extend(
+            Change(ChangeKind.REMOVED, path)
+            for path in self.state
+            if path not in current
+        )
+        self.state = current
+        return changes
+
+class InotifyWatcher(Watcher):
+    """
+    Watcher backed by Linux's inotify. Every directory under the root gets its
+    own watch, including directories created after the watcher starts.
+
+    Raises `OSError` when inotify is not available.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    WATCH_MASK = (
+        IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+        IN_ONLYDIR
+    )
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, root: str):
+        super().__init__(root)
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError(errno.ENOSYS, "libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not supported on this platform")
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches: Dict[int, str] = {}
+        self.__add_tree(root)
+
+    def __add_watch(self, path: str) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), InotifyWatcher.WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            # The directory may be gone by the time we get to it.
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(err, f"inotify_add_watch failed for {path}")
+        self.watches[wd] = path
+
+    def __add_tree(self, path: str) -> List[Change]:
+        """
+        Watch `path` and every directory under it. Returns the files already
+        present, which a newly created or moved-in directory may contain.
+        """
+        found: List[Change] = []
+        for root, dirs, files in os.walk(path):
+            self.__add_watch(root)
+            found.extend(Change(ChangeKind.CREATED, os.path.join(root, f)) for f in files)
+        return found
+
+    def read(self, timeout: Optional[float]) -> List[Change]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        buf = os.read(self.fd, 64 * 1024)
+        changes: List[Change] = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, length = InotifyWatcher.EVENT_HEADER.unpack_from(buf, offset)
+            offset += InotifyWatcher.EVENT_HEADER.size
+            name = os.fsdecode(buf[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & InotifyWatcher.IN_Q_OVERFLOW:
+                changes.append(Change(ChangeKind.RESCAN, self.root, True))
+                continue
+            if mask & InotifyWatcher.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches:
+                continue
+
+            path = os.path.join(self.watches[wd], name)
+            is_dir = bool(mask & InotifyWatcher.IN_ISDIR)
+            if mask & (InotifyWatcher.IN_CREATE | InotifyWatcher.IN_MOVED_TO | InotifyWatcher.IN_CLOSE_WRITE):
+                if is_dir:
+                    changes.extend(self.__add_tree(path))
+                else:
+                    changes.append(Change(ChangeKind.CREATED, path))
+            elif mask & (InotifyWatcher.IN_DELETE | InotifyWatcher.IN_MOVED_FROM):
+                changes.append(Change(ChangeKind.REMOVED, path, is_dir))
+                if is_dir and mask & InotifyWatcher.IN_MOVED_FROM:
+                    # Moved-out directories keep their watches otherwise.
+                    prefix = f"{path}{os.path.sep}"
+                    for stale_wd, stale_path in list(self.watches.items()):
+                        if stale_path == path or stale_path.startswith(prefix):
+                            self.libc.inotify_rm_watch(self.fd, stale_wd)
+                            self.watches.pop(stale_wd, None)
+        return changes
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def make_watcher(root: str, poll_interval: float = 30.0, use_inotify: bool = True) -> Watcher:
+    """
+    Return an `InotifyWatcher` for `root` when possible, otherwise fall back to
+    a `PollingWatcher`.
+    """
+    if use_inotify:
+        try:
+            return InotifyWatcher(root)
+        except OSError:
+            pass
+    return PollingWatcher(root, poll_interval)